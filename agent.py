@@ -1,11 +1,22 @@
 import os
+import calendar
+import sqlite3
+import threading
+import time
 from datetime import datetime
-from langchain_ollama import ChatOllama
-from langgraph.prebuilt import create_react_agent
-from langchain.tools import tool
-from db import add_personal_expense, query_db, delete_expense, delete_expenses_by_ids
+from langchain_core.messages import trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.tools import tool
+from db import (
+    add_personal_expense, query_db, QueryError, delete_expense, delete_expenses_by_ids,
+    period_range, month_range, get_period_totals, get_category_totals,
+    get_daily_totals, get_monthly_totals, search_expenses as find_expenses,
+)
 from dotenv import load_dotenv
-from sync_splitwise import sync_expenses
+from cache import cached
+from money import to_dollars, sum_dollars
+from categorizer import categorizer, AUTO_CATEGORY_CONFIDENCE
+from recurring import refresh as refresh_recurring, get_recurring
 
 load_dotenv()
 
@@ -13,73 +24,131 @@ load_dotenv()
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b-instruct-q4_K_M")
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
-print(f"🦙 Using Ollama (Local): {OLLAMA_MODEL}")
-print(f"📍 Ollama server: {OLLAMA_BASE_URL}")
+# Conversations are checkpointed per session (thread_id) in their own SQLite file
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db")
+# Approximate token budget for the conversation history sent with each turn
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
 
-llm = ChatOllama(
-    model=OLLAMA_MODEL,
-    base_url=OLLAMA_BASE_URL,
-    temperature=0,
-)
+CATEGORIES = ["Groceries", "Food & Drink", "Transportation", "Shopping",
+              "Entertainment", "Bills & Utilities", "Healthcare", "General"]
 
 # Simple tools - just the essentials
 @tool
-def add_expense(description: str, amount: float, category: str):
+def add_expense(description: str, amount: float, category: str = None):
     """Add a new expense to the database.
     
-    IMPORTANT: You must ask the user to confirm the category before calling this tool.
-    Do not infer or assume the category - the user must explicitly state it.
+    Leave out the category unless the user named one: it is then picked from
+    similar past expenses and the reply says which it was. If no category is
+    a confident match nothing is added and you get the best guesses to offer
+    the user; call again with the one they choose.
     
     Args:
         description: What the expense was for
         amount: Amount in dollars (e.g., 25.50)
-        category: REQUIRED. Must be explicitly confirmed by user. One of: Groceries, Food & Drink, Transportation, Shopping, Entertainment, Bills & Utilities, Healthcare, General
-    
-    The category parameter should ONLY come from the user's explicit statement, not your inference.
-    If you haven't asked the user which category to use, DO NOT call this tool yet - ask them first.
+        category: Optional. One of: Groceries, Food & Drink, Transportation, Shopping, Entertainment, Bills & Utilities, Healthcare, General
     """
     try:
-        # Validate category
-        valid_categories = ["Groceries", "Food & Drink", "Transportation", "Shopping", 
-                          "Entertainment", "Bills & Utilities", "Healthcare", "General"]
-        if category not in valid_categories:
-            return f"❌ Invalid category '{category}'. Please use one of: {', '.join(valid_categories)}"
+        note = ""
+        if not category:
+            guesses = categorizer.suggest(description, among=CATEGORIES)
+            if not guesses or guesses[0][1] < AUTO_CATEGORY_CONFIDENCE:
+                options = ", ".join(f"{c} ({p:.0%})" for c, p in guesses) or ", ".join(CATEGORIES)
+                return f"❓ Not sure which category '{description}' belongs to. Ask the user to pick one of: {options}"
+            category, confidence = guesses[0]
+            note = f", auto-filed at {confidence:.0%} confidence"
+        if category not in CATEGORIES:
+            return f"❌ Invalid category '{category}'. Please use one of: {', '.join(CATEGORIES)}"
         
         amount = float(amount)
         add_personal_expense(description, amount, category)
-        return f"✅ Added: ${amount:.2f} for {description} (Category: {category})"
+        refresh_recurring()
+        return f"✅ Added: ${amount:.2f} for {description} (Category: {category}{note})"
     except Exception as e:
         return f"❌ Error: {str(e)}"
 
-@tool
+# Rows of a query result the model sees; the API gets every row through the artifact
+LLM_ROW_LIMIT = 10
+EXPENSE_COLUMNS = ("description", "amount", "category", "date")
+
+@tool(response_format="content_and_artifact")
 def run_query(sql: str):
     """Execute a SQL query on the expenses database.
     
-    Schema: expenses(id, sw_expense_id, description, amount, category, source, date)
+    Schema: expenses(id, sw_expense_id, description, amount, amount_cents, currency, original_amount, category, source, date)
     Date format: 'YYYY-MM-DD'
+    amount is in US dollars and amount_cents the same value in cents. For
+    totals sum the cents: SUM(amount_cents) / 100.0 is exact.
+    currency is what the expense was charged in and original_amount the
+    charged amount in that currency's minor units (cents, pence, paise...).
+    
+    Filter dates with plain ranges so the date index is used.
+    Example: SELECT SUM(amount_cents) / 100.0 FROM expenses WHERE date >= '2025-11-01' AND date < '2025-12-01'
+    Compare text case-insensitively: WHERE category = 'groceries' COLLATE NOCASE
     
-    Example: SELECT SUM(amount) FROM expenses WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
+    Read-only; WITH / WITH RECURSIVE (e.g. a series of dates) are allowed.
+    Queries are stopped after a few seconds and may return at most 1000
+    rows, so aggregate or add a LIMIT.
     """
     try:
         rows = query_db(sql)
         if not rows:
-            return "No results found."
+            return "No results found.", None
         
         # Single value result
         if len(rows) == 1 and len(rows[0]) == 1:
-            key = list(rows[0].keys())[0]
-            val = rows[0][key]
-            if isinstance(val, (int, float)):
-                return f"${float(val):.2f}"
-            return str(val)
+            val = next(iter(rows[0].values()))
+            text = f"${float(val):.2f}" if isinstance(val, (int, float)) else str(val)
+            return text, {"data_type": "text", "data": {"text": text}}
+        
+        # Multiple rows - the model gets a short text preview
+        lines = [" | ".join(f"{k}: {v}" for k, v in row.items()) for row in rows[:LLM_ROW_LIMIT]]
+        if len(rows) > LLM_ROW_LIMIT:
+            lines.append(f"... and {len(rows) - LLM_ROW_LIMIT} more rows ({len(rows)} total)")
         
-        # Multiple rows - format as text
-        result_list = []
-        for row in rows[:10]:  # Limit to 10 rows
-            result_list.append(" | ".join(f"{k}: {v}" for k, v in row.items()))
-        return "\n".join(result_list)
+        columns = list(rows[0])
+        by_name = {c.lower(): c for c in columns}
+        if "description" in by_name and "amount" in by_name:
+            # Expense rows render as a list
+            items = [{c: row.get(by_name.get(c), "") for c in EXPENSE_COLUMNS} for row in rows]
+            artifact = {"data_type": "list", "data": {"items": items}}
+        else:
+            artifact = {"data_type": "table", "data": {"headers": columns, "rows": rows}}
+        return "\n".join(lines), artifact
+    except QueryError as e:
+        return f"❌ Query error ({e.code}): {e}", None
     except Exception as e:
-        return f"❌ Query error: {str(e)}"
+        return f"❌ Query error: {str(e)}", None
+
+@tool(response_format="content_and_artifact")
+def search_expenses(text: str, limit: int = 20):
+    """Find expenses by words in their description, Splitwise group or category.
+    
+    Use this instead of run_query with LIKE when looking for a merchant, place,
+    trip or item, e.g. search_expenses("costco") or search_expenses("goa trip").
+    Every word must match (prefixes count: "cost" finds "Costco"). Results
+    come best match first and include the id, so you can follow up with
+    delete_expense_by_id.
+    
+    Args:
+        text: Words to look for
+        limit: Maximum number of results (default 20)
+    """
+    try:
+        rows, truncated = find_expenses(text, limit)
+        if not rows:
+            return f"No expenses match '{text}'.", None
+        lines = [
+            f"id: {r['id']} | {r['highlighted']} | ${r['amount']:.2f} | {r['category'] or 'Uncategorized'} | {r['date']}"
+            for r in rows[:LLM_ROW_LIMIT]
+        ]
+        if len(rows) > LLM_ROW_LIMIT:
+            lines.append(f"... and {len(rows) - LLM_ROW_LIMIT} more matches")
+        if truncated:
+            lines.append("(Too many matches to rank them all; only the most recent were searched. Add words to narrow it down.)")
+        items = [{c: r[c] for c in EXPENSE_COLUMNS} for r in rows]
+        return "\n".join(lines), {"data_type": "list", "data": {"items": items}}
+    except Exception as e:
+        return f"❌ Search error: {str(e)}", None
 
 @tool
 def delete_expense_by_id(expense_id: int):
@@ -94,6 +163,7 @@ def delete_expense_by_id(expense_id: int):
     try:
         success = delete_expense(expense_id)
         if success:
+            refresh_recurring()
             return f"✅ Deleted expense ID {expense_id}"
         else:
             return f"❌ No expense found with ID {expense_id}"
@@ -116,53 +186,35 @@ def delete_multiple_expenses(expense_ids: list):
         
         count = delete_expenses_by_ids(expense_ids)
         if count > 0:
+            refresh_recurring()
             return f"✅ Deleted {count} expense(s)"
         else:
             return "❌ No expenses were deleted"
     except Exception as e:
         return f"❌ Error deleting expenses: {str(e)}"
 
-@tool
-def get_spending_insights():
-    """Get comprehensive spending insights including comparisons to previous periods.
-    Shows this month vs last month, category trends, and spending patterns."""
-    try:
-        # This month
-        this_month = query_db("""
-            SELECT SUM(amount) as total 
-            FROM expenses 
-            WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-        """)
-        this_total = this_month[0]['total'] if this_month and this_month[0]['total'] else 0
-        
-        # Last month
-        last_month = query_db("""
-            SELECT SUM(amount) as total 
-            FROM expenses 
-            WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now', '-1 month')
-        """)
-        last_total = last_month[0]['total'] if last_month and last_month[0]['total'] else 0
-        
-        # Calculate change
-        if last_total > 0:
-            change = this_total - last_total
-            pct_change = (change / last_total) * 100
-            comparison = f"{'↑' if change > 0 else '↓'} ${abs(change):.2f} ({abs(pct_change):.1f}%)"
-        else:
-            comparison = "No previous data"
-        
-        # Top categories this month
-        top_cats = query_db("""
-            SELECT category, SUM(amount) as total, COUNT(*) as count
-            FROM expenses 
-            WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-            GROUP BY category
-            ORDER BY total DESC
-            LIMIT 5
-        """)
-        
-        # Build report
-        report = f"""📊 **Spending Insights**
+@cached
+def _spending_insights_report():
+    # This month
+    this_range = period_range("this_month")
+    this_total = get_period_totals(*this_range)['total'] or 0
+    
+    # Last month
+    last_total = get_period_totals(*period_range("last_month"))['total'] or 0
+    
+    # Calculate change
+    if last_total > 0:
+        change = this_total - last_total
+        pct_change = (change / last_total) * 100
+        comparison = f"{'↑' if change > 0 else '↓'} ${abs(change):.2f} ({abs(pct_change):.1f}%)"
+    else:
+        comparison = "No previous data"
+    
+    # Top categories this month
+    top_cats = get_category_totals(*this_range)[:5]
+    
+    # Build report
+    report = f"""📊 **Spending Insights**
 
 **This Month:** ${this_total:.2f}
 **Last Month:** ${last_total:.2f}
@@ -170,17 +222,79 @@ def get_spending_insights():
 
 **Top Categories This Month:**
 """
-        if top_cats:
-            for cat in top_cats:
-                report += f"\n• {cat['category']}: ${cat['total']:.2f} ({cat['count']} transactions)"
-        else:
-            report += "\nNo expenses yet this month"
-        
-        return report
+    top_items = [f"{cat['category']}: ${cat['total']:.2f} ({cat['count']} transactions)" for cat in top_cats]
+    if top_items:
+        for item in top_items:
+            report += f"\n• {item}"
+    else:
+        report += "\nNo expenses yet this month"
+    
+    sections = [
+        {
+            "title": "This Month vs Last Month",
+            "content": f"Change: {comparison}",
+            "items": [f"This Month: ${this_total:.2f}", f"Last Month: ${last_total:.2f}"],
+        },
+        {
+            "title": "Top Categories This Month",
+            "content": "" if top_items else "No expenses yet this month",
+            "items": top_items,
+        },
+    ]
+    return report, {"data_type": "insights", "data": {"sections": sections}}
+
+@tool(response_format="content_and_artifact")
+def get_spending_insights():
+    """Get comprehensive spending insights including comparisons to previous periods.
+    Shows this month vs last month, category trends, and spending patterns."""
+    try:
+        return _spending_insights_report()
     except Exception as e:
-        return f"❌ Error getting insights: {str(e)}"
+        return f"❌ Error getting insights: {str(e)}", None
 
-@tool
+@cached
+def _spending_trends_payload(period: str):
+    valid_periods = ['week', 'month', 'year']
+    if period not in valid_periods:
+        return "❌ Invalid period. Please use: 'week', 'month', or 'year'", None
+    
+    # Query based on period
+    if period == "week":
+        results = get_daily_totals(*period_range("week"))
+        period_label = "Last 7 Days"
+    elif period == "year":
+        results = get_monthly_totals(*period_range("year"))
+        period_label = "Last 12 Months"
+    else:  # month
+        results = get_monthly_totals(*period_range("two_months"))
+        for row in results:
+            year_str, month_str = row['date'].split('-')
+            row['month_name'] = f"{calendar.month_name[int(month_str)]} {year_str}"
+        period_label = "Last 2 Months"
+    
+    if not results:
+        return f"No spending data found for {period_label}", None
+    
+    trend_data = {
+        "period": period,
+        "period_label": period_label,
+        "data": []
+    }
+    
+    for row in results:
+        # Use month_name if available (for month period), otherwise use date
+        display_label = row.get('month_name') or row['date']
+        trend_data["data"].append({
+            "date": display_label,
+            "amount": float(row['amount']) if row['amount'] else 0
+        })
+    
+    total = sum_dollars(point["amount"] for point in trend_data["data"])
+    lines = [f"Spending trends for {period_label} (total ${total:.2f}):"]
+    lines += [f"{point['date']}: ${point['amount']:.2f}" for point in trend_data["data"]]
+    return "\n".join(lines), {"data_type": "trends", "data": trend_data}
+
+@tool(response_format="content_and_artifact")
 def get_spending_trends(period: str):
     """Get spending trends over time with visual graph data.
     
@@ -190,83 +304,87 @@ def get_spending_trends(period: str):
         period: Time period for trends. Must be one of: 'week' (last 7 days), 'month' (last 2 months), 'year' (last 12 months)
     """
     try:
-        valid_periods = ['week', 'month', 'year']
-        if period not in valid_periods:
-            return f"❌ Invalid period. Please use: 'week', 'month', or 'year'"
-        
-        # Query based on period
-        if period == "week":
-            sql = """
-            SELECT date(date) as date, SUM(amount) as amount
-            FROM expenses
-            WHERE date >= date('now', '-7 days')
-            GROUP BY date(date)
-            ORDER BY date ASC
-            """
-            period_label = "Last 7 Days"
-        elif period == "year":
-            sql = """
-            SELECT strftime('%Y-%m', date) as date, SUM(amount) as amount
-            FROM expenses
-            WHERE date >= date('now', '-12 months')
-            GROUP BY strftime('%Y-%m', date)
-            ORDER BY date ASC
-            """
-            period_label = "Last 12 Months"
-        else:  # month
-            sql = """
-            SELECT 
-                strftime('%Y-%m', date) as date,
-                CASE strftime('%m', date)
-                    WHEN '01' THEN 'January'
-                    WHEN '02' THEN 'February'
-                    WHEN '03' THEN 'March'
-                    WHEN '04' THEN 'April'
-                    WHEN '05' THEN 'May'
-                    WHEN '06' THEN 'June'
-                    WHEN '07' THEN 'July'
-                    WHEN '08' THEN 'August'
-                    WHEN '09' THEN 'September'
-                    WHEN '10' THEN 'October'
-                    WHEN '11' THEN 'November'
-                    WHEN '12' THEN 'December'
-                END || ' ' || strftime('%Y', date) as month_name,
-                SUM(amount) as amount
-            FROM expenses
-            WHERE strftime('%Y-%m', date) >= strftime('%Y-%m', 'now', '-1 month')
-            GROUP BY strftime('%Y-%m', date)
-            ORDER BY date ASC
-            """
-            period_label = "Last 2 Months"
-        
-        results = query_db(sql)
-        
-        if not results or results == "No results found.":
-            return f"No spending data found for {period_label}"
-        
-        # Format as JSON for frontend
-        import json
-        trend_data = {
-            "period": period,
-            "period_label": period_label,
-            "data": []
-        }
-        
-        for row in results:
-            # Use month_name if available (for month period), otherwise use date
-            display_label = row.get('month_name') or row['date']
-            trend_data["data"].append({
-                "date": display_label,
-                "amount": float(row['amount']) if row['amount'] else 0
-            })
-        
-        # Return as JSON string that frontend can parse
-        return f"TREND_DATA:{json.dumps(trend_data)}"
-        
+        return _spending_trends_payload(period)
     except Exception as e:
-        return f"❌ Error getting trends: {str(e)}"
-
-@tool
+        return f"❌ Error getting trends: {str(e)}", None
+
+@cached
+def _category_breakdown_payload(period: str, specific_month: str = None, year: int = None):
+    # Build date range based on period
+    if period == "week":
+        date_range = period_range("week")
+        period_label = "Last 7 Days"
+    elif period == "last_month":
+        date_range = period_range("last_month")
+        period_label = "Last Month"
+    elif period == "year":
+        date_range = period_range("year")
+        period_label = "Last 12 Months"
+    elif period == "all":
+        date_range = period_range("all")
+        period_label = "All Time"
+    elif period == "specific_month" and specific_month:
+        # Handle specific month requests
+        month_mapping = {
+            'january': '01', 'jan': '01',
+            'february': '02', 'feb': '02',
+            'march': '03', 'mar': '03',
+            'april': '04', 'apr': '04',
+            'may': '05',
+            'june': '06', 'jun': '06',
+            'july': '07', 'jul': '07',
+            'august': '08', 'aug': '08',
+            'september': '09', 'sep': '09', 'sept': '09',
+            'october': '10', 'oct': '10',
+            'november': '11', 'nov': '11',
+            'december': '12', 'dec': '12'
+        }
+    
+        # Convert month name to number
+        month_lower = str(specific_month).lower()
+        month_num = month_mapping.get(month_lower, str(specific_month))
+    
+        # Use current year if not specified
+        if not year:
+            year = datetime.now().year
+    
+        date_range = month_range(int(year), int(month_num))
+        period_label = f"{str(specific_month).capitalize()} {year}"
+    else:  # month (default)
+        date_range = period_range("this_month")
+        period_label = "This Month"
+    
+    results = get_category_totals(*date_range)
+    
+    if not results:
+        return f"No spending data found for {period_label}", None
+    
+    # Calculate total for percentages
+    grand_total_cents = sum(row['total_cents'] for row in results)
+    grand_total = to_dollars(grand_total_cents)
+    
+    category_data = {
+        "period_label": period_label,
+        "total": grand_total,
+        "categories": [
+            {
+                "name": row['category'] or 'Uncategorized',
+                "value": float(row['total']) if row['total'] else 0,
+                "count": row['count'],
+                "percentage": (row['total_cents'] / grand_total_cents * 100) if grand_total_cents > 0 else 0
+            }
+            for row in results
+        ]
+    }
+    
+    lines = [f"Spending by category for {period_label} (total ${grand_total:.2f}):"]
+    lines += [
+        f"• {c['name']}: ${c['value']:.2f} ({c['percentage']:.1f}%, {c['count']} transactions)"
+        for c in category_data["categories"]
+    ]
+    return "\n".join(lines), {"data_type": "categories", "data": category_data}
+
+@tool(response_format="content_and_artifact")
 def get_category_breakdown(period: str = "month", specific_month: str = None, year: int = None):
     """Get spending breakdown by category with pie chart visualization.
     
@@ -278,113 +396,121 @@ def get_category_breakdown(period: str = "month", specific_month: str = None, ye
         year: Optional year for specific_month (defaults to current year if not provided)
     """
     try:
-        # Build date filter based on period
-        if period == "week":
-            date_filter = "WHERE date >= date('now', '-7 days')"
-            period_label = "Last 7 Days"
-        elif period == "last_month":
-            date_filter = "WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now', '-1 month')"
-            period_label = "Last Month"
-        elif period == "year":
-            date_filter = "WHERE date >= date('now', '-12 months')"
-            period_label = "Last 12 Months"
-        elif period == "all":
-            date_filter = ""
-            period_label = "All Time"
-        elif period == "specific_month" and specific_month:
-            # Handle specific month requests
-            month_mapping = {
-                'january': '01', 'jan': '01',
-                'february': '02', 'feb': '02',
-                'march': '03', 'mar': '03',
-                'april': '04', 'apr': '04',
-                'may': '05',
-                'june': '06', 'jun': '06',
-                'july': '07', 'jul': '07',
-                'august': '08', 'aug': '08',
-                'september': '09', 'sep': '09', 'sept': '09',
-                'october': '10', 'oct': '10',
-                'november': '11', 'nov': '11',
-                'december': '12', 'dec': '12'
-            }
-            
-            # Convert month name to number
-            month_lower = specific_month.lower()
-            month_num = month_mapping.get(month_lower, specific_month)
-            
-            # Ensure month is 2 digits
-            if len(month_num) == 1:
-                month_num = f'0{month_num}'
-            
-            # Use current year if not specified
-            if not year:
-                year = datetime.now().year
-            
-            date_filter = f"WHERE strftime('%Y-%m', date) = '{year}-{month_num}'"
-            period_label = f"{specific_month.capitalize()} {year}"
-        else:  # month (default)
-            date_filter = "WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')"
-            period_label = "This Month"
-        
-        sql = f"""
-        SELECT 
-            category,
-            SUM(amount) as total,
-            COUNT(*) as count
-        FROM expenses
-        {date_filter}
-        GROUP BY category
-        ORDER BY total DESC
-        """
-        
-        results = query_db(sql)
-        
-        if not results or results == "No results found.":
-            return f"No spending data found for {period_label}"
-        
-        # Format as JSON for frontend
-        import json
-        
-        # Calculate total for percentages
-        grand_total = sum(float(row['total']) for row in results if row['total'])
-        
-        category_data = {
-            "period_label": period_label,
-            "total": grand_total,
-            "categories": [
-                {
-                    "name": row['category'] or 'Uncategorized',
-                    "value": float(row['total']) if row['total'] else 0,
-                    "count": row['count'],
-                    "percentage": (float(row['total']) / grand_total * 100) if grand_total > 0 else 0
-                }
-                for row in results
+        return _category_breakdown_payload(period, specific_month, year)
+    except Exception as e:
+        return f"❌ Error getting category breakdown: {str(e)}", None
+
+ANALYSES = ("anomalies", "rolling", "shares")
+
+@tool(response_format="content_and_artifact")
+def get_spending_analysis(analysis: str = "anomalies", period: str = "year", category: str = None):
+    """Statistics over daily spending that SQL sums can't give.
+    
+    Use this when users ask about unusual or spiking spending, their running
+    average, or which categories are taking a bigger or smaller share.
+    
+    Args:
+        analysis: 'anomalies' (days a category spent far above its previous 30 days),
+            'rolling' (30-day rolling average per day) or 'shares' (each category's
+            share of spending vs. the period before)
+        period: 'week', 'month', 'last_month', 'year', 'this_year', 'last_year' or 'all'
+        category: For 'rolling' only, limit to one category
+    """
+    try:
+        import analytics  # loads numpy, so only on first use
+        if analysis not in ANALYSES:
+            return f"❌ Invalid analysis. Please use one of: {', '.join(ANALYSES)}", None
+        if analysis == "anomalies":
+            items = analytics.anomalies(period)
+            if not items:
+                return f"No unusual spending days found ({period}).", None
+            lines = [
+                f"{a['date']} | {a['category']}: ${a['amount']:.2f} vs. ~${a['expected']:.2f} usual ({a['z']:.1f} std devs)"
+                for a in items[:LLM_ROW_LIMIT]
             ]
-        }
-        
-        # Return as JSON string that frontend can parse
-        return f"CATEGORY_DATA:{json.dumps(category_data)}"
-        
+        elif analysis == "shares":
+            items = analytics.category_shares(period)
+            if not items:
+                return f"No spending data found ({period}).", None
+            lines = [
+                f"{c['category']}: ${c['total']:.2f}, {c['share']:.1f}% of spending ({c['change']:+.1f} points vs. before)"
+                for c in items[:LLM_ROW_LIMIT]
+            ]
+        else:
+            points = analytics.rolling(period, category=category)
+            if not points:
+                return f"No spending data found ({period}).", None
+            peak = max(points, key=lambda p: p["rolling_mean"])
+            label = f"{category} spending" if category else "Spending"
+            text = (
+                f"{label}, 30-day rolling average per day: ${points[0]['rolling_mean']:.2f} on {points[0]['date']}, "
+                f"${points[-1]['rolling_mean']:.2f} on {points[-1]['date']}, "
+                f"peaking at ${peak['rolling_mean']:.2f} on {peak['date']}."
+            )
+            data = {"period": period, "period_label": f"30-day rolling average ({period})",
+                    "data": [{"date": p["date"], "amount": p["rolling_mean"]} for p in points]}
+            return text, {"data_type": "trends", "data": data}
+        headers = list(items[0])
+        return "\n".join(lines), {"data_type": "table", "data": {"headers": headers, "rows": items}}
+    except ValueError as e:
+        return f"❌ {e}", None
     except Exception as e:
-        return f"❌ Error getting category breakdown: {str(e)}"
+        return f"❌ Error analyzing spending: {str(e)}", None
+
+@tool(response_format="content_and_artifact")
+def get_recurring_charges(include_lapsed: bool = False):
+    """List recurring charges and subscriptions found in the expense history.
+    
+    Use this when users ask about subscriptions, recurring bills, or what they
+    pay every week/month/year, instead of guessing with GROUP BY queries.
+    
+    Args:
+        include_lapsed: Also list charges that seem to have stopped (default False)
+    """
+    try:
+        items = get_recurring(include_lapsed)
+        if not items:
+            return "No recurring charges found.", None
+        total = sum_dollars(item["monthly_cost"] for item in items if item["active"])
+        lines = [f"{len(items)} recurring charges, about ${total:.2f} a month in total:"]
+        lines += [
+            f"{item['name']}: ${item['amount']:.2f} {item['cadence']}"
+            f"{'' if item['amount_stable'] else ' (varies)'}, "
+            + (f"next around {item['next_date']}" if item["active"] else f"last charged {item['last_date']} (lapsed)")
+            for item in items[:LLM_ROW_LIMIT]
+        ]
+        if len(items) > LLM_ROW_LIMIT:
+            lines.append(f"... and {len(items) - LLM_ROW_LIMIT} more")
+        columns = ("name", "category", "cadence", "amount", "monthly_cost", "last_date", "next_date", "active")
+        rows = [{c: item[c] for c in columns} for item in items]
+        return "\n".join(lines), {"data_type": "table", "data": {"headers": list(columns), "rows": rows}}
+    except Exception as e:
+        return f"❌ Error finding recurring charges: {str(e)}", None
 
 @tool
 def sync_splitwise():
     """Sync expenses from Splitwise to import shared expenses and bills.
     Use this when users want to import or sync their Splitwise data."""
     try:
-        count = sync_expenses(limit=50)  # Sync last 50 expenses
-        return f"✅ Successfully synced {count} expenses from Splitwise!"
+        from sync_splitwise import sync_expenses
+        counts = sync_expenses()  # Only expenses changed since the last sync
+        message = f"✅ Successfully synced {counts['synced']} expenses from Splitwise!"
+        if counts["estimated"]:
+            message += f" {counts['estimated']} were converted at approximate FX rates."
+        if counts["skipped"]:
+            message += f" ⚠️ {counts['skipped']} were skipped because their currency has no FX rate."
+        return message
     except Exception as e:
         return f"❌ Error syncing Splitwise: {str(e)}"
 
-tools = [add_expense, run_query, delete_expense_by_id, delete_multiple_expenses, get_spending_insights, get_spending_trends, get_category_breakdown, sync_splitwise]
+tools = [add_expense, run_query, search_expenses, delete_expense_by_id, delete_multiple_expenses, get_spending_insights, get_spending_trends, get_category_breakdown, get_spending_analysis, get_recurring_charges, sync_splitwise]
 
 def get_system_prompt():
     """Generate system prompt with current date."""
     today = datetime.now()
     today_str = today.strftime('%Y-%m-%d')
-    month_str = today.strftime('%Y-%m')
+    month_start, next_month_start = period_range("this_month")
+    last_month_start, _ = period_range("last_month")
     date_display = today.strftime('%B %d, %Y')  # e.g., "November 13, 2025"
     
     return f"""You are an expense tracking assistant. You have access to a SQLite database of expenses.
@@ -392,20 +518,25 @@ def get_system_prompt():
 IMPORTANT: Today's date is {date_display} ({today_str}). When writing queries that reference dates:
 - Use 'now' or CURRENT_DATE in SQLite for today's date
 - For "recently added" or "today" queries, use: WHERE date >= '{today_str}'
-- For "this month" queries, use: WHERE strftime('%Y-%m', date) = '{month_str}'
-- For "last month" queries, use: WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now', '-1 month')
+- For "this month" queries, use: WHERE date >= '{month_start}' AND date < '{next_month_start}'
+- For "last month" queries, use: WHERE date >= '{last_month_start}' AND date < '{month_start}'
+- Always filter dates with plain range comparisons on the date column, never wrap it in strftime()
 - NEVER use dates from past years unless specifically asked
 - If a query returns no results, explain what date range you checked and suggest alternatives
+- Compare category or description text with COLLATE NOCASE, e.g. WHERE category = 'groceries' COLLATE NOCASE
 
 When users ask about their spending, use the appropriate tools to get the data and present it clearly.
 
 For month-to-month comparisons, use get_spending_insights.
 For specific queries, use run_query.
+To find expenses by merchant, place, trip or item name, use search_expenses instead of LIKE in run_query.
 To add expenses, use add_expense.
 To delete/remove expenses, use delete_expense_by_id (you'll need to query for the ID first).
 To delete multiple expenses at once, use delete_multiple_expenses with a list of IDs.
 To see spending trends over time with graphs, use get_spending_trends.
 To see category breakdown with pie chart, use get_category_breakdown.
+For unusual spending days, rolling averages or shifts in category shares, use get_spending_analysis.
+For subscriptions and recurring bills, use get_recurring_charges.
 To sync/import from Splitwise, use sync_splitwise.
 
 CRITICAL WORKFLOW FOR TRENDS:
@@ -441,32 +572,82 @@ User: "Last 2 months"
 You: [call get_spending_trends(period='month')]
 
 CRITICAL WORKFLOW FOR ADDING EXPENSES:
-Step 1: User requests to add an expense (e.g., "add $30 for paneer from Costco")
-Step 2: YOU MUST ASK which category to use - DO NOT call add_expense yet!
-Step 3: Wait for user to respond with category
-Step 4: ONLY THEN call add_expense with the user's confirmed category
-
-NEVER skip Step 2, even if the category seems obvious!
+When a user asks to add an expense (e.g., "add $30 for paneer from Costco"), call add_expense right away.
+Pass a category only if the user named one; otherwise leave it out and it is filed from similar past expenses.
+Tell the user which category was used so they can correct it.
+If add_expense replies that it isn't sure, ask the user to choose from the categories it lists, then call it again with their choice.
 
 Example conversation:
 User: "Add $30 for paneer from Costco"
-You: "I'll add $30 for paneer from Costco. Which category should I use? (Groceries, Food & Drink, Shopping, General, etc.)"
-[STOP HERE - wait for user response]
-
-User: "Groceries"
-You: [NOW call add_expense(description="paneer from Costco", amount=30, category="Groceries")]
+You: [call add_expense(description="paneer from Costco", amount=30)]
+You: "Added $30 for paneer from Costco under Groceries."
 
 FOR DELETING EXPENSES:
-When a user wants to delete expense(s), first query to find them, show what you found, then delete by ID(s).
+When a user wants to delete expense(s), first query or search to find them, show what you found, then delete by ID(s).
 
-DO NOT assume or infer categories. The user must explicitly confirm.
+Do not guess categories yourself: either pass the user's choice or leave it to add_expense.
 Available categories: Groceries, Food & Drink, Transportation, Shopping, Entertainment, Bills & Utilities, Healthcare, General
 
 Important: Present the information directly without mentioning which tools or functions you used. 
 Just give the user the insights and data they asked for in a natural, conversational way.
 NEVER show raw SQL queries or tool call details to the user."""
 
-SYSTEM_PROMPT = get_system_prompt()
-
-# Create simple agent
-agent = create_react_agent(llm, tools, prompt=SYSTEM_PROMPT)
+def trim_history(state):
+    """Send the model only the most recent turns that fit HISTORY_TOKEN_BUDGET.
+    
+    The full history stays in the checkpoint; trimming starts on a user message
+    so a tool result is never sent without the call that produced it.
+    """
+    messages = trim_messages(
+        state["messages"],
+        strategy="last",
+        token_counter=count_tokens_approximately,
+        max_tokens=HISTORY_TOKEN_BUDGET,
+        start_on="human",
+        end_on=("human", "tool"),
+    )
+    return {"llm_input_messages": messages or state["messages"][-1:]}
+
+# The model client and the compiled graph are built on first use, so importing
+# this module (CLI scripts, tools, workers) stays cheap
+_init_lock = threading.RLock()
+_llm = None
+_agent = None
+
+def get_llm():
+    """The Ollama chat model, created on first use"""
+    global _llm
+    if _llm is None:
+        with _init_lock:
+            if _llm is None:
+                from langchain_ollama import ChatOllama
+                print(f"🦙 Using Ollama (Local): {OLLAMA_MODEL}")
+                print(f"📍 Ollama server: {OLLAMA_BASE_URL}")
+                _llm = ChatOllama(
+                    model=OLLAMA_MODEL,
+                    base_url=OLLAMA_BASE_URL,
+                    temperature=0,
+                )
+    return _llm
+
+def get_agent():
+    """The ReAct agent with its SQLite checkpointer, compiled on first use"""
+    global _agent
+    if _agent is None:
+        with _init_lock:
+            if _agent is None:
+                from langgraph.checkpoint.sqlite import SqliteSaver
+                from langgraph.prebuilt import create_react_agent
+                checkpointer = SqliteSaver(sqlite3.connect(CHECKPOINT_DB_PATH, check_same_thread=False))
+                _agent = create_react_agent(
+                    get_llm(), tools, prompt=get_system_prompt(),
+                    checkpointer=checkpointer, pre_model_hook=trim_history
+                )
+    return _agent
+
+def warm_up():
+    """Build the agent and have Ollama load the model, so the first chat isn't a cold start"""
+    start = time.perf_counter()
+    get_agent()
+    get_llm().invoke("Reply with OK.")
+    print(f"🔥 Model warmed up in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,180 @@
+import threading
+from datetime import date
+
+import numpy as np
+
+import db
+from db import period_range
+
+# Spending analytics over a dense day x category matrix of cents, loaded from
+# the database in one grouped query and rebuilt only when db.data_version()
+# (or the date) changes. Every computation below is a handful of array
+# operations over that matrix, so ten years of history is a few thousand rows
+# and no Python loop runs per day or per expense.
+
+ROLLING_WINDOW_DAYS = 30
+ANOMALY_Z = 3.0
+ANOMALY_LIMIT = 20
+UNCATEGORIZED = "Uncategorized"
+
+# Grouped on the raw columns so the (date, category, amount_cents) index is
+# read in order with no temp b-tree; rows of the same day with different time
+# suffixes or NULL/'' categories are merged when the matrix is built
+MATRIX_SQL = """
+    SELECT substr(date, 1, 10) as day, category, SUM(amount_cents) as total_cents
+    FROM expenses
+    WHERE date IS NOT NULL
+    GROUP BY date, category
+"""
+
+class SpendMatrix:
+    """cents[d, c]: spend on day `days[d]` in category `categories[c]`.
+
+    Days run without gaps from the first expense to today (or the last
+    expense, if later), so positions along axis 0 are calendar days.
+    """
+
+    def __init__(self, days, categories, cents):
+        self.days = days                  # ISO date strings, oldest first
+        self.categories = categories      # sorted names
+        self.cents = cents                # int64, shape (len(days), len(categories))
+
+    @classmethod
+    def load(cls, conn, today: date):
+        rows = conn.execute(MATRIX_SQL).fetchall()
+        if not rows:
+            return cls(np.array([], dtype="U10"), [], np.zeros((0, 0), dtype=np.int64))
+        day, category, cents = zip(*rows)
+        day = np.array(day, dtype="datetime64[D]")
+        first = day.min()
+        last = max(day.max(), np.datetime64(today, "D"))
+        categories, column = np.unique([c or UNCATEGORIZED for c in category], return_inverse=True)
+        matrix = np.zeros(((last - first).astype(int) + 1, len(categories)), dtype=np.int64)
+        np.add.at(matrix, ((day - first).astype(int), column), np.array(cents, dtype=np.int64))
+        days = np.datetime_as_string(np.arange(first, last + 1))
+        return cls(days, categories.tolist(), matrix)
+
+    def span(self, start: str, end: str):
+        """Row slice for the half-open ISO date range [start, end)"""
+        return slice(int(np.searchsorted(self.days, start)), int(np.searchsorted(self.days, end)))
+
+    def column(self, category: str = None):
+        """Daily cents for one category, or all of them added up"""
+        if category is None:
+            return self.cents.sum(axis=1)
+        by_name = {c.lower(): i for i, c in enumerate(self.categories)}
+        if category.lower() not in by_name:
+            raise ValueError(f"Unknown category '{category}'. Use one of: {', '.join(self.categories)}")
+        return self.cents[:, by_name[category.lower()]]
+
+_lock = threading.Lock()
+_matrix = None
+_matrix_key = None
+
+def spend_matrix() -> SpendMatrix:
+    """The current SpendMatrix, reloaded after any write or when the day changes"""
+    global _matrix, _matrix_key
+    key = (db.data_version(), date.today())
+    if key != _matrix_key:
+        with _lock:
+            if key != _matrix_key:
+                _matrix = SpendMatrix.load(db.get_conn(), key[1])
+                _matrix_key = key
+    return _matrix
+
+def _check_positive(**options):
+    for name, value in options.items():
+        if value <= 0:
+            raise ValueError(f"{name} must be positive, got {value}")
+
+def _trailing(values, window: int, include_current: bool):
+    """Trailing-window mean and std along axis 0 from cumulative sums.
+
+    With include_current=False each window ends the day before, for comparing
+    a day against what came before it. Windows are shortened at the start of
+    the history; `count` says how many days each one covers.
+    """
+    values = values.astype(np.float64)
+    pad = np.zeros((1,) + values.shape[1:])
+    sums = np.concatenate([pad, np.cumsum(values, axis=0)])
+    squares = np.concatenate([pad, np.cumsum(values * values, axis=0)])
+    hi = np.arange(len(values)) + (1 if include_current else 0)
+    lo = np.maximum(hi - window, 0)
+    count = (hi - lo).reshape((-1,) + (1,) * (values.ndim - 1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sums[hi] - sums[lo]) / count
+        var = (squares[hi] - squares[lo]) / count - mean * mean
+    return np.nan_to_num(mean), np.sqrt(np.clip(np.nan_to_num(var), 0, None)), count
+
+def rolling(period: str = "year", window: int = ROLLING_WINDOW_DAYS, category: str = None):
+    """[{date, amount, rolling_mean, rolling_std}] per day of `period`, in dollars.
+
+    The window looks back from each day, including days before the period.
+    """
+    _check_positive(window=window)
+    m = spend_matrix()
+    rows = m.span(*period_range(period))
+    series = m.column(category)
+    mean, std, _ = _trailing(series[:rows.stop], window, include_current=True)
+    amount, mean, std = series[rows] / 100, mean[rows] / 100, std[rows] / 100
+    return [
+        {"date": d, "amount": float(a), "rolling_mean": round(float(mu), 2), "rolling_std": round(float(s), 2)}
+        for d, a, mu, s in zip(m.days[rows].tolist(), amount.tolist(), mean.tolist(), std.tolist())
+    ]
+
+def anomalies(period: str = "year", window: int = ROLLING_WINDOW_DAYS, z: float = ANOMALY_Z,
+              limit: int = ANOMALY_LIMIT):
+    """Days in `period` whose spend in a category (or in total) is `z` or more
+    standard deviations above that category's previous `window` days.
+
+    Only days with a full window of history count. Returns
+    [{date, category, amount, expected, z}] in dollars, biggest outliers first.
+    """
+    _check_positive(window=window, z=z, limit=limit)
+    m = spend_matrix()
+    if not m.categories:
+        return []
+    rows = m.span(*period_range(period))
+    values = np.column_stack([m.cents, m.cents.sum(axis=1)])[:rows.stop]
+    names = np.array(m.categories + ["All"], dtype=object)
+    mean, std, count = _trailing(values, window, include_current=False)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = np.where((std > 0) & (count == window), (values - mean) / std, 0.0)
+    scores[:rows.start] = 0
+    day, col = np.nonzero(scores >= z)
+    order = np.argsort(-scores[day, col], kind="stable")[:limit]
+    day, col = day[order], col[order]
+    return [
+        {"date": d, "category": c, "amount": a / 100, "expected": round(e / 100, 2), "z": round(s, 2)}
+        for d, c, a, e, s in zip(
+            m.days[day].tolist(), names[col].tolist(), values[day, col].tolist(),
+            mean[day, col].tolist(), scores[day, col].tolist(),
+        )
+    ]
+
+def category_shares(period: str = "year"):
+    """[{category, total, share, previous_share, change}] for `period`, largest first.
+
+    previous_share is the category's share of the equally long stretch just
+    before the period, and change the difference in percentage points.
+    """
+    m = spend_matrix()
+    rows = m.span(*period_range(period))
+    before = slice(max(0, 2 * rows.start - rows.stop), rows.start)
+    totals = m.cents[rows].sum(axis=0)
+    previous = m.cents[before].sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = np.nan_to_num(totals / totals.sum()) * 100
+        previous_share = np.nan_to_num(previous / previous.sum()) * 100
+    order = np.argsort(-totals, kind="stable")
+    return [
+        {
+            "category": m.categories[i],
+            "total": int(totals[i]) / 100,
+            "share": round(float(share[i]), 1),
+            "previous_share": round(float(previous_share[i]), 1),
+            "change": round(float(share[i] - previous_share[i]), 1),
+        }
+        for i in order.tolist()
+        if totals[i] or previous[i]
+    ]
@@ -1,18 +1,69 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import base64
+import functools
+import html
+import json
+import time
+import uuid
 import sys
 import os
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agent import agent
-from db import init_db, query_db
-from sync_splitwise import sync_expenses
+from agent import get_agent, warm_up, run_query, get_spending_insights, get_category_breakdown, get_spending_trends
+from db import (
+    DB_PATH, init_db, close_pool, period_range, get_period_totals, get_category_totals, get_currency_totals,
+    get_source_totals, get_daily_totals, get_monthly_totals, get_expense_page, EXPENSE_PAGE_SIZE,
+    search_expenses, SEARCH_LIMIT,
+)
+from cache import cached, result_cache
+from money import sum_dollars
+from fx import refresh_from_feed
+from categorizer import categorizer
+import recurring
+from importer import import_binary
+from sessions import sessions, new_session_id
+from router import match as match_intent, router_stats
+from sql_cache import sql_cache, is_self_contained
+
+# Warm the model up in the background at startup (set to 0 to skip)
+WARM_UP_MODEL = os.getenv("WARM_UP_MODEL", "1") == "1"
+
+@asynccontextmanager
+async def lifespan(app):
+    """Set up the schema once per server process, pick up FX rate feed changes,
+    train the categorizer, catch up on recurring charges and optionally warm
+    the model up"""
+    print(f"📁 Database file: {os.path.abspath(DB_PATH)}")
+    await run_blocking(db_pool, init_db)
+    loop = asyncio.get_running_loop()
+    fx_task = loop.run_in_executor(background_pool, refresh_from_feed)
+    fx_task.add_done_callback(functools.partial(_log_failure, "FX rate load"))
+    train_task = loop.run_in_executor(background_pool, categorizer.refresh)
+    train_task.add_done_callback(functools.partial(_log_failure, "Categorizer training"))
+    recurring_task = loop.run_in_executor(background_pool, recurring.refresh)
+    recurring_task.add_done_callback(functools.partial(_log_failure, "Recurring charge detection"))
+    if WARM_UP_MODEL:
+        warm_up_task = loop.run_in_executor(background_pool, warm_up)
+        warm_up_task.add_done_callback(functools.partial(_log_failure, "Model warm-up"))
+    yield
+    db_pool.shutdown(wait=False, cancel_futures=True)
+    background_pool.shutdown(wait=False, cancel_futures=True)
+    close_pool()
 
-app = FastAPI(title="Expense Tracker API")
+def _log_failure(label, future):
+    if not future.cancelled() and future.exception():
+        print(f"⚠️ {label} failed: {future.exception()}")
+
+app = FastAPI(title="Expense Tracker API", lifespan=lifespan)
 
 # CORS for React frontend
 app.add_middleware(
@@ -23,263 +74,386 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize database
-init_db()
-
-# Helper functions to parse tool results
-def parse_query_result(content: str):
-    """Parse SQL query results into structured data"""
-    if not content or "No results" in content or "Error" in content:
-        return None, None
-    
-    # Check if it's a multi-row result (contains |)
-    if " | " in content:
-        lines = content.strip().split("\n")
-        rows = []
-        headers = set()
-        
-        # Try to detect if it's an expense list
-        is_expense_list = False
-        for line in lines[:10]:  # Limit to 10 rows
-            parts = line.split(" | ")
-            row_dict = {}
-            for part in parts:
-                if ": " in part:
-                    key, val = part.split(": ", 1)
-                    row_dict[key] = val
-                    headers.add(key)
-                    if key.lower() in ["description", "amount", "category", "date"]:
-                        is_expense_list = True
-            if row_dict:
-                rows.append(row_dict)
-        
-        if rows:
-            if is_expense_list:
-                # Format as list for better visualization
-                items = []
-                for row in rows:
-                    items.append({
-                        "description": row.get("description", ""),
-                        "amount": row.get("amount", "0"),
-                        "category": row.get("category", ""),
-                        "date": row.get("date", "")
-                    })
-                return {"items": items}, "list"
-            else:
-                return {
-                    "headers": list(headers),
-                    "rows": rows
-                }, "table"
-    
-    # Single value or simple text
-    return {"text": content}, "text"
-
-def parse_insights_result(content: str):
-    """Parse spending insights into structured data"""
-    if not content or "Error" in content:
-        return None, None
-    
-    sections = []
-    current_section = None
-    
-    for line in content.split("\n"):
-        line = line.strip()
-        if not line:
-            continue
-            
-        if line.startswith("**") and line.endswith("**"):
-            # Section header
-            if current_section:
-                sections.append(current_section)
-            current_section = {"title": line.strip("*").strip(), "items": []}
-        elif line.startswith("•"):
-            # List item
-            if current_section:
-                current_section["items"].append(line[1:].strip())
-        elif current_section and not line.startswith("📊"):
-            # Regular content
-            if "items" not in current_section:
-                current_section["items"] = []
-            current_section["content"] = line
-    
-    if current_section:
-        sections.append(current_section)
-    
-    if sections:
-        return {"sections": sections}, "insights"
-    
-    return {"text": content}, "text"
-
-# Models
-init_db()
-
 # Models
 class ChatMessage(BaseModel):
     message: str
+    session_id: Optional[str] = None  # omit to start a new conversation
     
 class ChatResponse(BaseModel):
     response: str
+    session_id: Optional[str] = None
     data: Optional[dict] = None  # Structured data for visualization
     data_type: Optional[str] = None  # 'table', 'list', 'insights', 'text'
+    artifacts: List[dict] = []  # every tool result of the turn: {tool, data_type, data}
     
+class SessionRef(BaseModel):
+    session_id: str
+
 class ExpenseOverview(BaseModel):
     total: float
     count: int
     top_categories: List[dict]
+    by_currency: List[dict] = []
+    by_source: List[dict] = []
+
+# Blocking work (SQLite, agent.invoke, Splitwise sync, imports) runs in bounded
+# thread pools so the event loop stays free. Dashboard reads get their own pool
+# so a long /chat or sync can't starve them.
+DB_WORKERS = int(os.getenv("API_DB_WORKERS", "8"))
+BACKGROUND_WORKERS = int(os.getenv("API_BACKGROUND_WORKERS", "4"))
+db_pool = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="api-db")
+background_pool = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="api-bg")
+
+async def run_blocking(pool, fn, *args, **kwargs):
+    """Run a blocking call in `pool` and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+def _invoke_agent(session_id: str, text: str):
+    """Run one agent turn in a session; its history is loaded from the checkpointer"""
+    with sessions.turn(session_id):
+        start = time.perf_counter()
+        state = get_agent().invoke(
+            {"messages": [{"role": "user", "content": text}]},
+            config={"recursion_limit": 50, "configurable": {"thread_id": session_id}}
+        )
+        router_stats.agent_turn(time.perf_counter() - start)
+        _remember_query_sql(text, state["messages"])
+        return state
+
+# Streamed turns whose client went away, kept referenced until they finish
+pending_turns = set()
+
+def _stream_agent(session_id: str, text: str, emit):
+    """Run one agent turn, calling emit(event, data) for model tokens and tool calls.
+    
+    Returns the final state, like _invoke_agent.
+    """
+    config = {"recursion_limit": 50, "configurable": {"thread_id": session_id}}
+    with sessions.turn(session_id):
+        start = time.perf_counter()
+        for mode, chunk in get_agent().stream(
+            {"messages": [{"role": "user", "content": text}]},
+            config=config,
+            stream_mode=["messages", "updates"],
+        ):
+            if mode == "messages":
+                msg, metadata = chunk
+                if metadata.get("langgraph_node") == "agent" and isinstance(msg.content, str) and msg.content:
+                    emit("token", {"text": msg.content})
+                continue
+            for node, update in chunk.items():
+                for msg in (update or {}).get("messages", []):
+                    if node == "agent":
+                        for call in getattr(msg, "tool_calls", None) or []:
+                            emit("tool_start", {"id": call["id"], "name": call["name"], "args": call["args"]})
+                    elif node == "tools":
+                        emit("tool_end", {"id": msg.tool_call_id, "name": msg.name, "status": getattr(msg, "status", "success")})
+        router_stats.agent_turn(time.perf_counter() - start)
+        state = get_agent().get_state(config).values
+        _remember_query_sql(text, state["messages"])
+        return state
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-# In-memory conversation state (replace with Redis/DB for production)
-conversation_state = {"messages": []}
+def _clear_session(session_id: str):
+    get_agent().checkpointer.delete_thread(session_id)
+    sessions.discard(session_id)
 
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "Expense Tracker API"}
 
+def _artifact_data(tool_msg):
+    """Return (structured_data, data_type) from a tool message's artifact, or (None, None)"""
+    artifact = getattr(tool_msg, "artifact", None)
+    if not artifact:
+        return None, None
+    return artifact["data"], artifact["data_type"]
+
+def _direct_response(reply: str, session_id: str, tool_msg) -> ChatResponse:
+    """ChatResponse for a turn answered by calling one tool directly"""
+    data, data_type = _artifact_data(tool_msg)
+    artifacts = [{"tool": tool_msg.name, "data_type": data_type, "data": data}] if data_type else []
+    return ChatResponse(response=reply, session_id=session_id, data=data, data_type=data_type, artifacts=artifacts)
+
+def _call_tool(tool, args: dict):
+    """Invoke a tool without the agent; returns its ToolMessage, artifact included"""
+    return tool.invoke({"type": "tool_call", "id": f"direct-{uuid.uuid4().hex}", "name": tool.name, "args": args})
+
+def _current_turn(messages):
+    """Messages after the latest user message: this turn's tool calls, results and reply"""
+    start = len(messages)
+    while start > 0 and getattr(messages[start - 1], "type", None) != "human":
+        start -= 1
+    return messages[start:]
+
+def _turn_artifacts(turn):
+    """Artifacts from every tool call in the turn, in call order, paired by tool_call_id"""
+    results = {msg.tool_call_id: msg for msg in turn if getattr(msg, "type", None) == "tool"}
+    artifacts = []
+    for msg in turn:
+        for call in getattr(msg, "tool_calls", None) or []:
+            artifact = getattr(results.get(call["id"]), "artifact", None)
+            if artifact:
+                artifacts.append({"tool": call["name"], **artifact})
+    return artifacts
+
+def _build_chat_response(state, session_id: str) -> ChatResponse:
+    """Turn the agent's final state into a ChatResponse with the turn's structured tool data"""
+    turn = _current_turn(state["messages"])
+    last_msg = turn[-1] if turn else state["messages"][-1]
+    reply = last_msg.content if hasattr(last_msg, "content") else str(last_msg)
+    
+    # Ensure reply is a string
+    if not isinstance(reply, str):
+        reply = str(reply)
+    
+    artifacts = _turn_artifacts(turn)
+    
+    # data/data_type carry the last artifact for the results panel
+    last = artifacts[-1] if artifacts else {}
+    return ChatResponse(
+        response=reply,
+        session_id=session_id,
+        data=last.get("data"),
+        data_type=last.get("data_type"),
+        artifacts=artifacts,
+    )
+
+# Tools the fast-path router may call directly
+FAST_PATH_TOOLS = {t.name: t for t in (get_spending_insights, get_category_breakdown, get_spending_trends)}
+
+def _fast_path_reply(tool_name: str, content: str, data) -> str:
+    if data is None or tool_name == "get_spending_insights":
+        # Insights are already written for the user; so are "no data" and error messages
+        return content
+    if tool_name == "get_category_breakdown":
+        top = data["categories"][0]
+        return (
+            f"Here's your spending by category for {data['period_label']}: ${data['total']:.2f} in total. "
+            f"{top['name']} is the largest at ${top['value']:.2f} ({top['percentage']:.1f}%)."
+        )
+    total = sum_dollars(point["amount"] for point in data["data"])
+    return f"Here are your spending trends for {data['period_label']}: ${total:.2f} in total."
+
+def _record_exchange(session_id: str, text: str, reply: str):
+    """Add a turn answered without the agent to the session, so follow-ups have context"""
+    with sessions.turn(session_id):
+        get_agent().update_state(
+            {"configurable": {"thread_id": session_id}},
+            {"messages": [{"role": "user", "content": text}, {"role": "assistant", "content": reply}]},
+            as_node="agent",
+        )
+
+def _remember_query_sql(text: str, messages):
+    """Cache the SQL behind a turn the agent answered with one successful run_query call"""
+    if not is_self_contained(text):
+        return
+    turn = _current_turn(messages)
+    calls = [call for msg in turn for call in (getattr(msg, "tool_calls", None) or [])]
+    if len(calls) != 1 or calls[0]["name"] != "run_query":
+        return
+    results = [msg for msg in turn if getattr(msg, "type", None) == "tool"]
+    if results and not str(results[0].content).startswith("❌"):
+        sql_cache.put(text, calls[0]["args"]["sql"])
+
+def _cached_sql_answer(session_id: str, text: str):
+    """Re-run the SQL the model wrote for this question before; (reply, response) or None on a miss"""
+    sql = sql_cache.get(text)
+    if sql is None:
+        return None
+    result = _call_tool(run_query, {"sql": sql})
+    if result.content.startswith("❌"):
+        sql_cache.discard(text)
+        return None
+    reply = f"Here's what I found:\n\n{result.content}"
+    print(f"⚡ SQL cache hit: {sql}")
+    return reply, _direct_response(reply, session_id, result)
+
+def _fast_path(session_id: str, text: str):
+    """Answer a common or repeated question without the LLM.
+
+    Returns (reply, response), or None if it needs the agent. The exchange is
+    not recorded here (see _answer_fast).
+    """
+    routed = match_intent(text)
+    if routed is None:
+        router_stats.miss()
+        return _cached_sql_answer(session_id, text)
+    
+    start = time.perf_counter()
+    tool_name, args = routed
+    result = _call_tool(FAST_PATH_TOOLS[tool_name], args)
+    structured_data, _ = _artifact_data(result)
+    reply = _fast_path_reply(tool_name, result.content, structured_data)
+    
+    router_stats.hit(tool_name, time.perf_counter() - start)
+    print(f"⚡ Fast path: {tool_name}({args})")
+    return reply, _direct_response(reply, session_id, result)
+
+async def _answer_fast(session_id: str, text: str):
+    """Fast-path response, or None if it needs the agent.
+
+    The answer is read on db_pool. Recording the exchange waits for the
+    session's running agent turn, so it happens on background_pool, where it
+    can't hold up dashboard reads.
+    """
+    fast = await run_blocking(db_pool, _fast_path, session_id, text)
+    if fast is None:
+        return None
+    reply, response = fast
+    await run_blocking(background_pool, _record_exchange, session_id, text, reply)
+    return response
+
+def _chat_error_response(e: Exception, session_id: str) -> ChatResponse:
+    error_msg = str(e)
+    
+    # Check for rate limit
+    if "rate_limit" in error_msg.lower() or "429" in error_msg:
+        return ChatResponse(
+            response="⚠️ Groq rate limit reached (100k tokens/day). Try again tomorrow or upgrade your API key. For now, you can still view your expenses in the Recent Expenses section below!",
+            session_id=session_id
+        )
+    
+    import traceback
+    error_details = traceback.format_exc()
+    print(f"❌ Chat error: {error_details}")
+    return ChatResponse(response=f"❌ Error: {error_msg}", session_id=session_id)
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(message: ChatMessage):
     """Chat with the expense agent"""
-    global conversation_state
-    
+    session_id = message.session_id or new_session_id()
     try:
-        # Invoke agent with message
-        conversation_state = agent.invoke(
-            conversation_state | {"messages": [{"role": "user", "content": message.message}]},
-            config={"recursion_limit": 50}
-        )
-        
-        # Get last message
-        last_msg = conversation_state["messages"][-1]
-        reply = last_msg.content if hasattr(last_msg, "content") else str(last_msg)
-        
-        # Ensure reply is a string
-        if not isinstance(reply, str):
-            reply = str(reply)
-        
-        # Extract structured data from tool calls
-        structured_data = None
-        data_type = None
+        # Common questions are answered directly, without an LLM round trip
+        fast = await _answer_fast(session_id, message.message)
+        if fast:
+            return fast
         
-        # Check if any tools were called and extract their results
-        for msg in conversation_state["messages"][-5:]:  # Check last 5 messages
-            if hasattr(msg, "tool_calls") and msg.tool_calls:
-                for tool_call in msg.tool_calls:
-                    tool_name = tool_call.get("name") if isinstance(tool_call, dict) else getattr(tool_call, "name", None)
-                    
-                    # Find the tool result message
-                    tool_result_idx = conversation_state["messages"].index(msg) + 1
-                    if tool_result_idx < len(conversation_state["messages"]):
-                        tool_result_msg = conversation_state["messages"][tool_result_idx]
-                        
-                        if hasattr(tool_result_msg, "content"):
-                            result_content = tool_result_msg.content
-                            
-                            # Log the raw tool result
-                            print(f"🔍 Tool: {tool_name}")
-                            print(f"🔍 Raw result: {result_content[:500]}...")  # First 500 chars
-                            
-                            # Parse result based on tool type
-                            if tool_name == "run_query":
-                                structured_data, data_type = parse_query_result(result_content)
-                                print(f"🔍 Parsed data type: {data_type}")
-                                if structured_data:
-                                    print(f"🔍 Parsed data keys: {structured_data.keys()}")
-                            elif tool_name == "get_spending_insights":
-                                structured_data, data_type = parse_insights_result(result_content)
-                            elif tool_name == "get_spending_trends":
-                                # Check if result contains trend data
-                                if result_content.startswith("TREND_DATA:"):
-                                    import json
-                                    trend_json = result_content.replace("TREND_DATA:", "")
-                                    structured_data = json.loads(trend_json)
-                                    data_type = "trends"
-                                    print(f"🔍 Parsed trends data: {len(structured_data.get('data', []))} points")
-                            elif tool_name == "get_category_breakdown":
-                                # Check if result contains category data
-                                if result_content.startswith("CATEGORY_DATA:"):
-                                    import json
-                                    category_json = result_content.replace("CATEGORY_DATA:", "")
-                                    structured_data = json.loads(category_json)
-                                    data_type = "categories"
-                                    print(f"🔍 Parsed category data: {len(structured_data.get('categories', []))} categories")
-        
-        # Log final response
-        print(f"🔍 Final reply length: {len(reply)}")
-        print(f"🔍 Reply preview: {reply[:200]}...")
-        print(f"🔍 Structured data type: {data_type}")
+        # Invoke agent with message
+        state = await run_blocking(background_pool, _invoke_agent, session_id, message.message)
         
-        return ChatResponse(response=reply, data=structured_data, data_type=data_type)
+        return _build_chat_response(state, session_id)
     except Exception as e:
-        error_msg = str(e)
-        
-        # Check for rate limit
-        if "rate_limit" in error_msg.lower() or "429" in error_msg:
-            return ChatResponse(
-                response="⚠️ Groq rate limit reached (100k tokens/day). Try again tomorrow or upgrade your API key. For now, you can still view your expenses in the Recent Expenses section below!"
-            )
-        
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"❌ Chat error: {error_details}")
-        return ChatResponse(response=f"❌ Error: {error_msg}")
+        return _chat_error_response(e, session_id)
 
-@app.post("/clear-conversation")
-async def clear_conversation():
-    """Clear conversation state"""
-    global conversation_state
+@app.post("/chat/stream")
+async def chat_stream(message: ChatMessage):
+    """Chat with the expense agent, streamed as Server-Sent Events.
     
-    conversation_state = {"messages": []}
+    Events: session {session_id}, token {text}, tool_start {id, name, args},
+    tool_end {id, name, status}, then done (a ChatResponse) or error {message}.
+    """
+    session_id = message.session_id or new_session_id()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    
+    def emit(event, data):
+        # Called from the worker thread running the agent
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+    
+    async def run_turn():
+        try:
+            fast = await _answer_fast(session_id, message.message)
+            if fast:
+                await queue.put(("done", fast.model_dump()))
+                return
+            state = await run_blocking(background_pool, _stream_agent, session_id, message.message, emit)
+            await queue.put(("done", _build_chat_response(state, session_id).model_dump()))
+        except Exception as e:
+            await queue.put(("error", {"message": _chat_error_response(e, session_id).response}))
+        finally:
+            await queue.put((None, None))
+    
+    async def events():
+        turn = asyncio.create_task(run_turn())
+        try:
+            yield _sse("session", {"session_id": session_id})
+            while True:
+                event, data = await queue.get()
+                if event is None:
+                    break
+                yield _sse(event, data)
+        finally:
+            # A client that disconnects early doesn't cancel the turn; it still gets checkpointed
+            if not turn.done():
+                pending_turns.add(turn)
+                turn.add_done_callback(pending_turns.discard)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/clear-conversation")
+async def clear_conversation(session: SessionRef):
+    """Clear a session's conversation history"""
+    await run_blocking(background_pool, _clear_session, session.session_id)
     
     return {"status": "ok", "message": "Conversation cleared"}
 
+@cached
+def _overview():
+    this_month = period_range("this_month")
+    
+    # Total and count this month
+    totals = get_period_totals(*this_month)
+    total = totals['total'] or 0
+    count = totals['count']
+    
+    # Top categories this month
+    categories = get_category_totals(*this_month)[:5]
+    
+    top_categories = [
+        {
+            "category": row['category'],
+            "total": float(row['total']),
+            "count": row['count']
+        }
+        for row in (categories or [])
+    ]
+    
+    # What was charged in each currency, with its dollar value
+    by_currency = [
+        {
+            "currency": row['currency'],
+            "total": row['total'],
+            "original_total": row['original_total'],
+            "count": row['count']
+        }
+        for row in get_currency_totals(*this_month)
+    ]
+    
+    # Personal vs. Splitwise spending
+    by_source = [
+        {"source": row['source'], "total": row['total'], "count": row['count']}
+        for row in get_source_totals(*this_month)
+    ]
+    
+    return ExpenseOverview(
+        total=float(total),
+        count=count,
+        top_categories=top_categories,
+        by_currency=by_currency,
+        by_source=by_source
+    )
+
 @app.get("/overview", response_model=ExpenseOverview)
 async def get_overview():
     """Get expense overview for current month"""
     try:
-        print("🔍 /overview endpoint called")
-        
-        # Total this month
-        total_result = query_db(
-            "SELECT SUM(amount) as total FROM expenses WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')"
-        )
-        print(f"🔍 Total query result: {total_result}")
-        total = total_result[0]['total'] if total_result and total_result[0]['total'] else 0
-        print(f"🔍 Total: ${total}")
-        
-        # Count this month
-        count_result = query_db(
-            "SELECT COUNT(*) as count FROM expenses WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')"
-        )
-        print(f"🔍 Count query result: {count_result}")
-        count = count_result[0]['count'] if count_result else 0
-        print(f"🔍 Count: {count}")
-        
-        # Top categories this month
-        categories = query_db("""
-            SELECT category, SUM(amount) as total, COUNT(*) as count 
-            FROM expenses 
-            WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-            GROUP BY category 
-            ORDER BY total DESC 
-            LIMIT 5
-        """)
-        print(f"🔍 Categories: {categories}")
-        
-        top_categories = [
-            {
-                "category": row['category'],
-                "total": float(row['total']),
-                "count": row['count']
-            }
-            for row in (categories or [])
-        ]
-        
-        return ExpenseOverview(
-            total=float(total),
-            count=count,
-            top_categories=top_categories
-        )
+        return await run_blocking(db_pool, _overview)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sync_splitwise():
+    # Imported on first use: it needs MY_USER_ID and the HTTP client
+    from sync_splitwise import sync_expenses
+    return sync_expenses()
+
 @app.post("/sync-splitwise")
 async def sync_splitwise():
     """Sync expenses from Splitwise"""
@@ -287,26 +461,143 @@ async def sync_splitwise():
         if not os.getenv("SPLITWISE_ACCESS_TOKEN"):
             raise HTTPException(status_code=400, detail="Splitwise not configured")
         
-        sync_expenses(limit=10)
-        return {"status": "success", "message": "Synced successfully"}
+        counts = await run_blocking(background_pool, _sync_splitwise)
+        message = f"Synced {counts['synced']} expenses"
+        if counts["skipped"]:
+            message += f"; skipped {counts['skipped']} with no FX rate for their currency"
+        return {"status": "success", "message": message, **counts}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def _decode_cursor(cursor: str):
+    """Turn an opaque /expenses cursor back into a (date, id) position"""
+    try:
+        expense_date, expense_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(expense_date), int(expense_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@cached
+def _expense_page(after, limit, category, source, min_amount, max_amount, start, end):
+    rows, next_position = get_expense_page(
+        after, limit, category=category, source=source,
+        min_amount=min_amount, max_amount=max_amount, start=start, end=end,
+    )
+    return {"items": rows, "next_cursor": _encode_cursor(next_position) if next_position else None}
+
+# Highlight markers that can't occur in a description, swapped for <mark> tags after escaping
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+
+@cached
+def _search(q: str, limit: int):
+    items, truncated = search_expenses(q, limit, mark=(_MARK_OPEN, _MARK_CLOSE))
+    for item in items:
+        item["highlighted"] = (
+            html.escape(item["highlighted"] or "").replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+        )
+    return {"query": q, "items": items, "truncated": truncated}
+
+@app.get("/search")
+async def search(q: str, limit: int = SEARCH_LIMIT):
+    """Full-text search over descriptions, Splitwise groups and categories, best match first.
+    
+    Every word must match (as a prefix). `highlighted` is the HTML-escaped
+    description with matches wrapped in <mark>. `truncated` means the words
+    matched too many expenses to rank them all, and only the most recently
+    added ones were ranked; more words narrow it down.
+    """
+    try:
+        return await run_blocking(db_pool, _search, q, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/categorize")
+async def categorize(description: str, limit: int = 3):
+    """Suggested categories for a description, best first, learned from past expenses"""
+    try:
+        guesses = await run_blocking(db_pool, categorizer.suggest, description, limit=limit)
+        return {
+            "description": description,
+            "suggestions": [{"category": c, "confidence": p} for c, p in guesses],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/import")
+async def import_statement(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    debits: str = "negative",
+    date_format: Optional[str] = None,
+):
+    """Import a bank/credit-card statement (CSV or OFX/QFX).
+    
+    format: 'csv' or 'ofx' (default: from the file name)
+    debits: 'negative' if money-out amounts are negative in the CSV, else 'positive'
+    """
+    try:
+        result = await run_blocking(
+            background_pool, import_binary, file.file, file.filename, format,
+            debits=debits, date_format=date_format,
+        )
+        return {"status": "success", **result}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/expenses")
-async def get_expenses(limit: int = 50):
-    """Get recent expenses"""
+async def get_expenses(
+    limit: int = EXPENSE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    source: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+):
+    """Expenses newest first, one page at a time.
+    
+    Pass the returned next_cursor back as `cursor` for the following page
+    (null on the last one). Dates filter on start <= date < end.
+    """
+    after = _decode_cursor(cursor) if cursor else None
     try:
-        expenses = query_db(f"""
-            SELECT id, description, amount, category, date, source
-            FROM expenses 
-            ORDER BY date DESC 
-            LIMIT {limit}
-        """)
-        
-        return [dict(row) for row in (expenses or [])]
+        return await run_blocking(
+            db_pool, _expense_page, after, limit, category, source, min_amount, max_amount, start, end
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@cached
+def _trends(period: str):
+    if period == "week":
+        # Last 7 days, daily breakdown
+        results = get_daily_totals(*period_range("week"))
+    elif period == "year":
+        # Last 12 months, monthly breakdown
+        results = get_monthly_totals(*period_range("year"))
+    else:  # month
+        # This month + last month, daily breakdown
+        results = get_daily_totals(*period_range("two_months"))
+    
+    # Format data for charting
+    data = []
+    for row in (results or []):
+        data.append({
+            "date": row['date'],
+            "amount": float(row['amount']) if row['amount'] else 0
+        })
+    
+    return {
+        "period": period,
+        "data": data
+    }
+
 @app.get("/trends")
 async def get_trends(period: str = "month"):
     """Get spending trends over time.
@@ -314,51 +605,83 @@ async def get_trends(period: str = "month"):
     period: 'week', 'month', or 'year'
     """
     try:
-        if period == "week":
-            # Last 7 days, daily breakdown
-            sql = """
-            SELECT date(date) as date, SUM(amount) as amount
-            FROM expenses
-            WHERE date >= date('now', '-7 days')
-            GROUP BY date(date)
-            ORDER BY date ASC
-            """
-        elif period == "year":
-            # Last 12 months, monthly breakdown
-            sql = """
-            SELECT strftime('%Y-%m', date) as date, SUM(amount) as amount
-            FROM expenses
-            WHERE date >= date('now', '-12 months')
-            GROUP BY strftime('%Y-%m', date)
-            ORDER BY date ASC
-            """
-        else:  # month
-            # This month + last month, daily breakdown
-            sql = """
-            SELECT date(date) as date, SUM(amount) as amount
-            FROM expenses
-            WHERE date >= date('now', 'start of month', '-1 month')
-            GROUP BY date(date)
-            ORDER BY date ASC
-            """
-        
-        results = query_db(sql)
-        
-        # Format data for charting
-        data = []
-        for row in (results or []):
-            data.append({
-                "date": row['date'],
-                "amount": float(row['amount']) if row['amount'] else 0
-            })
-        
-        return {
-            "period": period,
-            "data": data
-        }
+        return await run_blocking(db_pool, _trends, period)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _recurring(include_lapsed: bool):
+    # Only reads: the write paths (agent tools, sync, import) keep the table current
+    items = recurring.get_recurring(include_lapsed)
+    return {"items": items, "monthly_total": sum_dollars(item["monthly_cost"] for item in items if item["active"])}
+
+@app.get("/recurring")
+async def get_recurring(include_lapsed: bool = False):
+    """Recurring charges and subscriptions, largest monthly cost first.
+    
+    include_lapsed: also list ones whose next charge is overdue
+    """
+    try:
+        return await run_blocking(db_pool, _recurring, include_lapsed)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _analytics(name: str, **options):
+    # Imported on first use: it loads numpy
+    import analytics
+    return getattr(analytics, name)(**{k: v for k, v in options.items() if v is not None})
+
+@app.get("/analytics/rolling")
+async def get_rolling(period: str = "year", window: Optional[int] = None, category: Optional[str] = None):
+    """Daily spend with its trailing `window`-day (default 30) mean and standard deviation.
+    
+    period: any db.period_range name ('week', 'month', 'year', 'all', ...)
+    category: limit to one category (default: all spending)
+    window must be at least 1 (400 otherwise)
+    """
+    try:
+        data = await run_blocking(db_pool, _analytics, "rolling", period=period, window=window, category=category)
+        return {"period": period, "category": category, "data": data}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/anomalies")
+async def get_anomalies(period: str = "year", window: Optional[int] = None, z: Optional[float] = None,
+                        limit: Optional[int] = None):
+    """Days where a category's (or total, 'All') spend spiked `z` (default 3)
+    standard deviations above its previous `window` days, biggest first.
+    
+    window, z and limit must be positive (400 otherwise)
+    """
+    try:
+        items = await run_blocking(db_pool, _analytics, "anomalies", period=period, window=window, z=z, limit=limit)
+        return {"period": period, "items": items}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/shares")
+async def get_category_shares(period: str = "year"):
+    """Each category's share of spending in `period` and in the stretch just before it"""
+    try:
+        return {"period": period, "items": await run_blocking(db_pool, _analytics, "category_shares", period=period)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/router-stats")
+def get_router_stats():
+    """How often chat questions skip the LLM, and the estimated time saved"""
+    return {**router_stats.stats(), "sql_cache": sql_cache.stats()}
+
+@app.get("/cache-stats")
+def get_cache_stats():
+    """Hit/miss counters for the dashboard result cache"""
+    return result_cache.stats()
+
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting Expense Tracker API...")
@@ -0,0 +1,632 @@
+"""Benchmarks for the API.
+
+    python bench.py overview [--slow chat|sync] [--slow-seconds 3] [--requests 300]
+    python bench.py extract [--sizes 10 1000 10000]
+    python bench.py importtime [--baseline importtime.json] [--update-baseline]
+    python bench.py pages [--rows 200000] [--page-size 50]
+    python bench.py search [--rows 300000]
+    python bench.py categorize [--rows 100000]
+    python bench.py analytics [--rows 300000] [--years 10]
+    python bench.py recurring [--rows 200000] [--subscriptions 200]
+    python bench.py totals [--rows 20000]
+    python bench.py import [--rows 100000]
+
+overview: /overview latency on its own, then again while a slow /chat or
+/sync-splitwise request is in flight. The slow request is simulated (agent
+and sync are replaced by a sleep) so no LLM or Splitwise account is needed.
+
+extract: per-turn cost of building the /chat response (tool result
+extraction) as the conversation history grows.
+
+importtime: cold-import cost of db, agent and backend.api measured with
+`python -X importtime`. Fails if a module prints on import, pulls in the
+model client or agent graph machinery, or (with a baseline file) got more
+than --tolerance times slower.
+
+pages: /expenses page latency at increasing depth into the history, with
+and without a category filter. Fails if deep pages cost more than the first.
+
+search: full-text search latency for rare and common terms next to the
+equivalent LIKE '%term%' scan. Fails if a selective search is not faster,
+misses its row, or a term on every row is not reported as truncated.
+
+categorize: categorizer training time, suggestion latency and held-out
+accuracy, and the cost of picking up a few new rows next to a full retrain.
+Fails if a suggestion takes over a millisecond at p99 or the incremental
+update is not much cheaper than retraining.
+
+analytics: cost of loading the day x category matrix after a write, and of
+each analysis (rolling mean, anomalies, category shares) over the whole
+history once it is loaded. Fails if an analysis takes over --max-ms.
+
+recurring: recurring-charge detection over the whole history, then the
+refresh after a sync-sized batch of new rows. Fails if the incremental
+refresh is not much cheaper than the full one, or misses a subscription.
+
+totals: per-category, per-source and per-currency totals from the rollups
+against a direct GROUP BY over ranges that start and end mid-month, with
+uncategorized ('' and NULL) rows among them. Fails on any difference.
+
+import: statement import of a CSV export that is not sorted by date and
+repeats charges on the same day, then the same file again. Fails if a
+repeat charge is dropped or the second import adds anything.
+
+Runs against a throwaway database unless DB_PATH is already set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+if "DB_PATH" not in os.environ:
+    os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="expense-bench-"), "bench.db")
+
+CATEGORIES = ["Food", "Groceries", "Transport", "Shopping", "Bills", "Entertainment", None]
+MERCHANTS = ["Costco", "Trader Joe's", "Uber", "Amazon", "Netflix", "Shell", "Starbucks", "Chipotle", "Target", "Comcast"]
+
+def seed_expenses(n: int, days: int = 730):
+    """Insert n synthetic personal expenses spread over the last `days` days (two years)"""
+    from db import init_db, write_conn
+    init_db()
+    today = date.today()
+    rows = [
+        (f"{random.choice(MERCHANTS)} bench expense {i}", random.randrange(100, 20_000), random.choice(CATEGORIES),
+         (today - timedelta(days=random.randrange(days))).isoformat(), "personal")
+        for i in range(n)
+    ]
+    with write_conn() as conn:
+        conn.executemany(
+            "INSERT INTO expenses (description, amount_cents, original_amount, category, date, source) "
+            "VALUES (?1, ?2, ?2, ?3, ?4, ?5)",
+            rows,
+        )
+
+def percentile(samples, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def summarize(label: str, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"{label:<22} n={len(ms):<5} p50={statistics.median(ms):7.2f}ms "
+          f"p99={percentile(ms, 99):7.2f}ms max={max(ms):7.2f}ms")
+    return percentile(ms, 99)
+
+async def timed_get(client, path: str, samples: list):
+    start = time.perf_counter()
+    r = await client.get(path)
+    samples.append(time.perf_counter() - start)
+    r.raise_for_status()
+
+async def bench_overview(slow: str, slow_seconds: float, requests: int, uncached: bool):
+    import httpx
+    import backend.api as api
+    from cache import result_cache
+
+    # Simulated slow work: blocks its worker thread the way a real agent turn or sync does
+    def slow_agent_invoke(state, config=None):
+        time.sleep(slow_seconds)
+        return {"messages": state["messages"] + [SimpleNamespace(content="ok")]}
+    def slow_sync(*args, **kwargs):
+        time.sleep(slow_seconds)
+        return dict.fromkeys(("synced", "inserted", "updated", "unchanged", "removed", "estimated", "skipped"), 0)
+    api.get_agent = lambda: SimpleNamespace(invoke=slow_agent_invoke)
+    api._sync_splitwise = slow_sync
+    os.environ.setdefault("SPLITWISE_ACCESS_TOKEN", "bench")
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def overview_loop(samples, stop=None):
+            for _ in range(requests):
+                if stop is not None and stop.done():
+                    break
+                if uncached:
+                    result_cache.clear()
+                await timed_get(client, "/overview", samples)
+
+        await timed_get(client, "/overview", [])  # warm up connections and the cache
+
+        idle = []
+        await overview_loop(idle)
+
+        if slow == "chat":
+            slow_request = asyncio.create_task(client.post("/chat", json={"message": "bench"}))
+        else:
+            slow_request = asyncio.create_task(client.post("/sync-splitwise"))
+        await asyncio.sleep(0.05)  # let the slow request reach its handler
+        busy = []
+        await overview_loop(busy, stop=slow_request)
+        await slow_request
+
+    print(f"📊 /overview latency ({'uncached' if uncached else 'cached'}), "
+          f"{slow} simulated at {slow_seconds:.1f}s")
+    idle_p99 = summarize("idle", idle)
+    busy_p99 = summarize(f"during /{'chat' if slow == 'chat' else 'sync-splitwise'}", busy)
+    return idle_p99, busy_p99
+
+def synthetic_history(n: int):
+    """n messages of earlier turns followed by a turn with two tool calls"""
+    def turn(i, calls):
+        ids = [f"call-{i}-{k}" for k in range(calls)]
+        artifact = {"data_type": "text", "data": {"text": "$1.00"}}
+        return [
+            SimpleNamespace(type="human", content=f"question {i}"),
+            SimpleNamespace(type="ai", content="", tool_calls=[
+                {"id": call_id, "name": "run_query", "args": {"sql": "SELECT 1"}} for call_id in ids
+            ]),
+            *[SimpleNamespace(type="tool", tool_call_id=call_id, name="run_query", content="$1.00", artifact=artifact)
+              for call_id in ids],
+            SimpleNamespace(type="ai", content=f"answer {i}", tool_calls=[]),
+        ]
+    history = []
+    while len(history) < n:
+        history += turn(len(history), 1)
+    return history[:n] + turn(n, 2)
+
+def bench_extract(sizes, repeat: int):
+    import backend.api as api
+
+    print("📊 /chat response building per turn")
+    timings = []
+    for n in sizes:
+        state = {"messages": synthetic_history(n)}
+        response = api._build_chat_response(state, "bench")
+        assert len(response.artifacts) == 2, response.artifacts
+        best = float("inf")
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                api._build_chat_response(state, "bench")
+            best = min(best, (time.perf_counter() - start) / repeat)
+        timings.append(best)
+        print(f"history={n:<7} {best * 1e6:8.1f}µs per turn")
+    return timings
+
+# Module -> packages its import must not load (they belong to first use, not import)
+IMPORT_CHECKS = {
+    "db": ("langchain", "langchain_core", "langgraph", "requests"),
+    "agent": ("langchain_ollama", "langgraph.prebuilt", "langgraph.checkpoint.sqlite", "sync_splitwise", "numpy"),
+    "backend.api": ("langchain_ollama", "langgraph.prebuilt", "langgraph.checkpoint.sqlite", "sync_splitwise", "numpy"),
+}
+
+# Allowed on top of the relative tolerance, so timer and disk noise on
+# few-millisecond imports doesn't fail the check
+IMPORT_SLACK_S = 0.02
+
+def measure_import(module: str, forbidden):
+    """Cold-import `module` in a fresh interpreter.
+
+    Returns (cumulative seconds, stdout printed during import, forbidden modules loaded).
+    """
+    probe = (
+        f"import json, sys; import {module}; "
+        f"print('@@' + json.dumps([m for m in {list(forbidden)!r} if m in sys.modules]))"
+    )
+    root = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=root, capture_output=True, text=True, env={**os.environ, "WARM_UP_MODEL": "0"},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    printed, _, loaded = proc.stdout.rpartition("@@")
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative_us = int(parts[1])
+    return cumulative_us / 1e6, printed.strip(), json.loads(loaded)
+
+def bench_importtime(runs: int, baseline_path: str, tolerance: float, update: bool):
+    print(f"📊 Cold import time (best of {runs})")
+    results, failures = {}, []
+    for module, forbidden in IMPORT_CHECKS.items():
+        samples = [measure_import(module, forbidden) for _ in range(runs)]
+        seconds = min(sample[0] for sample in samples)
+        _, printed, loaded = samples[0]
+        results[module] = seconds
+        print(f"{module:<12} {seconds * 1000:8.1f}ms")
+        if printed:
+            failures.append(f"{module} prints on import: {printed[:200]!r}")
+        if loaded:
+            failures.append(f"{module} loads {', '.join(loaded)} on import")
+
+    if update:
+        with open(baseline_path, "w") as f:
+            json.dump({m: round(s, 4) for m, s in results.items()}, f, indent=2)
+        print(f"📝 Baseline written to {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        for module, seconds in results.items():
+            if module in baseline and seconds > baseline[module] * tolerance + IMPORT_SLACK_S:
+                failures.append(f"{module} import took {seconds * 1000:.0f}ms "
+                                f"(baseline {baseline[module] * 1000:.0f}ms)")
+    return failures
+
+def bench_pages(page_size: int, depths, repeat: int):
+    from db import get_expense_page, fetch_rows
+
+    total = fetch_rows("SELECT COUNT(*) as n FROM expenses")[0]["n"]
+    print(f"📊 Expense page latency ({total} rows, {page_size} per page)")
+    ratios = []
+    for category in (None, "Food"):
+        # Walk to each depth once to get its cursor, then time fetching that page
+        cursors, after, page = {}, None, 0
+        while page <= max(depths):
+            if page in depths:
+                cursors[page] = after
+            rows, after = get_expense_page(after, page_size, category=category)
+            if after is None:
+                break
+            page += 1
+        timings = {}
+        for depth, cursor in cursors.items():
+            best = float("inf")
+            for _ in range(5):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    get_expense_page(cursor, page_size, category=category)
+                best = min(best, (time.perf_counter() - start) / repeat)
+            timings[depth] = best
+            print(f"category={category or 'any':<6} page={depth:<6} {best * 1000:7.3f}ms")
+        ratios.append(max(timings.values()) / timings[min(timings)])
+    return max(ratios)
+
+def bench_search(repeat: int):
+    from db import search_expenses, fetch_rows
+
+    total = fetch_rows("SELECT COUNT(*) as n FROM expenses")[0]["n"]
+    print(f"📊 Search latency ({total} rows)")
+    # One-row hit, a merchant on ~10% of rows, and a miss
+    terms = [f"expense {total // 2}", "costco", "nonexistent"]
+    results = {}
+    for term in terms:
+        def fts():
+            search_expenses(term)
+        def like():
+            fetch_rows(
+                "SELECT id FROM expenses WHERE description LIKE ? ORDER BY date DESC LIMIT 20", (f"%{term}%",)
+            )
+        for label, fn in (("fts", fts), ("like", like)):
+            best = float("inf")
+            for _ in range(3):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    fn()
+                best = min(best, (time.perf_counter() - start) / repeat)
+            results[term, label] = best
+            print(f"{label:<5} {term!r:<22} {best * 1000:8.2f}ms")
+    # Rare words rank every match; common ones say they were cut off
+    rows, truncated = search_expenses(terms[0])
+    if truncated or not any(r["description"].endswith(f" {total // 2}") for r in rows):
+        print(f"❌ {terms[0]!r} missed its row or was reported truncated")
+        return None
+    if not search_expenses("bench")[1]:
+        print("❌ 'bench' matches every row but was not reported truncated")
+        return None
+    return results[terms[0], "fts"], results[terms[0], "like"]
+
+# Merchant -> the category its expenses are filed under, for bench_categorize
+MERCHANT_CATEGORIES = {
+    "Costco": "Groceries", "Trader Joe's": "Groceries", "Uber": "Transportation", "Shell": "Transportation",
+    "Amazon": "Shopping", "Target": "Shopping", "Netflix": "Entertainment", "Starbucks": "Food & Drink",
+    "Chipotle": "Food & Drink", "Comcast": "Bills & Utilities",
+}
+ITEMS = ["order", "refill", "trip", "subscription", "lunch", "pickup", "weekly run", "gift", "snacks", "bill"]
+
+def categorized_rows(n: int):
+    """n (description, amount_cents, category, date) rows whose merchant decides the category"""
+    today = date.today()
+    for _ in range(n):
+        merchant = random.choice(MERCHANTS)
+        yield (f"{merchant} {random.choice(ITEMS)}", random.randrange(100, 20_000), MERCHANT_CATEGORIES[merchant],
+               (today - timedelta(days=random.randrange(730))).isoformat())
+
+def insert_categorized(n: int):
+    from db import init_db, write_conn
+    init_db()
+    with write_conn() as conn:
+        conn.executemany(
+            "INSERT INTO expenses (description, amount_cents, original_amount, category, date, source) "
+            "VALUES (?1, ?2, ?2, ?3, ?4, 'personal')",
+            list(categorized_rows(n)),
+        )
+
+def statement_csv(rows: int, repeat_every: int = 10):
+    """A CSV statement of `rows` charges in random order over ten years; every
+    `repeat_every`th charge is an identical second charge on the same day"""
+    today = date.today()
+    charges = []
+    while len(charges) < rows:
+        charge = ((today - timedelta(days=random.randrange(3650))).strftime("%m/%d/%Y"),
+                  f"{random.choice(MERCHANTS)} {random.choice(ITEMS)}", random.randrange(100, 20_000))
+        charges.append(charge)
+        if len(charges) % repeat_every == 0:
+            charges.append(charge)
+    charges = charges[:rows]
+    random.shuffle(charges)
+    lines = ["Date,Description,Amount"] + [f"{day},{desc},-{cents / 100:.2f}" for day, desc, cents in charges]
+    return "\n".join(lines) + "\n"
+
+def bench_import(rows: int):
+    import io
+    import tracemalloc
+    from db import init_db
+    from importer import import_statement, iter_csv, iter_import_rows
+
+    init_db()
+    text = statement_csv(rows)
+    print(f"📊 Importing an unsorted {rows}-row statement")
+    # Memory held while parsing and hashing (the occurrence counts), without the database
+    f = io.StringIO(text)
+    tracemalloc.start()
+    for _ in iter_import_rows(iter_csv(f), {"read": 0, "skipped": 0}):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    first = import_statement(io.StringIO(text))
+    seconds = time.perf_counter() - start
+    print(f"first import   {seconds:6.2f}s  {rows / seconds:7.0f} rows/s  parse+hash peak {peak / 2**20:.1f} MiB  {first}")
+    second = import_statement(io.StringIO(text))
+    print(f"second import  {second}")
+    return first["inserted"] == rows and second["inserted"] == 0 and second["duplicates"] == rows
+
+def bench_categorize(rows: int, repeat: int):
+    from categorizer import categorizer
+
+    insert_categorized(rows)
+    start = time.perf_counter()
+    categorizer.retrain()
+    categorizer.refresh()
+    full = time.perf_counter() - start
+    print(f"📊 Categorizer: full training on {rows} rows took {full * 1000:.1f}ms")
+
+    held_out = list(categorized_rows(repeat))
+    samples, correct = [], 0
+    for description, _, category, _ in held_out:
+        start = time.perf_counter()
+        best = categorizer.suggest(description, limit=1)
+        samples.append(time.perf_counter() - start)
+        correct += bool(best) and best[0][0] == category
+    suggest_p99 = summarize("suggest", samples)
+    print(f"held-out accuracy      {correct / len(held_out):.1%}")
+
+    insert_categorized(100)
+    start = time.perf_counter()
+    categorizer.refresh()
+    incremental = time.perf_counter() - start
+    print(f"learning 100 new rows  {incremental * 1000:.2f}ms")
+    return suggest_p99, incremental / full
+
+def bench_analytics(repeat: int):
+    import analytics
+    from db import fetch_rows, write_conn
+
+    total = fetch_rows("SELECT COUNT(*) as n FROM expenses")[0]["n"]
+    start = time.perf_counter()
+    m = analytics.spend_matrix()
+    print(f"📊 Analytics ({total} rows): loaded {m.cents.shape[0]} days x {len(m.categories)} categories "
+          f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+    worst = 0.0
+    for label, fn in (
+        ("rolling", lambda: analytics.rolling("all")),
+        ("anomalies", lambda: analytics.anomalies("all")),
+        ("category_shares", lambda: analytics.category_shares("year")),
+    ):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        worst = max(worst, summarize(label, samples))
+
+    # A write invalidates the matrix; the next call reloads it
+    with write_conn() as conn:
+        conn.execute("UPDATE expenses SET amount_cents = amount_cents + 1 WHERE id = 1")
+    start = time.perf_counter()
+    analytics.anomalies("all")
+    print(f"reload after a write   {(time.perf_counter() - start) * 1000:.1f}ms")
+    return worst
+
+def seed_subscriptions(n: int, days: int = 730):
+    """Insert n monthly subscriptions with a steady amount, charged over the last `days` days"""
+    from db import write_conn
+    today = date.today()
+    rows = []
+    for i in range(n):
+        cents, offset = random.randrange(500, 5_000), random.randrange(30)
+        for month in range(days // 30):
+            day = today - timedelta(days=offset + round(month * 30.44))
+            name = "".join(chr(ord("a") + int(d)) for d in f"{i:04d}")  # digits aren't part of the merchant key
+            rows.append((f"SUBSCRIPTION {name}.COM*{random.randrange(10**6)}", cents, day.isoformat()))
+    with write_conn() as conn:
+        conn.executemany(
+            "INSERT INTO expenses (description, amount_cents, original_amount, category, date, source) "
+            "VALUES (?1, ?2, ?2, 'Bills & Utilities', ?3, 'import')",
+            rows,
+        )
+
+def bench_totals(ranges: int):
+    from db import get_category_totals, get_source_totals, get_currency_totals, fetch_rows, write_conn
+
+    with write_conn() as conn:
+        conn.execute("UPDATE expenses SET category = '' WHERE id % 7 = 0")
+        conn.execute("UPDATE expenses SET category = NULL WHERE id % 11 = 0")
+    today = date.today()
+    print(f"📊 Grouped totals vs. GROUP BY over {ranges} mid-month ranges")
+    mismatches = 0
+    for _ in range(ranges):
+        start = today - timedelta(days=random.randrange(60, 700))
+        end = start + timedelta(days=random.randrange(20, 400))
+        start, end = start.isoformat(), end.isoformat()
+        for column, totals in (("category", get_category_totals), ("source", get_source_totals),
+                               ("currency", get_currency_totals)):
+            got = {row[column]: (row["total_cents"], row["count"]) for row in totals(start, end)}
+            expected = {
+                row["k"]: (row["total_cents"], row["count"])
+                for row in fetch_rows(
+                    f"SELECT NULLIF({column}, '') as k, SUM(amount_cents) as total_cents, COUNT(*) as count "
+                    f"FROM expenses WHERE date >= ? AND date < ? GROUP BY k",
+                    (start, end),
+                )
+            }
+            if got != expected:
+                mismatches += 1
+                print(f"{column} [{start}, {end}): got {got}, expected {expected}")
+    return mismatches
+
+def bench_recurring(subscriptions: int):
+    import recurring
+    from db import fetch_rows
+
+    total = fetch_rows("SELECT COUNT(*) as n FROM expenses")[0]["n"]
+    start = time.perf_counter()
+    checked, found = recurring.refresh()
+    full = time.perf_counter() - start
+    print(f"📊 Recurring charges ({total} rows): checked {checked} merchants, "
+          f"found {found} in {full * 1000:.1f}ms")
+
+    # A sync's worth of new rows touches a handful of merchants
+    seed_expenses(200)
+    start = time.perf_counter()
+    checked, _ = recurring.refresh()
+    incremental = time.perf_counter() - start
+    print(f"refresh after 200 rows {incremental * 1000:.1f}ms ({checked} merchants re-checked)")
+    start = time.perf_counter()
+    recurring.refresh()
+    print(f"refresh with no change {(time.perf_counter() - start) * 1000:.2f}ms")
+    return found >= subscriptions, incremental / full
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="bench", required=True)
+    overview = sub.add_parser("overview", help="/overview p99 while a slow request is in flight")
+    overview.add_argument("--slow", choices=["chat", "sync"], default="chat")
+    overview.add_argument("--slow-seconds", type=float, default=3.0)
+    overview.add_argument("--requests", type=int, default=300)
+    overview.add_argument("--rows", type=int, default=50_000, help="synthetic expenses to seed")
+    overview.add_argument("--uncached", action="store_true", help="clear the result cache before every request")
+    overview.add_argument("--max-ratio", type=float, default=3.0,
+                          help="fail if busy p99 exceeds idle p99 by more than this factor (plus 5ms)")
+    extract = sub.add_parser("extract", help="/chat tool-result extraction cost vs. history length")
+    extract.add_argument("--sizes", type=int, nargs="+", default=[10, 1_000, 10_000])
+    extract.add_argument("--repeat", type=int, default=200)
+    importtime = sub.add_parser("importtime", help="cold-import time and side effects of the main modules")
+    importtime.add_argument("--runs", type=int, default=3)
+    importtime.add_argument("--baseline", default="importtime.json", help="JSON of module -> seconds")
+    importtime.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown vs. the baseline")
+    importtime.add_argument("--update-baseline", action="store_true")
+    pages = sub.add_parser("pages", help="/expenses page cost vs. depth")
+    pages.add_argument("--rows", type=int, default=200_000, help="synthetic expenses to seed")
+    pages.add_argument("--page-size", type=int, default=50)
+    pages.add_argument("--depths", type=int, nargs="+", default=[0, 100, 1_000, 3_000])
+    pages.add_argument("--repeat", type=int, default=200)
+    search = sub.add_parser("search", help="full-text search vs. LIKE scans")
+    search.add_argument("--rows", type=int, default=300_000, help="synthetic expenses to seed")
+    search.add_argument("--repeat", type=int, default=10)
+    categorize = sub.add_parser("categorize", help="categorizer training, suggestion and update cost")
+    categorize.add_argument("--rows", type=int, default=100_000, help="synthetic categorized expenses to seed")
+    categorize.add_argument("--repeat", type=int, default=2_000, help="held-out descriptions to suggest for")
+    analytics = sub.add_parser("analytics", help="rolling stats, anomalies and shares over years of history")
+    analytics.add_argument("--rows", type=int, default=300_000, help="synthetic expenses to seed")
+    analytics.add_argument("--years", type=int, default=10, help="history they are spread over")
+    analytics.add_argument("--repeat", type=int, default=50)
+    analytics.add_argument("--max-ms", type=float, default=50.0, help="fail if an analysis p99 exceeds this")
+    recurring = sub.add_parser("recurring", help="recurring-charge detection, full and incremental")
+    recurring.add_argument("--rows", type=int, default=200_000, help="synthetic one-off expenses to seed")
+    recurring.add_argument("--subscriptions", type=int, default=200, help="monthly subscriptions to seed")
+    importer = sub.add_parser("import", help="unsorted statement import: repeat charges kept, re-import adds nothing")
+    importer.add_argument("--rows", type=int, default=100_000, help="statement rows to generate")
+    totals = sub.add_parser("totals", help="rollup totals per category/source/currency vs. a direct GROUP BY")
+    totals.add_argument("--rows", type=int, default=20_000, help="synthetic expenses to seed")
+    totals.add_argument("--ranges", type=int, default=50, help="random date ranges to compare")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if args.bench == "overview":
+        seed_expenses(args.rows)
+        idle_p99, busy_p99 = asyncio.run(
+            bench_overview(args.slow, args.slow_seconds, args.requests, args.uncached)
+        )
+        if busy_p99 > idle_p99 * args.max_ratio + 5:
+            print("❌ /overview p99 degraded while the slow request was running")
+            sys.exit(1)
+        print("✅ /overview p99 stayed flat")
+    elif args.bench == "extract":
+        timings = bench_extract(args.sizes, args.repeat)
+        if timings[-1] > timings[0] * 3:
+            print("❌ Per-turn extraction cost grows with history length")
+            sys.exit(1)
+        print("✅ Per-turn extraction cost is independent of history length")
+    elif args.bench == "importtime":
+        failures = bench_importtime(args.runs, args.baseline, args.tolerance, args.update_baseline)
+        for failure in failures:
+            print(f"❌ {failure}")
+        if failures:
+            sys.exit(1)
+        print("✅ Cold start within budget")
+    elif args.bench == "pages":
+        seed_expenses(args.rows)
+        if bench_pages(args.page_size, args.depths, args.repeat) > 3:
+            print("❌ Deep pages cost more than the first page")
+            sys.exit(1)
+        print("✅ Page cost is independent of depth")
+    elif args.bench == "search":
+        seed_expenses(args.rows)
+        timings = bench_search(args.repeat)
+        if timings is None:
+            sys.exit(1)
+        fts_seconds, like_seconds = timings
+        if fts_seconds > like_seconds:
+            print("❌ Selective search is no faster than a LIKE scan")
+            sys.exit(1)
+        print("✅ Selective search avoids the table scan")
+    elif args.bench == "categorize":
+        suggest_p99_ms, update_ratio = bench_categorize(args.rows, args.repeat)
+        if suggest_p99_ms > 1:
+            print("❌ Suggestions are slower than a millisecond at p99")
+            sys.exit(1)
+        if update_ratio > 0.1:
+            print("❌ Learning new rows costs nearly as much as retraining")
+            sys.exit(1)
+        print("✅ Suggestions are sub-millisecond and new rows are learned incrementally")
+    elif args.bench == "analytics":
+        seed_expenses(args.rows, days=365 * args.years)
+        if bench_analytics(args.repeat) > args.max_ms:
+            print("❌ An analysis is too slow over the full history")
+            sys.exit(1)
+        print("✅ Analytics stay fast over the full history")
+    elif args.bench == "recurring":
+        seed_expenses(args.rows)
+        seed_subscriptions(args.subscriptions)
+        found_all, update_ratio = bench_recurring(args.subscriptions)
+        if not found_all:
+            print("❌ Some seeded subscriptions were not detected")
+            sys.exit(1)
+        if update_ratio > 0.25:
+            print("❌ Refreshing after new rows costs nearly as much as a full detection")
+            sys.exit(1)
+        print("✅ Recurring charges are detected and refreshed incrementally")
+    elif args.bench == "import":
+        if not bench_import(args.rows):
+            print("❌ Repeat charges were dropped or a re-import added rows")
+            sys.exit(1)
+        print("✅ Unsorted statements keep repeat charges and re-import cleanly")
+    elif args.bench == "totals":
+        seed_expenses(args.rows)
+        if bench_totals(args.ranges):
+            print("❌ Grouped totals disagree with a direct GROUP BY")
+            sys.exit(1)
+        print("✅ Grouped totals match a direct GROUP BY")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import db
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+
+class ResultCache:
+    """Thread-safe LRU cache for computed dashboard results.
+
+    Keys include db.data_version(), so a write makes every older entry
+    unreachable; stale entries are never served and simply age out.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (True, value) on a hit, (False, None) on a miss."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, self._data[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+result_cache = ResultCache()
+
+def cached(fn):
+    """Cache fn's result per (arguments, data version, today's date).
+
+    The date is part of the key because period ranges like 'this_month' are
+    relative to today. Exceptions are never cached, and calls with unhashable
+    arguments bypass the cache.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (fn.__module__, fn.__qualname__, args, tuple(sorted(kwargs.items())),
+               db.data_version(), date.today())
+        try:
+            hit, value = result_cache.get(key)
+        except TypeError:  # unhashable argument
+            return fn(*args, **kwargs)
+        if hit:
+            return value
+        value = fn(*args, **kwargs)
+        result_cache.put(key, value)
+        return value
+    return wrapper
@@ -0,0 +1,150 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+import db
+
+# Suggests a category for an expense description from the expenses already
+# filed. The model is a token naive Bayes over words in the description,
+# trained from the database on first use and then kept up to date by learning
+# only the rows added since (see Categorizer.refresh).
+
+# Rows with these categories say nothing about the description, so they are
+# neither learned from nor kept when a suggestion is confident enough to
+# replace them
+UNSET_CATEGORIES = (None, "", "General", "Uncategorized")
+# Minimum confidence to file an imported or synced row without asking
+AUTO_CATEGORY_CONFIDENCE = float(os.getenv("AUTO_CATEGORY_CONFIDENCE", "0.8"))
+
+_TOKEN = re.compile(r"[a-z][a-z0-9&'-]+")
+
+def tokenize(description: str):
+    """Distinct lowercase words of a description (numbers and 1-letter words dropped)"""
+    return set(_TOKEN.findall((description or "").lower()))
+
+class NaiveBayes:
+    """Naive Bayes over the set of words in a description, with add-`alpha` smoothing.
+
+    learn() is O(words), so training can follow the data one row at a time;
+    a negative weight unlearns a row.
+    """
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.docs = Counter()                 # category -> rows learned
+        self.words = Counter()                # category -> word occurrences learned
+        self.counts = defaultdict(Counter)    # word -> {category: rows containing it}
+
+    def learn(self, description: str, category: str, weight: int = 1):
+        words = tokenize(description)
+        for word in words:
+            self.counts[word][category] += weight
+        self.words[category] += weight * len(words)
+        self.docs[category] += weight
+        if self.docs[category] <= 0:
+            del self.docs[category], self.words[category]
+
+    def scores(self, description: str, among=None):
+        """[(category, probability)] best first; empty if none of the words were seen in training"""
+        categories = [c for c in (among or self.docs) if self.docs.get(c, 0) > 0]
+        known = [self.counts[w] for w in tokenize(description) if w in self.counts]
+        if not categories or not known:
+            return []
+        total_docs = sum(self.docs.values())
+        vocab = len(self.counts)
+        log_alpha = math.log(self.alpha)
+        logp = {}
+        for c in categories:
+            # Every known word contributes log((n + alpha) / denom); start from n = 0
+            # and correct for the words this category has actually seen
+            denom = math.log(self.words[c] + self.alpha * vocab)
+            logp[c] = math.log(self.docs[c] / total_docs) + len(known) * (log_alpha - denom)
+        for per_category in known:
+            for c, n in per_category.items():
+                if n > 0 and c in logp:
+                    logp[c] += math.log(n + self.alpha) - log_alpha
+        top = max(logp.values())
+        weights = {c: math.exp(v - top) for c, v in logp.items()}
+        norm = sum(weights.values())
+        return sorted(((c, w / norm) for c, w in weights.items()), key=lambda cw: -cw[1])
+
+_UNSET_SQL = "category IS NOT NULL AND category NOT IN ('', 'General', 'Uncategorized')"
+
+class Categorizer:
+    """NaiveBayes kept in step with the expenses table.
+
+    refresh() runs on every suggestion but only touches the database when
+    db.data_version() moved. It then learns the rows with ids past the last
+    one it saw, and falls back to a full retrain if the per-category row
+    counts (read from the rollup table) no longer match, i.e. rows were
+    deleted or recategorized.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.model = NaiveBayes()
+        self._last_id = 0
+        self._version = None
+
+    def _stored_counts(self, conn):
+        rows = conn.execute(
+            f"SELECT category, SUM(count) FROM monthly_category_totals WHERE {_UNSET_SQL} GROUP BY category"
+        )
+        return Counter({category: n for category, n in rows if n})
+
+    def _learn_after(self, conn, last_id: int):
+        # Undated rows are left out, as they are from the rollups _stored_counts reads
+        rows = conn.execute(
+            f"SELECT id, description, category FROM expenses "
+            f"WHERE id > ? AND date IS NOT NULL AND {_UNSET_SQL} ORDER BY id",
+            (last_id,),
+        )
+        for expense_id, description, category in rows:
+            self.model.learn(description, category)
+            self._last_id = expense_id
+
+    def retrain(self):
+        """Rebuild the model from every categorized expense"""
+        with self._lock:
+            self._retrain(db.get_conn())
+
+    def _retrain(self, conn):
+        self.model, self._last_id = NaiveBayes(), 0
+        self._learn_after(conn, 0)
+
+    def refresh(self):
+        version = db.data_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            conn = db.get_conn()
+            self._learn_after(conn, self._last_id)
+            if self.model.docs != self._stored_counts(conn):
+                self._retrain(conn)
+            self._version = version
+
+    def suggest(self, description: str, among=None, limit: int = 3):
+        """[(category, confidence)] for a description, best first; empty if none of its words are known"""
+        self.refresh()
+        with self._lock:
+            return self.model.scores(description, among)[:limit]
+
+    def fill(self, rows, description_at: int, category_at: int, threshold: float = AUTO_CATEGORY_CONFIDENCE):
+        """Yield `rows` (tuples) with an unset category replaced by a confident suggestion.
+
+        The model is refreshed once up front rather than per row.
+        """
+        self.refresh()
+        for row in rows:
+            if row[category_at] in UNSET_CATEGORIES:
+                with self._lock:
+                    best = self.model.scores(row[description_at])[:1]
+                if best and best[0][1] >= threshold:
+                    row = (*row[:category_at], best[0][0], *row[category_at + 1:])
+            yield row
+
+categorizer = Categorizer()
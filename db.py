@@ -1,147 +1,1157 @@
+import functools
 import os
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date as _date, timedelta
+from itertools import islice
+
+from money import from_minor, to_minor, to_cents, to_dollars, sum_dollars
 
 DB_PATH = os.getenv("DB_PATH", "expenses.db")
 
-# Get absolute path for logging
-absolute_db_path = os.path.abspath(DB_PATH)
-print(f"📁 Database file: {absolute_db_path}")
+# Connection pool: one long-lived reader connection per thread plus a single
+# writer connection shared by all threads and serialized by _write_lock.
+# WAL journaling lets the readers keep serving while the writer commits.
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size=-16000",  # ~16MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=134217728",  # 128MB
+)
+
+_local = threading.local()
+_pool_lock = threading.Lock()
+_write_lock = threading.RLock()
+_writer = None
+_readers = []
+_pool_pid = os.getpid()
+
+def _connect():
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _check_fork():
+    """Drop inherited connections after a fork; SQLite handles can't be shared across processes."""
+    global _writer, _readers, _pool_pid, _local
+    if os.getpid() != _pool_pid:
+        _writer = None
+        _readers = []
+        _local = threading.local()
+        _pool_pid = os.getpid()
 
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    """Return this thread's pooled reader connection (opened on first use)."""
+    _check_fork()
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        with _pool_lock:
+            _readers.append(conn)
+    return conn
+
+@contextmanager
+def write_conn():
+    """Serialized access to the shared writer connection.
+
+    Commits when the block exits cleanly and rolls back on error, so every
+    write path runs as a single transaction. A successful commit bumps the
+    data version.
+    """
+    global _writer
+    _check_fork()
+    with _write_lock:
+        if _writer is None:
+            _writer = _connect()
+        with _writer:
+            yield _writer
+        _bump_data_version()
+
+# Data version: changes whenever expense data may have changed. Writes through
+# write_conn() bump it directly; commits from other processes (e.g. running
+# sync_splitwise.py from the CLI) are picked up through SQLite's per-connection
+# PRAGMA data_version. Result caches key on it (see cache.py).
+_data_version = 0
+_version_lock = threading.Lock()
+
+def _bump_data_version():
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+
+def data_version():
+    """Return the current data version counter."""
+    seen = get_conn().execute("PRAGMA data_version").fetchone()[0]
+    if getattr(_local, "data_version", None) != seen:
+        _local.data_version = seen
+        _bump_data_version()
+    return _data_version
+
+def close_pool():
+    """Close every pooled connection (used on shutdown and after DB_PATH changes)."""
+    global _writer, _readers, _local
+    with _write_lock, _pool_lock:
+        for conn in _readers:
+            conn.close()
+        if _writer is not None:
+            _writer.close()
+        _writer = None
+        _readers = []
+        _local = threading.local()
+
+# Sandbox for model-written SQL (query_db): a read-only connection per thread
+# whose authorizer only allows reading the tables below with plain SQL
+# functions, plus a time budget and a row cap per query.
+QUERY_TIME_LIMIT_S = float(os.getenv("QUERY_TIME_LIMIT_S", "2"))
+QUERY_ROW_LIMIT = int(os.getenv("QUERY_ROW_LIMIT", "1000"))
+PROGRESS_STEPS = 1000  # SQLite VM instructions between time-budget checks
+
+SANDBOX_TABLES = frozenset({
+    "expenses", "daily_totals", "monthly_totals", "monthly_category_totals", "monthly_source_totals",
+    "monthly_currency_totals", "recurring",
+})
+SANDBOX_FUNCTIONS = frozenset({
+    "abs", "avg", "coalesce", "count", "date", "datetime", "group_concat", "ifnull", "iif", "instr",
+    "julianday", "length", "like", "glob", "lower", "ltrim", "max", "min", "nullif", "printf", "format",
+    "replace", "round", "rtrim", "strftime", "substr", "substring", "sum", "time", "total", "trim",
+    "typeof", "upper", "unixepoch",
+})
+SANDBOX_LIMITS = (
+    (sqlite3.SQLITE_LIMIT_LENGTH, 1_000_000),  # largest string/blob a query can build
+    (sqlite3.SQLITE_LIMIT_SQL_LENGTH, 20_000),
+    (sqlite3.SQLITE_LIMIT_ATTACHED, 0),
+)
+
+class QueryError(Exception):
+    """A sandboxed query was refused or stopped.
+
+    `code` is 'rejected' (not a read of the expense tables), 'invalid' (SQL
+    error), 'time_limit' or 'row_limit'.
+    """
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+
+    def to_dict(self):
+        return {"error": str(self), "code": self.code}
+
+# Schema tables, which don't list themselves in sqlite_master
+_SCHEMA_TABLES = ("sqlite_master", "sqlite_schema", "sqlite_temp_master", "sqlite_temp_schema")
+
+def _schema_names(conn):
+    """Lowercased names of every table, view and index in the database"""
+    rows = conn.execute("SELECT name FROM sqlite_master UNION ALL SELECT name FROM sqlite_temp_master")
+    return frozenset(_SCHEMA_TABLES + tuple(name.lower() for (name,) in rows))
+
+def _sandbox_authorizer(action, arg1, arg2, db_name, trigger, schema_names=frozenset(_SCHEMA_TABLES)):
+    if action in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_RECURSIVE):
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_READ:
+        # db_name is None for reads with no column, e.g. COUNT(*)
+        if db_name in ("main", None) and arg1 in SANDBOX_TABLES:
+            return sqlite3.SQLITE_OK
+        # ...which is also how a WITH table (CTE) is read: allow names that aren't in the schema
+        return sqlite3.SQLITE_OK if db_name is None and arg1.lower() not in schema_names else sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_FUNCTION:
+        return sqlite3.SQLITE_OK if arg2.lower() in SANDBOX_FUNCTIONS else sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_DENY
+
+def _sandbox_conn():
+    """Return this thread's read-only sandbox connection (opened on first use)."""
+    _check_fork()
+    conn = getattr(_local, "sandbox", None)
+    if conn is None:
+        conn = sqlite3.connect(
+            f"file:{os.path.abspath(DB_PATH)}?mode=ro",
+            uri=True,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA query_only=1")
+        for limit, value in SANDBOX_LIMITS:
+            conn.setlimit(limit, value)
+        conn.set_authorizer(functools.partial(_sandbox_authorizer, schema_names=_schema_names(conn)))
+        _local.sandbox = conn
+        with _pool_lock:
+            _readers.append(conn)
+    return conn
+
+def fetch_rows(sql: str, params=()):
+    """Run a read query on the pooled reader connection and return a list of dicts."""
+    cur = get_conn().execute(sql, params)
+    columns = [desc[0] for desc in cur.description]
+    return [dict(zip(columns, r)) for r in cur.fetchall()]
+
+# Period filtering.
+# Every dashboard query filters on a half-open range `date >= ? AND date < ?`
+# over the raw column so SQLite can walk idx_expenses_date_category_cents
+# instead of evaluating strftime() on every row.
+MIN_DATE = "0001-01-01"
+OPEN_END = "9999-12-31"
+
+PERIODS = ("week", "month", "this_month", "last_month", "two_months", "year", "this_year", "last_year", "all")
+
+def _shift_month(d: _date, months: int) -> _date:
+    idx = d.year * 12 + d.month - 1 + months
+    return _date(idx // 12, idx % 12 + 1, 1)
+
+def month_range(year: int, month: int):
+    """Return the [start, end) ISO date range covering one calendar month."""
+    start = _date(int(year), int(month), 1)
+    return start.isoformat(), _shift_month(start, 1).isoformat()
+
+def period_range(period: str, today: _date = None):
+    """Return the half-open [start, end) ISO date range for a named period.
+
+    'week' and 'year' are rolling windows (last 7 days / last 12 months),
+    'two_months' is last month plus this month, 'all' is unbounded.
+    """
+    today = today or _date.today()
+    month = today.replace(day=1)
+    if period == "week":
+        return (today - timedelta(days=7)).isoformat(), OPEN_END
+    if period in ("month", "this_month"):
+        return month.isoformat(), _shift_month(month, 1).isoformat()
+    if period == "last_month":
+        return _shift_month(month, -1).isoformat(), month.isoformat()
+    if period == "two_months":
+        return _shift_month(month, -1).isoformat(), OPEN_END
+    if period == "year":
+        try:
+            start = today.replace(year=today.year - 1)
+        except ValueError:  # Feb 29 -> Mar 1, same as SQLite's date('now', '-12 months')
+            start = _date(today.year - 1, 3, 1)
+        return start.isoformat(), OPEN_END
+    if period == "this_year":
+        return f"{today.year}-01-01", f"{today.year + 1}-01-01"
+    if period == "last_year":
+        return f"{today.year - 1}-01-01", f"{today.year}-01-01"
+    if period == "all":
+        return MIN_DATE, OPEN_END
+    raise ValueError(f"Unknown period '{period}'. Use one of: {', '.join(PERIODS)}")
+
+# Raw range aggregates over expenses. Dashboard reads go through the rollup
+# tables below and only fall back to these for partial months at the edges
+# of a range. All take (start, end) parameters from period_range()/month_range().
+PERIOD_TOTAL_SQL = """
+    SELECT SUM(amount_cents) as total_cents, COUNT(*) as count
+    FROM expenses
+    WHERE date >= ? AND date < ?
+"""
+
+# NULL and '' keys are one group (None), as in the rollups (see _grouped_totals)
+CATEGORY_TOTALS_SQL = """
+    SELECT NULLIF(category, '') as category, SUM(amount_cents) as total_cents, COUNT(*) as count
+    FROM expenses
+    WHERE date >= ? AND date < ?
+    GROUP BY NULLIF(category, '')
+"""
+
+SOURCE_TOTALS_SQL = """
+    SELECT NULLIF(source, '') as source, SUM(amount_cents) as total_cents, COUNT(*) as count
+    FROM expenses
+    WHERE date >= ? AND date < ?
+    GROUP BY NULLIF(source, '')
+"""
+
+CURRENCY_TOTALS_SQL = """
+    SELECT NULLIF(currency, '') as currency, SUM(amount_cents) as total_cents,
+           SUM(original_amount) as original_total, COUNT(*) as count
+    FROM expenses
+    WHERE date >= ? AND date < ?
+    GROUP BY NULLIF(currency, '')
+"""
+
+# Rollups.
+# Per-day, per-month, per-month x category, per-month x source and per-month x
+# currency totals, maintained by triggers on expenses so they change in the
+# same transaction as every insert, update and delete. Dashboard reads cost
+# O(buckets). Totals are integer cents, so they never drift.
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_totals (
+    day TEXT PRIMARY KEY,
+    total_cents INTEGER NOT NULL,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS monthly_totals (
+    month TEXT PRIMARY KEY,
+    total_cents INTEGER NOT NULL,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS monthly_category_totals (
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,  -- '' for uncategorized rows
+    total_cents INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (month, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS monthly_source_totals (
+    month TEXT NOT NULL,
+    source TEXT NOT NULL,
+    total_cents INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (month, source)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS monthly_currency_totals (
+    month TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    total_cents INTEGER NOT NULL,
+    original_total INTEGER NOT NULL,  -- in the currency's minor units
+    count INTEGER NOT NULL,
+    PRIMARY KEY (month, currency)
+) WITHOUT ROWID;
+"""
+
+# (table, key columns, key expressions over a NEW./OLD. row, summed columns)
+_TOTAL = (("total_cents", "{r}.amount_cents"),)
+_ROLLUPS = (
+    ("daily_totals", ("day",), ("substr({r}.date, 1, 10)",), _TOTAL),
+    ("monthly_totals", ("month",), ("substr({r}.date, 1, 7)",), _TOTAL),
+    ("monthly_category_totals", ("month", "category"), ("substr({r}.date, 1, 7)", "COALESCE({r}.category, '')"), _TOTAL),
+    ("monthly_source_totals", ("month", "source"), ("substr({r}.date, 1, 7)", "COALESCE({r}.source, '')"), _TOTAL),
+    ("monthly_currency_totals", ("month", "currency"), ("substr({r}.date, 1, 7)", "{r}.currency"),
+     _TOTAL + (("original_total", "{r}.original_amount"),)),
+)
+
+def _rollup_add_sql(row: str) -> str:
+    stmts = []
+    for table, cols, exprs, sums in _ROLLUPS:
+        values = ", ".join([e.format(r=row) for e in exprs] + [e.format(r=row) for _, e in sums])
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c, _ in sums)
+        stmts.append(
+            f"INSERT INTO {table} ({', '.join(cols)}, {', '.join(c for c, _ in sums)}, count) "
+            f"SELECT {values}, 1 WHERE {row}.date IS NOT NULL "
+            f"ON CONFLICT({', '.join(cols)}) DO UPDATE SET {updates}, count = count + 1;"
+        )
+    return "\n    ".join(stmts)
+
+def _rollup_remove_sql(row: str) -> str:
+    stmts = []
+    for table, cols, exprs, sums in _ROLLUPS:
+        match = " AND ".join(f"{c} = {e.format(r=row)}" for c, e in zip(cols, exprs))
+        updates = ", ".join(f"{c} = {c} - {e.format(r=row)}" for c, e in sums)
+        stmts.append(f"UPDATE {table} SET {updates}, count = count - 1 WHERE {match};")
+        stmts.append(f"DELETE FROM {table} WHERE {match} AND count <= 0;")
+    return "\n    ".join(stmts)
+
+def _rollup_fill_sql(where: str) -> str:
+    """INSERT ... SELECT statements adding the expenses rows matching `where` to every rollup"""
+    stmts = []
+    for table, cols, exprs, sums in _ROLLUPS:
+        keys = ", ".join(e.format(r="expenses") for e in exprs)
+        totals = ", ".join(f"SUM({e.format(r='expenses')})" for _, e in sums)
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c, _ in sums)
+        stmts.append(
+            f"INSERT INTO {table} ({', '.join(cols)}, {', '.join(c for c, _ in sums)}, count) "
+            f"SELECT {keys}, {totals}, COUNT(*) FROM expenses WHERE {where} AND date IS NOT NULL GROUP BY {keys} "
+            f"ON CONFLICT({', '.join(cols)}) DO UPDATE SET {updates}, count = count + excluded.count"
+        )
+    return stmts
+
+# Triggers are dropped and recreated by init_db() so definition changes reach
+# existing databases. Bulk loads (see _bulk_rollups) set rollup_state.suspended
+# inside their transaction and apply one aggregated delta instead.
+ROLLUP_TRIGGERS = f"""
+CREATE TABLE IF NOT EXISTS rollup_state (suspended INTEGER NOT NULL);
+INSERT INTO rollup_state (suspended) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM rollup_state);
+
+DROP TRIGGER IF EXISTS expenses_rollup_insert;
+CREATE TRIGGER expenses_rollup_insert AFTER INSERT ON expenses
+WHEN NOT (SELECT suspended FROM rollup_state)
+BEGIN
+    {_rollup_add_sql("NEW")}
+END;
+
+DROP TRIGGER IF EXISTS expenses_rollup_delete;
+CREATE TRIGGER expenses_rollup_delete AFTER DELETE ON expenses
+BEGIN
+    {_rollup_remove_sql("OLD")}
+END;
+
+DROP TRIGGER IF EXISTS expenses_rollup_update;
+CREATE TRIGGER expenses_rollup_update AFTER UPDATE OF amount_cents, original_amount, currency, category, source, date ON expenses
+BEGIN
+    {_rollup_remove_sql("OLD")}
+    {_rollup_add_sql("NEW")}
+END;
+"""
+
+@contextmanager
+def _bulk_rollups(conn):
+    """Insert-only bulk load: skip the per-row insert trigger and add the new
+    rows to every rollup with one grouped statement per table. Must run inside
+    a write_conn() transaction so the suspension is never visible outside it."""
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM expenses").fetchone()[0]
+    conn.execute("UPDATE rollup_state SET suspended = 1")
+    yield
+    conn.execute("UPDATE rollup_state SET suspended = 0")
+    for stmt in _rollup_fill_sql("id > ?"):
+        conn.execute(stmt, (last_id,))
+
+def _rebuild_rollups(conn):
+    for table, _, _, _ in _ROLLUPS:
+        conn.execute(f"DELETE FROM {table}")
+    for stmt in _rollup_fill_sql("1"):
+        conn.execute(stmt)
+
+def rebuild_rollups():
+    """Recompute every rollup table from the raw expenses rows in one transaction."""
+    with write_conn() as conn:
+        _rebuild_rollups(conn)
+
+# Full-text search over descriptions.
+# expenses_fts mirrors expenses (rowid = expenses.id) and is kept in sync by
+# the triggers below. Synced descriptions look like '[Group] Dinner (INR 500.00)',
+# so the group prefix goes in its own column, weighted below the description.
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 200
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+    description, group_name, category,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+INSERT INTO expenses_fts (expenses_fts, rank) VALUES ('rank', 'bm25(1.0, 0.5, 0.5)');
+"""
+
+_HAS_GROUP = "{r}.description LIKE '[%] %'"
+_FTS_VALUES = (
+    f"CASE WHEN {_HAS_GROUP} THEN substr({{r}}.description, instr({{r}}.description, '] ') + 2) ELSE {{r}}.description END, "
+    f"CASE WHEN {_HAS_GROUP} THEN substr({{r}}.description, 2, instr({{r}}.description, '] ') - 2) END, "
+    "{r}.category"
+)
+
+FTS_TRIGGERS = f"""
+DROP TRIGGER IF EXISTS expenses_fts_insert;
+CREATE TRIGGER expenses_fts_insert AFTER INSERT ON expenses
+BEGIN
+    INSERT INTO expenses_fts (rowid, description, group_name, category) SELECT NEW.id, {_FTS_VALUES.format(r="NEW")};
+END;
+
+DROP TRIGGER IF EXISTS expenses_fts_delete;
+CREATE TRIGGER expenses_fts_delete AFTER DELETE ON expenses
+BEGIN
+    DELETE FROM expenses_fts WHERE rowid = OLD.id;
+END;
+
+DROP TRIGGER IF EXISTS expenses_fts_update;
+CREATE TRIGGER expenses_fts_update AFTER UPDATE OF description, category ON expenses
+BEGIN
+    DELETE FROM expenses_fts WHERE rowid = OLD.id;
+    INSERT INTO expenses_fts (rowid, description, group_name, category) SELECT NEW.id, {_FTS_VALUES.format(r="NEW")};
+END;
+"""
+
+# Recurring charges detected per merchant_key by recurring.py. The triggers
+# queue the merchants whose charges changed in recurring_dirty, and a changed
+# description clears merchant_key so the row is re-keyed, so a refresh only
+# re-examines the merchants touched since the last one.
+RECURRING_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recurring (
+    merchant_key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,                -- latest description, without group/currency decorations
+    category TEXT,
+    cadence TEXT NOT NULL,             -- weekly, biweekly, monthly, quarterly or yearly
+    interval_days REAL NOT NULL,       -- median days between charges
+    amount_cents INTEGER NOT NULL,     -- median charge
+    amount_stable INTEGER NOT NULL,    -- 1 if charges stay within a few percent of the median
+    charges INTEGER NOT NULL,
+    first_date TEXT NOT NULL,
+    last_date TEXT NOT NULL,
+    next_date TEXT NOT NULL,           -- expected next charge
+    due_by TEXT NOT NULL               -- lapsed if nothing was charged by then
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS recurring_dirty (merchant_key TEXT PRIMARY KEY) WITHOUT ROWID;
+
+DROP TRIGGER IF EXISTS expenses_recurring_delete;
+CREATE TRIGGER expenses_recurring_delete AFTER DELETE ON expenses
+WHEN OLD.merchant_key IS NOT NULL
+BEGIN
+    INSERT OR IGNORE INTO recurring_dirty VALUES (OLD.merchant_key);
+END;
+
+DROP TRIGGER IF EXISTS expenses_recurring_rekey;
+CREATE TRIGGER expenses_recurring_rekey AFTER UPDATE OF description ON expenses
+WHEN OLD.merchant_key IS NOT NULL AND NEW.description IS NOT OLD.description
+BEGIN
+    INSERT OR IGNORE INTO recurring_dirty VALUES (OLD.merchant_key);
+    UPDATE expenses SET merchant_key = NULL WHERE id = NEW.id;
+END;
+
+DROP TRIGGER IF EXISTS expenses_recurring_update;
+CREATE TRIGGER expenses_recurring_update AFTER UPDATE OF amount_cents, category, date ON expenses
+WHEN NEW.merchant_key IS NOT NULL
+    AND (NEW.amount_cents IS NOT OLD.amount_cents OR NEW.category IS NOT OLD.category OR NEW.date IS NOT OLD.date)
+BEGIN
+    INSERT OR IGNORE INTO recurring_dirty VALUES (NEW.merchant_key);
+END;
+"""
+
+def _rebuild_fts(conn):
+    conn.execute("DELETE FROM expenses_fts")
+    conn.execute(
+        f"INSERT INTO expenses_fts (rowid, description, group_name, category) "
+        f"SELECT id, {_FTS_VALUES.format(r='expenses')} FROM expenses"
+    )
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted, so FTS5 syntax in user input (AND, NEAR, column:, *) is
+    searched for literally instead of being interpreted.
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text.lower()))
+
+# bm25 ranking costs the same per match, so a word on tens of thousands of rows
+# would take 100ms+; only the most recently added SEARCH_CANDIDATES matches are
+# ranked, and search_expenses says when that cut any off. rowid ranges are
+# pushed down into the FTS index, so the cutoff is cheap.
+SEARCH_CANDIDATES = 1000
+
+SEARCH_FLOOR_SQL = """
+SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH :query ORDER BY rowid DESC LIMIT :candidates + 1
+"""
+
+SEARCH_SQL = """
+SELECT e.id, e.description, e.amount, e.category, e.date, e.source,
+       highlight(expenses_fts, 0, :open, :close) as highlighted
+FROM expenses_fts
+JOIN expenses e ON e.id = expenses_fts.rowid
+WHERE expenses_fts MATCH :query AND expenses_fts.rowid >= :floor
+ORDER BY rank, e.date DESC
+LIMIT :limit
+"""
+
+def search_expenses(text: str, limit: int = SEARCH_LIMIT, mark=("**", "**")):
+    """Expenses whose description, Splitwise group or category match `text`, best first.
+
+    Returns (rows, truncated). `highlighted` is the description (without
+    group prefix) with matched words wrapped in `mark`. truncated is True when
+    more than SEARCH_CANDIDATES rows matched, so only the most recently added
+    of them were ranked.
+    """
+    query = fts_query(text)
+    if not query:
+        return [], False
+    limit = max(1, min(int(limit), MAX_SEARCH_LIMIT))
+    params = {"query": query, "candidates": SEARCH_CANDIDATES}
+    ids = [row[0] for row in get_conn().execute(SEARCH_FLOOR_SQL, params)]
+    truncated = len(ids) > SEARCH_CANDIDATES
+    rows = fetch_rows(SEARCH_SQL, {
+        **params, "open": mark[0], "close": mark[1], "floor": ids[SEARCH_CANDIDATES - 1] if truncated else 0,
+        "limit": limit,
+    })
+    return rows, truncated
+
+def _month_floor(day: str) -> str:
+    return day[:7] + "-01"
+
+def _month_ceil(day: str) -> str:
+    if day.endswith("-01"):
+        return day
+    return _shift_month(_date.fromisoformat(day[:10]), 1).isoformat()
+
+def _split_range(start: str, end: str):
+    """Split [start, end) into raw edge ranges and a month-aligned middle range.
+
+    Returns (edges, middle) where middle is a (start_month, end_month) pair of
+    'YYYY-MM' keys or None when the range doesn't cover a whole month.
+    """
+    lo, hi = _month_ceil(start), _month_floor(end)
+    if lo >= hi:
+        return [(start, end)], None
+    edges = [r for r in ((start, lo), (hi, end)) if r[0] < r[1]]
+    return edges, (lo[:7], hi[:7])
+
+def get_period_totals(start: str, end: str):
+    """Total (dollars) and count of expenses dated in [start, end)."""
+    edges, middle = _split_range(start, end)
+    cents, count = 0, 0
+    for lo, hi in edges:
+        row = get_conn().execute(
+            "SELECT SUM(total_cents), SUM(count) FROM daily_totals WHERE day >= ? AND day < ?", (lo, hi)
+        ).fetchone()
+        cents += row[0] or 0
+        count += row[1] or 0
+    if middle:
+        row = get_conn().execute(
+            "SELECT SUM(total_cents), SUM(count) FROM monthly_totals WHERE month >= ? AND month < ?", middle
+        ).fetchone()
+        cents += row[0] or 0
+        count += row[1] or 0
+    return {"total": to_dollars(cents) if count else None, "count": count}
+
+def _grouped_totals(column: str, raw_sql: str, start: str, end: str, sums=("total_cents",)):
+    """Sum `sums` and count per `column` over [start, end), exactly in minor units.
+
+    Returns dicts of the group key, the sums, count and `total` in dollars,
+    largest first. An empty or NULL key is one group, keyed None.
+    """
+    edges, middle = _split_range(start, end)
+    groups = {}
+    def add(row):
+        g = groups.setdefault(row[column], {column: row[column], **dict.fromkeys(sums, 0), "count": 0})
+        for name in sums:
+            g[name] += row[name]
+        g["count"] += row["count"]
+    for lo, hi in edges:
+        for row in fetch_rows(raw_sql, (lo, hi)):
+            add(row)
+    if middle:
+        rows = fetch_rows(
+            f"""
+            SELECT NULLIF({column}, '') as {column}, {', '.join(f'SUM({c}) as {c}' for c in sums)}, SUM(count) as count
+            FROM monthly_{column}_totals
+            WHERE month >= ? AND month < ?
+            GROUP BY {column}
+            """,
+            middle,
+        )
+        for row in rows:
+            add(row)
+    for g in groups.values():
+        g["total"] = to_dollars(g["total_cents"])
+    return sorted(groups.values(), key=lambda g: g["total_cents"], reverse=True)
+
+def get_category_totals(start: str, end: str):
+    """Per-category totals for [start, end), largest first."""
+    return _grouped_totals("category", CATEGORY_TOTALS_SQL, start, end)
+
+def get_source_totals(start: str, end: str):
+    """Per-source (personal/splitwise) totals for [start, end), largest first."""
+    return _grouped_totals("source", SOURCE_TOTALS_SQL, start, end)
+
+def get_currency_totals(start: str, end: str):
+    """Per-currency totals for [start, end), largest (in dollars) first.
+
+    `original_total` is what was spent in that currency, in its own units.
+    """
+    rows = _grouped_totals("currency", CURRENCY_TOTALS_SQL, start, end, sums=("total_cents", "original_total"))
+    for row in rows:
+        row["original_total"] = from_minor(row["original_total"], row["currency"])
+    return rows
+
+def get_daily_totals(start: str, end: str):
+    """[{date, amount}] per day in [start, end), oldest first."""
+    return [
+        {"date": row["day"], "amount": to_dollars(row["total_cents"])}
+        for row in fetch_rows(
+            "SELECT day, total_cents FROM daily_totals WHERE day >= ? AND day < ? ORDER BY day", (start, end)
+        )
+    ]
+
+def get_monthly_totals(start: str, end: str):
+    """[{date: 'YYYY-MM', amount}] per month in [start, end), oldest first."""
+    edges, middle = _split_range(start, end)
+    months = {}
+    for lo, hi in edges:
+        for row in fetch_rows(
+            "SELECT substr(day, 1, 7) as month, SUM(total_cents) as total_cents FROM daily_totals "
+            "WHERE day >= ? AND day < ? GROUP BY substr(day, 1, 7)",
+            (lo, hi),
+        ):
+            months[row["month"]] = months.get(row["month"], 0) + row["total_cents"]
+    if middle:
+        for row in fetch_rows(
+            "SELECT month, total_cents FROM monthly_totals WHERE month >= ? AND month < ?", middle
+        ):
+            months[row["month"]] = months.get(row["month"], 0) + row["total_cents"]
+    return [{"date": m, "amount": to_dollars(months[m])} for m in sorted(months)]
+
+# Expense list, newest first. Pages are keyset-paginated on (date, id): the
+# next page starts strictly after the last row of the previous one, so SQLite
+# seeks straight to it in the index and page 100 costs the same as page 1.
+EXPENSE_PAGE_SIZE = 50
+MAX_EXPENSE_PAGE_SIZE = 200
+
+EXPENSE_PAGE_SQL = """
+SELECT id, description, amount, currency, original_amount, category, date, source
+FROM expenses
+{where}
+ORDER BY date DESC, id DESC
+LIMIT ?
+"""
+
+def get_expense_page(after=None, limit: int = EXPENSE_PAGE_SIZE, category: str = None, source: str = None,
+                     min_amount: float = None, max_amount: float = None, start: str = None, end: str = None):
+    """One page of expenses matching the filters, newest first.
+
+    `after` is the (date, id) of the last row of the previous page. Dates are
+    filtered on the half-open range [start, end), amounts on the dollar value.
+    Returns (rows, next) where `next` is the (date, id) to pass as `after` for
+    the following page, or None on the last page. original_amount is in
+    `currency` units.
+    """
+    limit = max(1, min(int(limit), MAX_EXPENSE_PAGE_SIZE))
+    conditions, params = [], []
+    for clause, value in (
+        ("category = ?", category),
+        ("source = ?", source),
+        ("date >= ?", start),
+        ("date < ?", end),
+        ("amount_cents >= ?", None if min_amount is None else to_cents(min_amount)),
+        ("amount_cents <= ?", None if max_amount is None else to_cents(max_amount)),
+    ):
+        if value is not None:
+            conditions.append(clause)
+            params.append(value)
+    if after is not None:
+        conditions.append("(date, id) < (?, ?)")
+        params.extend(after)
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    # One extra row tells us whether there is a next page
+    rows = fetch_rows(EXPENSE_PAGE_SQL.format(where=where), (*params, limit + 1))
+    for row in rows:
+        row["original_amount"] = from_minor(row["original_amount"], row["currency"])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1]["date"], rows[-1]["id"])
+
+# Every built-in dashboard read with representative parameters, for the
+# EXPLAIN QUERY PLAN check below.
+DASHBOARD_QUERIES = {
+    "period_total_raw": (PERIOD_TOTAL_SQL, ("2025-01-15", "2025-02-01")),
+    "category_totals_raw": (CATEGORY_TOTALS_SQL, ("2025-01-15", "2025-02-01")),
+    "source_totals_raw": (SOURCE_TOTALS_SQL, ("2025-01-15", "2025-02-01")),
+    "currency_totals_raw": (CURRENCY_TOTALS_SQL, ("2025-01-15", "2025-02-01")),
+    "period_total_daily": ("SELECT SUM(total_cents), SUM(count) FROM daily_totals WHERE day >= ? AND day < ?", ("2025-01-15", "2025-02-01")),
+    "period_total_monthly": ("SELECT SUM(total_cents), SUM(count) FROM monthly_totals WHERE month >= ? AND month < ?", ("2025-01", "2025-12")),
+    "category_totals_monthly": ("SELECT category, SUM(total_cents) FROM monthly_category_totals WHERE month >= ? AND month < ? GROUP BY category", ("2025-01", "2025-12")),
+    "source_totals_monthly": ("SELECT source, SUM(total_cents) FROM monthly_source_totals WHERE month >= ? AND month < ? GROUP BY source", ("2025-01", "2025-12")),
+    "currency_totals_monthly": ("SELECT currency, SUM(total_cents) FROM monthly_currency_totals WHERE month >= ? AND month < ? GROUP BY currency", ("2025-01", "2025-12")),
+    "daily_totals": ("SELECT day, total_cents FROM daily_totals WHERE day >= ? AND day < ? ORDER BY day", ("2025-01-01", "2025-03-01")),
+    "expense_page": (EXPENSE_PAGE_SQL.format(where="WHERE (date, id) < (?, ?)"), ("2025-01-15", 100, 51)),
+    "expense_page_category": (
+        EXPENSE_PAGE_SQL.format(where="WHERE category = ? AND (date, id) < (?, ?)"), ("Food", "2025-01-15", 100, 51),
+    ),
+    "expense_page_source": (
+        EXPENSE_PAGE_SQL.format(where="WHERE source = ? AND date >= ? AND date < ?"), ("splitwise", "2025-01-01", "2025-02-01", 51),
+    ),
+}
+
+def explain_query_plans():
+    """Return {query name: [EXPLAIN QUERY PLAN detail lines]} for DASHBOARD_QUERIES."""
+    plans = {}
+    for name, (sql, params) in DASHBOARD_QUERIES.items():
+        cur = get_conn().execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        plans[name] = [row[3] for row in cur.fetchall()]
+    return plans
+
+def check_query_plans():
+    """Return the dashboard queries whose plan does a full table scan."""
+    return {
+        name: plan
+        for name, plan in explain_query_plans().items()
+        if any(line.startswith("SCAN") and "USING" not in line for line in plan)
+    }
+
+# Amounts are integer minor units: amount_cents is the US-cent value every
+# total is built from, original_amount what was charged in `currency`.
+# `amount` is a virtual (unstored) dollar column for reading and for
+# model-written SQL.
+EXPENSES_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sw_expense_id INTEGER UNIQUE,
+    description TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    currency TEXT NOT NULL DEFAULT 'USD',
+    original_amount INTEGER NOT NULL,  -- in currency's minor units; equals amount_cents for USD
+    category TEXT,
+    source TEXT DEFAULT 'personal',
+    date TEXT DEFAULT CURRENT_TIMESTAMP,
+    import_hash INTEGER,  -- content hash of statement-imported rows
+    fx_estimated INTEGER NOT NULL DEFAULT 0,  -- 1 if amount_cents used a fallback rate (see fx.py)
+    merchant_key TEXT,  -- normalized description (see recurring.py); NULL until recurring.refresh() sets it
+    amount REAL GENERATED ALWAYS AS (amount_cents / 100.0) VIRTUAL
+);
+"""
+
+# Columns added after the original schema, applied to existing databases by
+# init_db() with ALTER TABLE. Indexes on them go in MIGRATED_INDEXES.
+ADDED_COLUMNS = (
+    ("expenses", "import_hash", "INTEGER"),
+    ("expenses", "merchant_key", "TEXT"),
+    ("expenses", "fx_estimated", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+MIGRATED_INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_import_hash ON expenses(import_hash);
+-- Finds rows still to be keyed (merchant_key IS NULL) and covers reading a merchant's charges in date order
+CREATE INDEX IF NOT EXISTS idx_expenses_merchant_date_cents ON expenses(merchant_key, date, amount_cents);
+"""
+
+# Splitwise sync used to store converted dollars and append the original
+# amount to the description, e.g. 'Dinner (INR 500.00)'
+_LEGACY_CURRENCY_SUFFIX = re.compile(r" \(([A-Z]{3}) (-?\d+(?:\.\d+)?)\)$")
+
+def _ensure_column(conn, table: str, column: str, decl: str):
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _migrate_to_cents(conn):
+    """Rebuild a pre-cents expenses table (REAL dollar amounts) in the current layout.
+
+    Dollars are rounded to cents, and a legacy currency suffix on a synced
+    description moves into currency/original_amount. The old table's indexes,
+    triggers and the rollup tables are dropped; init_db() recreates and
+    refills them.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute(EXPENSES_TABLE.format(name="expenses_cents"))
+    rows = []
+    for row in conn.execute(
+        "SELECT id, sw_expense_id, description, amount, category, source, date, import_hash FROM expenses"
+    ):
+        expense_id, sw_id, description, amount, category, source, date, import_hash = row
+        cents = to_cents(amount)
+        currency, original = "USD", cents
+        m = _LEGACY_CURRENCY_SUFFIX.search(description) if source == "splitwise" else None
+        if m:
+            description = description[:m.start()]
+            currency, original = m.group(1), to_minor(m.group(2), m.group(1))
+        rows.append((expense_id, sw_id, description, cents, currency, original, category, source, date, import_hash))
+    conn.executemany(
+        """
+        INSERT INTO expenses_cents (id, sw_expense_id, description, amount_cents, currency, original_amount,
+                                    category, source, date, import_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    conn.execute("DROP TABLE expenses")
+    conn.execute("ALTER TABLE expenses_cents RENAME TO expenses")
+    for table, _, _, _ in _ROLLUPS:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    print(f"💱 Migrated {len(rows)} expenses to integer cents")
 
 def init_db():
-    schema = """
-    CREATE TABLE IF NOT EXISTS expenses (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        sw_expense_id INTEGER UNIQUE,
-        description TEXT NOT NULL,
-        amount REAL NOT NULL,
-        category TEXT,
-        source TEXT DEFAULT 'personal',
-        date TEXT DEFAULT CURRENT_TIMESTAMP
+    schema = EXPENSES_TABLE.format(name="expenses") + """
+    -- Covering index for every period aggregate (range on date, reads category/amount_cents)
+    CREATE INDEX IF NOT EXISTS idx_expenses_date_category_cents ON expenses(date, category, amount_cents);
+    CREATE INDEX IF NOT EXISTS idx_expenses_source_date ON expenses(source, date);
+    -- Keyset pagination of the expense list (newest first, id as tiebreaker).
+    -- idx_expenses_source_date already ends in the rowid, i.e. (source, date, id).
+    CREATE INDEX IF NOT EXISTS idx_expenses_date_id ON expenses(date, id);
+    CREATE INDEX IF NOT EXISTS idx_expenses_category_date_id ON expenses(category, date, id);
+
+    -- Small key/value store for sync cursors (e.g. the Splitwise high-water mark)
+    CREATE TABLE IF NOT EXISTS sync_state (
+        name TEXT PRIMARY KEY,
+        value TEXT
     );
+
+    -- Splitwise group names, so restarts don't re-fetch every group
+    CREATE TABLE IF NOT EXISTS groups (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        fetched_at REAL NOT NULL  -- unix time
+    );
+
+    -- Daily exchange rates from the local feed (see fx.py)
+    CREATE TABLE IF NOT EXISTS fx_rates (
+        currency TEXT NOT NULL,
+        day TEXT NOT NULL,
+        usd_per_unit REAL NOT NULL,  -- one unit of currency in US dollars
+        PRIMARY KEY (currency, day)
+    ) WITHOUT ROWID;
     """
-    with get_conn() as conn:
-        conn.executescript(schema)
+    with write_conn() as conn:
+        has_rollups = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'expenses_rollup_insert'"
+        ).fetchone()
+        has_fts = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses_fts'"
+        ).fetchone()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(expenses)")}
+        if columns:
+            for table, column, decl in ADDED_COLUMNS:
+                _ensure_column(conn, table, column, decl)
+            if "amount_cents" not in columns:
+                _migrate_to_cents(conn)
+                has_rollups = has_fts = False
+        conn.executescript(schema + ROLLUP_SCHEMA + ROLLUP_TRIGGERS + FTS_SCHEMA + FTS_TRIGGERS + RECURRING_SCHEMA)
+        conn.executescript(MIGRATED_INDEXES)
+        if not has_rollups:
+            # First run against an existing database: backfill the rollups
+            _rebuild_rollups(conn)
+        if not has_fts:
+            _rebuild_fts(conn)
 
 def add_personal_expense(description: str, amount: float, category: str = None):
     from datetime import datetime
     today = datetime.now().strftime('%Y-%m-%d')
-    with get_conn() as conn:
+    cents = to_cents(amount)
+    with write_conn() as conn:
         conn.execute(
-            "INSERT INTO expenses (description, amount, category, source, date) VALUES (?, ?, ?, 'personal', ?)",
-            (description, amount, category, today)
+            "INSERT INTO expenses (description, amount_cents, original_amount, category, source, date) "
+            "VALUES (?, ?, ?, ?, 'personal', ?)",
+            (description, cents, cents, category, today)
         )
-        conn.commit()
 
 def list_expenses(limit=10):
     with get_conn() as conn:
         cur = conn.execute(
-            "SELECT id, description, amount, category, source, date FROM expenses ORDER BY date DESC LIMIT ?",
+            "SELECT id, description, amount, category, source, date FROM expenses ORDER BY date DESC, id DESC LIMIT ?",
             (limit,)
         )
         return cur.fetchall()
 
 def delete_expense(expense_id: int):
     """Delete an expense by ID."""
-    with get_conn() as conn:
+    with write_conn() as conn:
         cursor = conn.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
-        conn.commit()
         return cursor.rowcount > 0
 
 def delete_expenses_by_ids(expense_ids: list):
     """Delete multiple expenses by their IDs."""
     if not expense_ids:
         return 0
-    with get_conn() as conn:
+    with write_conn() as conn:
         placeholders = ','.join('?' * len(expense_ids))
         cursor = conn.execute(f"DELETE FROM expenses WHERE id IN ({placeholders})", expense_ids)
-        conn.commit()
         return cursor.rowcount
     
-def add_splitwise_expense(sw_id: int, description: str, amount: float, category: str = None, date: str = None):
-    """Insert a Splitwise expense row into DB (ignores duplicates)."""
-    with get_conn() as conn:
+def add_splitwise_expense(sw_id: int, description: str, amount: float, category: str = None, date: str = None,
+                          currency: str = "USD", original_amount: float = None):
+    """Insert a Splitwise expense row into DB, or update it if it was synced before.
+
+    `amount` is in dollars; `original_amount` (default: amount) in `currency`.
+    """
+    cents = to_cents(amount)
+    original = cents if original_amount is None else to_minor(original_amount, currency)
+    with write_conn() as conn:
         conn.execute(
             """
-            INSERT OR IGNORE INTO expenses (sw_expense_id, description, amount, category, source, date)
-            VALUES (?, ?, ?, ?, 'splitwise', ?)
+            INSERT INTO expenses (sw_expense_id, description, amount_cents, category, source, date, currency, original_amount)
+            VALUES (?, ?, ?, ?, 'splitwise', ?, ?, ?)
+            ON CONFLICT(sw_expense_id) DO UPDATE SET
+                description = excluded.description,
+                amount_cents = excluded.amount_cents,
+                category = excluded.category,
+                date = excluded.date,
+                currency = excluded.currency,
+                original_amount = excluded.original_amount,
+                fx_estimated = 0
             """,
-            (sw_id, description, amount, category, date),
+            (sw_id, description, cents, category, date, currency, original),
         )
-        conn.commit()
 
-def query_db(sql: str):
-    sql_lower = sql.strip().lower()
-    print(sql_lower)
-    if not sql_lower.startswith("select"):
-        return [{"error": "Only SELECT queries are allowed"}]
+UPSERT_CHUNK_SIZE = 500
 
-    forbidden = ["insert", "update", "delete", "drop", "alter", "pragma"]
-    if any(word in sql_lower for word in forbidden):
-        return [{"error": "Unsafe query detected"}]
+def upsert_splitwise_expenses(rows, chunk_size: int = UPSERT_CHUNK_SIZE):
+    """Bulk insert/update mapped Splitwise rows.
 
-    # 🟡 Patch: make category comparisons case-insensitive
-    if "where category =" in sql_lower:
-        sql = sql.replace("WHERE category =", "WHERE LOWER(category) = LOWER")
+    `rows` is any iterable of (sw_id, description, amount_cents, category,
+    date, currency, original_amount, fx_estimated) tuples as produced by
+    mappers.map_expense_to_row and fx.convert_rows. Rows are written with
+    executemany, one transaction per chunk; rows identical to what is stored
+    are skipped. Returns {"inserted": n, "updated": n, "skipped": n}.
+    """
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return counts
+        # Last occurrence wins within a chunk
+        latest = {row[0]: tuple(row) for row in chunk}
+        counts["skipped"] += len(chunk) - len(latest)
+        with write_conn() as conn:
+            placeholders = ','.join('?' * len(latest))
+            existing = {
+                r[0]: r
+                for r in conn.execute(
+                    f"""
+                    SELECT sw_expense_id, description, amount_cents, category, date, currency, original_amount,
+                           fx_estimated
+                    FROM expenses WHERE sw_expense_id IN ({placeholders})
+                    """,
+                    list(latest),
+                )
+            }
+            inserts = [row for sw_id, row in latest.items() if sw_id not in existing]
+            updates = [row for sw_id, row in latest.items() if sw_id in existing and existing[sw_id] != row]
+            with _bulk_rollups(conn):
+                conn.executemany(
+                    """
+                    INSERT INTO expenses (sw_expense_id, description, amount_cents, category, source, date,
+                                          currency, original_amount, fx_estimated)
+                    VALUES (?, ?, ?, ?, 'splitwise', ?, ?, ?, ?)
+                    """,
+                    inserts,
+                )
+            conn.executemany(
+                """
+                UPDATE expenses SET description = ?, amount_cents = ?, category = ?, date = ?,
+                                    currency = ?, original_amount = ?, fx_estimated = ?
+                WHERE sw_expense_id = ?
+                """,
+                [(*row[1:], row[0]) for row in updates],
+            )
+        counts["inserted"] += len(inserts)
+        counts["updated"] += len(updates)
+        counts["skipped"] += len(latest) - len(inserts) - len(updates)
 
-    with get_conn() as con:
-        print("SQL", sql)
-        cur = con.execute(sql)
-        raw_rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        rows = [dict(zip(columns, r)) for r in raw_rows]
+def delete_splitwise_expenses(sw_ids: list, chunk_size: int = UPSERT_CHUNK_SIZE):
+    """Delete synced rows by their Splitwise expense IDs.
 
-    if not rows:
-        return "No results found."
+    IDs are deleted `chunk_size` per statement (keeping under SQLite's
+    bound-variable limit) in one transaction. Returns the number of rows deleted.
+    """
+    sw_ids = list(sw_ids)
+    deleted = 0
+    if not sw_ids:
+        return deleted
+    with write_conn() as conn:
+        for start in range(0, len(sw_ids), chunk_size):
+            chunk = sw_ids[start:start + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            deleted += conn.execute(f"DELETE FROM expenses WHERE sw_expense_id IN ({placeholders})", chunk).rowcount
+    return deleted
 
-    return rows
+IMPORT_CHUNK_SIZE = 5000
+
+def insert_imported_expenses(rows, chunk_size: int = IMPORT_CHUNK_SIZE):
+    """Bulk insert statement-imported rows, skipping ones already imported.
+
+    `rows` is any iterable of (description, amount_cents, category, date,
+    import_hash) tuples of USD expenses; duplicates are detected by the unique import_hash. Written with
+    executemany, one transaction per chunk. Returns {"inserted": n, "duplicates": n}.
+    """
+    counts = {"inserted": 0, "duplicates": 0}
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return counts
+        with write_conn() as conn, _bulk_rollups(conn):
+            cursor = conn.executemany(
+                """
+                INSERT OR IGNORE INTO expenses (description, amount_cents, original_amount, category, source, date, import_hash)
+                VALUES (?1, ?2, ?2, ?3, 'import', ?4, ?5)
+                """,
+                chunk,
+            )
+        counts["inserted"] += cursor.rowcount
+        counts["duplicates"] += len(chunk) - cursor.rowcount
+
+def get_sync_state(name: str, default=None):
+    """Read a persisted sync cursor."""
+    row = get_conn().execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else default
+
+def set_sync_state(name: str, value):
+    """Persist a sync cursor."""
+    with write_conn() as conn:
+        conn.execute(
+            "INSERT INTO sync_state (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name, value),
+        )
+
+def get_group_names(group_ids, max_age: float = None):
+    """Return {group_id: name} for stored groups, ignoring ones older than max_age seconds."""
+    group_ids = list(group_ids)
+    if not group_ids:
+        return {}
+    placeholders = ','.join('?' * len(group_ids))
+    sql = f"SELECT id, name FROM groups WHERE id IN ({placeholders})"
+    params = group_ids
+    if max_age is not None:
+        sql += " AND fetched_at >= ?"
+        params = group_ids + [time.time() - max_age]
+    return dict(get_conn().execute(sql, params).fetchall())
+
+def save_group_names(names: dict):
+    """Store {group_id: name} with the current time as fetch time."""
+    if not names:
+        return
+    now = time.time()
+    with write_conn() as conn:
+        conn.executemany(
+            """
+            INSERT INTO groups (id, name, fetched_at) VALUES (?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET name = excluded.name, fetched_at = excluded.fetched_at
+            """,
+            [(group_id, name, now) for group_id, name in names.items()],
+        )
+
+def query_db(sql: str, max_rows: int = QUERY_ROW_LIMIT, time_limit: float = QUERY_TIME_LIMIT_S):
+    """Run model-written SQL in the sandbox and return up to max_rows rows as dicts.
+
+    Raises QueryError if the statement does anything but read the expense
+    tables, runs past `time_limit` seconds, or returns more than max_rows rows.
+    """
+    conn = _sandbox_conn()
+    deadline = time.monotonic() + time_limit
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+    cur = None
+    try:
+        cur = conn.execute(sql)
+        if cur.description is None:
+            raise QueryError("rejected", "Only SELECT queries are allowed")
+        rows = cur.fetchmany(max_rows + 1)
+    except (sqlite3.Error, sqlite3.Warning) as e:
+        message = str(e)
+        if message == "interrupted":
+            raise QueryError("time_limit", f"Query stopped after {time_limit:g}s; narrow the date range or aggregate") from None
+        if "not authorized" in message or "prohibited" in message:
+            raise QueryError("rejected", "Only SELECT queries on the expense tables are allowed") from None
+        raise QueryError("invalid", message) from None
+    finally:
+        conn.set_progress_handler(None, 0)
+        if cur is not None:
+            cur.close()
+
+    if len(rows) > max_rows:
+        raise QueryError("row_limit", f"Query returned more than {max_rows} rows; add a LIMIT or aggregate")
+    columns = [desc[0] for desc in cur.description]
+    return [dict(zip(columns, r)) for r in rows]
 
 def get_spending_by_category(period: str = "month"):
     """Get spending grouped by category for a given period."""
     period_map = {
-        "week": "-7 days",
-        "month": "start of month",
-        "year": "start of year"
+        "week": "week",
+        "month": "this_month",
+        "year": "this_year"
     }
     
-    period_filter = period_map.get(period, "start of month")
-    
-    sql = f"""
-    SELECT category, SUM(amount) as total, COUNT(*) as count
-    FROM expenses 
-    WHERE date >= date('now', '{period_filter}')
-    GROUP BY category 
-    ORDER BY total DESC
-    """
-    
-    with get_conn() as con:
-        cur = con.execute(sql)
-        raw_rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        rows = [dict(zip(columns, r)) for r in raw_rows]
-    
-    return rows
+    start, end = period_range(period_map.get(period, "this_month"))
+    return get_category_totals(start, end)
 
 def get_monthly_comparison(period1: str = "this_month", period2: str = "last_month"):
     """Compare spending between two periods."""
-    period_sql = {
-        "this_month": "strftime('%Y-%m', date) = strftime('%Y-%m', 'now')",
-        "last_month": "strftime('%Y-%m', date) = strftime('%Y-%m', 'now', '-1 month')",
-        "this_year": "strftime('%Y', date) = strftime('%Y', 'now')",
-        "last_year": "strftime('%Y', date) = strftime('%Y', 'now', '-1 year')"
-    }
-    
-    sql1 = f"SELECT SUM(amount) as total FROM expenses WHERE {period_sql.get(period1, period_sql['this_month'])}"
-    sql2 = f"SELECT SUM(amount) as total FROM expenses WHERE {period_sql.get(period2, period_sql['last_month'])}"
+    valid = ("this_month", "last_month", "this_year", "last_year")
+    range1 = period_range(period1 if period1 in valid else "this_month")
+    range2 = period_range(period2 if period2 in valid else "last_month")
     
-    with get_conn() as con:
-        cur1 = con.execute(sql1)
-        total1 = cur1.fetchone()[0] or 0
-        
-        cur2 = con.execute(sql2)
-        total2 = cur2.fetchone()[0] or 0
+    total1 = get_period_totals(*range1)["total"] or 0
+    total2 = get_period_totals(*range2)["total"] or 0
     
     if total2 > 0:
         change_pct = ((total1 - total2) / total2) * 100
@@ -162,50 +1172,27 @@ def get_spending_trends(period: str = "month"):
     """Get spending trends over the specified period."""
     try:
         if period == "week":
-            sql = """
-            SELECT date(date) as day, SUM(amount) as total
-            FROM expenses
-            WHERE date >= date('now', '-7 days')
-            GROUP BY date(date)
-            ORDER BY day DESC
-            """
+            rows = get_daily_totals(*period_range("week"))
         elif period == "year":
-            sql = """
-            SELECT strftime('%Y-%m', date) as month, SUM(amount) as total
-            FROM expenses
-            WHERE date >= date('now', '-12 months')
-            GROUP BY strftime('%Y-%m', date)
-            ORDER BY month DESC
-            """
+            rows = get_monthly_totals(*period_range("year"))
         else:  # month
-            sql = """
-            SELECT strftime('%Y-%m-%d', date) as day, SUM(amount) as total
-            FROM expenses
-            WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-            GROUP BY strftime('%Y-%m-%d', date)
-            ORDER BY day DESC
-            LIMIT 10
-            """
-        
-        with get_conn() as con:
-            cur = con.execute(sql)
-            raw_rows = cur.fetchall()
-            columns = [desc[0] for desc in cur.description]
-            rows = [dict(zip(columns, r)) for r in raw_rows]
+            rows = get_daily_totals(*period_range("this_month"))[-10:]
+        # Most recent first
+        rows.reverse()
         
         if not rows:
             return f"No spending data found for the {period} period. Try adding some expenses first!"
         
         # Format output
-        total = sum(r['total'] for r in rows if r['total'])
+        total = sum_dollars(r['amount'] for r in rows)
         avg = total / len(rows) if rows else 0
         
         result = f"Spending trends ({period}):\n"
         result += f"Total: ${total:.2f}, Average: ${avg:.2f}/day\n"
         result += "Recent activity:\n"
         for r in rows[:5]:
-            day_val = r.get('day') or r.get('month', 'Unknown')
-            amount = r.get('total', 0)
+            day_val = r.get('date', 'Unknown')
+            amount = r.get('amount') or 0
             result += f"  {day_val}: ${amount:.2f}\n"
         
         return result
@@ -215,27 +1202,12 @@ def get_spending_trends(period: str = "month"):
 def get_category_breakdown():
     """Get category breakdown with percentages for current month."""
     try:
-        sql = """
-        SELECT 
-            category,
-            SUM(amount) as total,
-            COUNT(*) as count
-        FROM expenses
-        WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-        GROUP BY category
-        ORDER BY total DESC
-        """
-        
-        with get_conn() as con:
-            cur = con.execute(sql)
-            raw_rows = cur.fetchall()
-            columns = [desc[0] for desc in cur.description]
-            rows = [dict(zip(columns, r)) for r in raw_rows]
+        rows = get_category_totals(*period_range("this_month"))
         
         if not rows:
             return "No expenses found for this month. Add some expenses to see the breakdown!"
         
-        total = sum(r['total'] for r in rows if r['total'])
+        total = to_dollars(sum(r['total_cents'] for r in rows))
         
         result = f"Category Breakdown (This Month - Total: ${total:.2f}):\n"
         for r in rows:
@@ -248,5 +1220,18 @@ def get_category_breakdown():
         return f"Error analyzing categories: {str(e)}"
 
 if __name__ == "__main__":
+    import sys
     init_db()
-    print("Database ready.")
+    if "--check-plans" in sys.argv:
+        for name, plan in explain_query_plans().items():
+            print(f"{name}: {' / '.join(plan)}")
+        scans = check_query_plans()
+        if scans:
+            print(f"❌ Full table scans in: {', '.join(scans)}")
+            sys.exit(1)
+        print("✅ All dashboard queries use an index.")
+    elif "--rebuild-rollups" in sys.argv:
+        rebuild_rollups()
+        print("✅ Rollup tables rebuilt.")
+    else:
+        print("Database ready.")
@@ -1,11 +1,38 @@
 import { useState, useRef, useEffect } from 'react'
 import { Send, MessageSquare } from 'lucide-react'
-import axios from 'axios'
+
+// The backend keeps one conversation per session id; reuse it across reloads
+const SESSION_KEY = 'chatSessionId'
+
+// Parse a Server-Sent Events stream into (event, data) callbacks
+async function readEvents(response, onEvent) {
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let boundary
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      let event = 'message'
+      let data = ''
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7)
+        else if (line.startsWith('data: ')) data += line.slice(6)
+      }
+      if (data) onEvent(event, JSON.parse(data))
+    }
+  }
+}
 
 export default function Chat({ onExpenseAdded, onResultsUpdate }) {
   const [messages, setMessages] = useState([])
   const [input, setInput] = useState('')
   const [loading, setLoading] = useState(false)
+  const [status, setStatus] = useState(null)
   const messagesEndRef = useRef(null)
 
   const scrollToBottom = () => {
@@ -24,26 +51,57 @@ export default function Chat({ onExpenseAdded, onResultsUpdate }) {
     setMessages(prev => [...prev, { role: 'user', content: userMessage }])
     setLoading(true)
 
+    // Streamed reply is written into this placeholder as tokens arrive
+    setMessages(prev => [...prev, { role: 'assistant', content: '' }])
+    const updateReply = (update) => setMessages(prev => {
+      const next = [...prev]
+      next[next.length - 1] = { ...next[next.length - 1], ...update }
+      return next
+    })
+
     try {
-      const response = await axios.post('http://localhost:8000/chat', {
-        message: userMessage
+      const response = await fetch('http://localhost:8000/chat/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          message: userMessage,
+          session_id: localStorage.getItem(SESSION_KEY)
+        })
+      })
+      if (!response.ok) throw new Error(`HTTP ${response.status}`)
+
+      let reply = ''
+      await readEvents(response, (event, data) => {
+        if (event === 'session') {
+          localStorage.setItem(SESSION_KEY, data.session_id)
+        } else if (event === 'token') {
+          reply += data.text
+          updateReply({ content: reply })
+          setStatus(null)
+        } else if (event === 'tool_start') {
+          // Text before a tool call is the model thinking aloud; the answer comes after
+          reply = ''
+          updateReply({ content: '' })
+          setStatus(`Running ${data.name.replace(/_/g, ' ')}…`)
+        } else if (event === 'tool_end') {
+          setStatus(null)
+        } else if (event === 'done') {
+          updateReply({ content: data.response })
+          // Update results panel with structured data
+          if (data.data && data.data_type) {
+            onResultsUpdate?.(data.data, data.data_type)
+          }
+        } else if (event === 'error') {
+          updateReply({ content: data.message })
+        }
       })
-      
-      setMessages(prev => [...prev, { role: 'assistant', content: response.data.response }])
-      
-      // Update results panel with structured data
-      if (response.data.data && response.data.data_type) {
-        onResultsUpdate?.(response.data.data, response.data.data_type)
-      }
       
       // Always refresh overview after any query (to show updated stats)
       onExpenseAdded?.()
     } catch (error) {
-      setMessages(prev => [...prev, { 
-        role: 'assistant', 
-        content: '❌ Error: ' + error.message 
-      }])
+      updateReply({ content: '❌ Error: ' + error.message })
     } finally {
+      setStatus(null)
       setLoading(false)
     }
   }
@@ -93,7 +151,7 @@ export default function Chat({ onExpenseAdded, onResultsUpdate }) {
           </div>
         )}
         
-        {messages.map((msg, idx) => (
+        {messages.map((msg, idx) => msg.content && (
           <div
             key={idx}
             className={`flex ${msg.role === 'user' ? 'justify-end' : 'justify-start'}`}
@@ -110,13 +168,14 @@ export default function Chat({ onExpenseAdded, onResultsUpdate }) {
           </div>
         ))}
         
-        {loading && (
+        {loading && (status || !messages[messages.length - 1]?.content) && (
           <div className="flex justify-start">
             <div className="bg-gray-100 rounded-lg px-4 py-2">
-              <div className="flex gap-1">
+              <div className="flex items-center gap-1">
                 <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '0ms' }}></div>
                 <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '150ms' }}></div>
                 <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '300ms' }}></div>
+                {status && <span className="ml-2 text-xs text-gray-500">{status}</span>}
               </div>
             </div>
           </div>
@@ -2,25 +2,48 @@ import { useState, useEffect } from 'react'
 import { Receipt } from 'lucide-react'
 import axios from 'axios'
 
+const PAGE_SIZE = 20
+const EMPTY_FILTERS = { category: '', source: '', min_amount: '', max_amount: '', start: '', end: '' }
+
 export default function ExpenseList() {
   const [expenses, setExpenses] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
+  const [filters, setFilters] = useState(EMPTY_FILTERS)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
-    fetchExpenses()
-  }, [])
+    setLoading(true)
+    fetchExpenses(null)
+  }, [filters])
 
-  const fetchExpenses = async () => {
+  const fetchExpenses = async (cursor) => {
     try {
-      const response = await axios.get('http://localhost:8000/expenses?limit=10')
-      setExpenses(response.data)
+      const params = { limit: PAGE_SIZE }
+      for (const [key, value] of Object.entries(filters)) {
+        if (value !== '') params[key] = value
+      }
+      if (cursor) params.cursor = cursor
+      const response = await axios.get('http://localhost:8000/expenses', { params })
+      setExpenses((prev) => (cursor ? [...prev, ...response.data.items] : response.data.items))
+      setNextCursor(response.data.next_cursor)
     } catch (error) {
       console.error('Error fetching expenses:', error)
     } finally {
       setLoading(false)
+      setLoadingMore(false)
     }
   }
 
+  const loadMore = () => {
+    setLoadingMore(true)
+    fetchExpenses(nextCursor)
+  }
+
+  const updateFilter = (key) => (e) => setFilters((prev) => ({ ...prev, [key]: e.target.value }))
+
+  const inputClass = 'px-2 py-1 text-sm border border-gray-300 rounded focus:outline-none focus:ring-2 focus:ring-blue-500'
+
   if (loading) {
     return (
       <div className="bg-white rounded-xl shadow-sm border border-gray-200 p-6">
@@ -40,6 +63,24 @@ export default function ExpenseList() {
           <Receipt className="w-5 h-5 text-gray-600" />
           <h2 className="text-lg font-semibold text-gray-900">Recent Expenses</h2>
         </div>
+        <div className="flex flex-wrap gap-2 mt-3">
+          <input type="text" placeholder="Category" value={filters.category} onChange={updateFilter('category')} className={inputClass} />
+          <select value={filters.source} onChange={updateFilter('source')} className={inputClass}>
+            <option value="">All sources</option>
+            <option value="personal">Personal</option>
+            <option value="splitwise">Splitwise</option>
+            <option value="import">Imported</option>
+          </select>
+          <input type="number" placeholder="Min $" value={filters.min_amount} onChange={updateFilter('min_amount')} className={`${inputClass} w-24`} />
+          <input type="number" placeholder="Max $" value={filters.max_amount} onChange={updateFilter('max_amount')} className={`${inputClass} w-24`} />
+          <input type="date" value={filters.start} onChange={updateFilter('start')} className={inputClass} title="From" />
+          <input type="date" value={filters.end} onChange={updateFilter('end')} className={inputClass} title="Before" />
+          {Object.values(filters).some((value) => value !== '') && (
+            <button onClick={() => setFilters(EMPTY_FILTERS)} className="text-sm text-blue-600 hover:underline">
+              Clear
+            </button>
+          )}
+        </div>
       </div>
       
       <div className="divide-y divide-gray-100">
@@ -65,6 +106,11 @@ export default function ExpenseList() {
                   <p className="text-lg font-semibold text-gray-900">
                     ${parseFloat(expense.amount).toFixed(2)}
                   </p>
+                  {expense.currency && expense.currency !== 'USD' && (
+                    <p className="text-xs text-gray-500">
+                      {expense.currency} {Number(expense.original_amount).toLocaleString()}
+                    </p>
+                  )}
                 </div>
               </div>
             </div>
@@ -76,6 +122,18 @@ export default function ExpenseList() {
           </div>
         )}
       </div>
+
+      {nextCursor && (
+        <div className="px-6 py-3 border-t border-gray-200 text-center">
+          <button
+            onClick={loadMore}
+            disabled={loadingMore}
+            className="text-sm font-medium text-blue-600 hover:underline disabled:text-gray-400"
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
     </div>
   )
 }
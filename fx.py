@@ -0,0 +1,206 @@
+import argparse
+import csv
+import os
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import groupby
+
+from db import OPEN_END, get_conn, write_conn, get_sync_state, set_sync_state
+from mappers import normalize_statement_date
+from money import BASE_CURRENCY, minor_digits
+
+# Daily exchange rates live in fx_rates (see db.init_db) and come from a local
+# CSV feed with columns date,currency,usd_per_unit (one unit of `currency` in
+# US dollars). The feed is re-read whenever the file changes.
+FX_RATES_PATH = os.getenv("FX_RATES_PATH", "fx_rates.csv")
+FX_FEED_STATE = "fx_feed_mtime"
+RATE_CHUNK_SIZE = 5000
+# Last resort for a currency the feed has no rates for (the static table sync
+# used before the feed). Rows converted with these are stored with
+# fx_estimated = 1 and re-converted once the feed has the currency.
+FALLBACK_USD_PER_UNIT = {
+    "INR": 0.012,
+    "EUR": 1.08,
+    "GBP": 1.27,
+    "CAD": 0.73,
+}
+_ONE = Decimal(1)
+
+def _cents_factor(currency: str, usd_per_unit) -> Decimal:
+    """US cents per minor unit of `currency`"""
+    return Decimal(str(usd_per_unit)).scaleb(2 - minor_digits(currency))
+
+def _to_cents(original_amount: int, factor: Decimal) -> int:
+    return int((original_amount * factor).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+def convert(original_amount: int, currency: str, usd_per_unit) -> int:
+    """Minor units of `currency` to US cents at `usd_per_unit`, rounded half up."""
+    return _to_cents(original_amount, _cents_factor(currency, usd_per_unit))
+
+def _rates_for(currencies, until: str):
+    """{currency: ([day, ...], [rate, ...])} sorted by day, up to `until`, from one query"""
+    currencies = sorted(currencies)
+    if not currencies:
+        return {}
+    placeholders = ",".join("?" * len(currencies))
+    cur = get_conn().execute(
+        f"""
+        SELECT currency, day, usd_per_unit FROM fx_rates
+        WHERE currency IN ({placeholders}) AND day <= ?
+        ORDER BY currency, day
+        """,
+        (*currencies, until),
+    )
+    rates = {}
+    for currency, rows in groupby(cur, key=lambda r: r[0]):
+        days, values = [], []
+        for _, day, rate in rows:
+            days.append(day)
+            values.append(rate)
+        rates[currency] = (days, values)
+    return rates
+
+def usd_cents(items):
+    """Convert (currency, date, original_amount) items to US cents in one as-of join.
+
+    Each item gets the latest rate dated on or before its date, or the
+    currency's earliest rate for dates before the feed starts. Items are
+    sorted by (currency, date) and merged against the rates sorted the same
+    way, so a batch costs one query and one pass. Undated items get the
+    latest rate. Returns a list aligned with `items`, with None where the
+    currency has no rates at all.
+    """
+    result = []
+    foreign = []
+    for i, (currency, day, original) in enumerate(items):
+        if currency == BASE_CURRENCY:
+            result.append(original)
+        else:
+            result.append(None)
+            foreign.append((currency, (day or OPEN_END)[:10], i, original))
+    if not foreign:
+        return result
+    foreign.sort()
+    rates = _rates_for({item[0] for item in foreign}, max(item[1] for item in foreign))
+    for currency, group in groupby(foreign, key=lambda item: item[0]):
+        if currency not in rates:
+            continue
+        days, values = rates[currency]
+        pos, factor = 0, _cents_factor(currency, values[0])
+        for _, day, i, original in group:
+            if pos + 1 < len(days) and days[pos + 1] <= day:
+                while pos + 1 < len(days) and days[pos + 1] <= day:
+                    pos += 1
+                factor = _cents_factor(currency, values[pos])
+            result[i] = _to_cents(original, factor)
+    return result
+
+def convert_rows(rows):
+    """Fill in amount_cents for mapped Splitwise rows (see mappers.map_expense_to_row).
+
+    Returns (converted rows, skipped rows). Converted rows gain a trailing
+    fx_estimated flag, set when FALLBACK_USD_PER_UNIT stood in for the feed.
+    Rows in a currency with neither are skipped rather than guessed.
+    """
+    rows = list(rows)
+    cents = usd_cents((row[5], row[4], row[6]) for row in rows)
+    converted, skipped = [], []
+    for row, amount_cents in zip(rows, cents):
+        estimated = 0
+        if amount_cents is None and row[5] in FALLBACK_USD_PER_UNIT:
+            amount_cents, estimated = convert(row[6], row[5], FALLBACK_USD_PER_UNIT[row[5]]), 1
+        if amount_cents is None:
+            skipped.append(row)
+        else:
+            converted.append((row[0], row[1], amount_cents, *row[3:], estimated))
+    return converted, skipped
+
+def read_feed(path: str):
+    """Yield (currency, day, usd_per_unit) from a rate feed CSV"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for rec in csv.DictReader(f):
+            rec = {k.strip().lower(): (v or "").strip() for k, v in rec.items() if k}
+            rate = rec.get("usd_per_unit") or rec.get("rate")
+            if not rate or not rec.get("currency") or not rec.get("date"):
+                continue
+            yield rec["currency"].upper(), normalize_statement_date(rec["date"]), float(rate)
+
+def store_rates(rates):
+    """Upsert (currency, day, usd_per_unit) rates; returns {currency: earliest changed day}"""
+    latest = {(currency, day): rate for currency, day, rate in rates}
+    currencies = sorted({currency for currency, _ in latest})
+    if not currencies:
+        return {}
+    placeholders = ",".join("?" * len(currencies))
+    stored = {
+        (currency, day): rate
+        for currency, day, rate in get_conn().execute(
+            f"SELECT currency, day, usd_per_unit FROM fx_rates WHERE currency IN ({placeholders})", currencies
+        )
+    }
+    changes = sorted((key, rate) for key, rate in latest.items() if stored.get(key) != rate)
+    for start in range(0, len(changes), RATE_CHUNK_SIZE):
+        with write_conn() as conn:
+            conn.executemany(
+                """
+                INSERT INTO fx_rates (currency, day, usd_per_unit) VALUES (?, ?, ?)
+                ON CONFLICT(currency, day) DO UPDATE SET usd_per_unit = excluded.usd_per_unit
+                """,
+                [(currency, day, rate) for (currency, day), rate in changes[start:start + RATE_CHUNK_SIZE]],
+            )
+    changed = {}
+    for (currency, day), _ in changes:
+        changed.setdefault(currency, day)  # sorted, so the first is the earliest
+    return changed
+
+def recompute(currency: str, since: str = None):
+    """Re-convert stored `currency` expenses dated on or after `since` (all if None).
+
+    Only rows whose USD value changed, or that used a fallback rate, are
+    written; the rollup triggers move their totals. Returns the number of
+    rows updated.
+    """
+    sql = "SELECT id, date, original_amount, amount_cents, fx_estimated FROM expenses WHERE currency = ?"
+    params = [currency]
+    if since is not None:
+        # A new earliest rate also changes the dates before it (see usd_cents)
+        earliest = get_conn().execute("SELECT MIN(day) FROM fx_rates WHERE currency = ?", (currency,)).fetchone()[0]
+        if earliest is None or since > earliest:
+            sql += " AND date >= ?"
+            params.append(since)
+    rows = get_conn().execute(sql, params).fetchall()
+    cents = usd_cents((currency, day, original) for _, day, original, _, _ in rows)
+    updates = [(new, row[0]) for row, new in zip(rows, cents) if new is not None and (new != row[3] or row[4])]
+    if updates:
+        with write_conn() as conn:
+            conn.executemany("UPDATE expenses SET amount_cents = ?, fx_estimated = 0 WHERE id = ?", updates)
+    return len(updates)
+
+def load_rates(rates):
+    """Store rates and re-convert the expenses they affect. Returns (currencies changed, rows updated)."""
+    changed = store_rates(rates)
+    updated = sum(recompute(currency, since) for currency, since in changed.items())
+    return len(changed), updated
+
+def refresh_from_feed(path: str = FX_RATES_PATH, force: bool = False):
+    """Load the rate feed if it changed since the last load. Returns rows updated, or None if skipped."""
+    if not os.path.exists(path):
+        return None
+    mtime = str(os.path.getmtime(path))
+    if not force and get_sync_state(FX_FEED_STATE) == mtime:
+        return None
+    currencies, updated = load_rates(read_feed(path))
+    set_sync_state(FX_FEED_STATE, mtime)
+    print(f"💱 Loaded FX rates from {path}: {currencies} currencies changed, {updated} expenses re-converted")
+    return updated
+
+if __name__ == "__main__":
+    from db import init_db
+    parser = argparse.ArgumentParser(description="Load daily FX rates and re-convert stored expenses")
+    parser.add_argument("path", nargs="?", default=FX_RATES_PATH, help="CSV with date,currency,usd_per_unit")
+    parser.add_argument("--recompute", metavar="CURRENCY", help="re-convert every expense in CURRENCY")
+    args = parser.parse_args()
+    init_db()
+    if args.recompute:
+        print(f"✅ Re-converted {recompute(args.recompute.upper())} expenses")
+    else:
+        refresh_from_feed(args.path, force=True)
@@ -1,17 +1,8 @@
 # whoami.py
-import os, requests
-from dotenv import load_dotenv
-
-load_dotenv()
-
-BASE_URL = "https://secure.splitwise.com/api/v3.0"
-TOKEN = os.getenv("SPLITWISE_ACCESS_TOKEN")
-HEADERS = {"Authorization": f"Bearer {TOKEN}"}
+from splitwise_client import client
 
 def get_current_user():
-    r = requests.get(f"{BASE_URL}/get_current_user", headers=HEADERS)
-    r.raise_for_status()
-    return r.json()
+    return client.get("get_current_user")
 
 if __name__ == "__main__":
     me = get_current_user()["user"]
@@ -1,13 +1,7 @@
+import re
 from datetime import datetime
-
-# Approximate conversion rates (you can update these or use an API)
-CURRENCY_TO_USD = {
-    "USD": 1.0,
-    "INR": 0.012,  # 1 INR ≈ $0.012 USD
-    "EUR": 1.08,
-    "GBP": 1.27,
-    "CAD": 0.73,
-}
+from functools import lru_cache
+from money import to_minor
 
 def normalize_date(iso_str: str) -> str:
     """
@@ -20,8 +14,66 @@ def normalize_date(iso_str: str) -> str:
     dt = datetime.fromisoformat(iso_str.replace("Z", ""))
     return dt.strftime("%Y-%m-%d")   # or "%Y-%m-%d %H:%M:%S" if you want time
 
+# Date layouts seen in bank/credit-card exports, tried in order after ISO 8601.
+# US month-first wins over day-first for ambiguous dates; pass date_format to override.
+STATEMENT_DATE_FORMATS = (
+    "%m/%d/%Y", "%m/%d/%y", "%d/%m/%Y", "%d/%m/%y", "%m-%d-%Y", "%d.%m.%Y",
+    "%Y/%m/%d", "%Y%m%d", "%d %b %Y", "%d-%b-%Y", "%b %d, %Y", "%B %d, %Y",
+)
+
+@lru_cache(maxsize=4096)  # statements repeat the same few hundred dates
+def normalize_statement_date(raw: str, date_format: str = None) -> str:
+    """
+    Convert a statement date ('2025-09-22', '09/22/2025', OFX '20250922120000[-5:EST]', ...)
+    into SQLite-friendly format 'YYYY-MM-DD'. Raises ValueError if it can't be parsed.
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        raise ValueError("missing date")
+    if date_format:
+        return datetime.strptime(raw, date_format).strftime("%Y-%m-%d")
+    try:
+        return normalize_date(raw)
+    except ValueError:
+        pass
+    # OFX timestamps: YYYYMMDD[HHMMSS[.XXX]][TZ]
+    if re.match(r"^\d{8}", raw):
+        return datetime.strptime(raw[:8], "%Y%m%d").strftime("%Y-%m-%d")
+    for fmt in STATEMENT_DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognized date '{raw}'")
+
+def normalize_amount(raw) -> float:
+    """
+    Parse a statement amount ('1,234.56', '$12.00', '(45.10)', '-3.5', '12.00 CR')
+    into a float. Parentheses and a CR suffix mean negative. Raises ValueError.
+    """
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    text = (raw or "").strip().upper()
+    if not text:
+        raise ValueError("missing amount")
+    negative = False
+    if text.startswith("(") and text.endswith(")"):
+        negative, text = True, text[1:-1]
+    if text.endswith("CR"):
+        negative, text = True, text[:-2]
+    elif text.endswith("DR"):
+        text = text[:-2]
+    text = re.sub(r"[^0-9.\-+]", "", text)
+    value = float(text)
+    return -value if negative else value
+
 def map_expense_to_row(e, my_user_id: int, group_name: str = None):
-    """Convert Splitwise expense JSON into (sw_id, desc, amount, category, date)."""
+    """Convert Splitwise expense JSON into (sw_id, desc, amount_cents, category, date, currency, original_amount).
+
+    original_amount is what was charged, in the currency's minor units.
+    amount_cents is the USD value in cents for USD expenses and None for
+    other currencies; fx.convert_rows fills it in at the expense date's rate.
+    """
     sw_id = e.get("id")
     desc = e.get("description", "No description")
     category = e.get("category", {}).get("name") if e.get("category") else None
@@ -31,25 +83,23 @@ def map_expense_to_row(e, my_user_id: int, group_name: str = None):
     date = normalize_date(raw_date)
 
     # Get currency code
-    currency_code = e.get("currency_code", "USD")
+    currency_code = e.get("currency_code") or "USD"
 
     # Default: total cost
-    amount = float(e.get("cost", 0.0))
+    amount = e.get("cost") or "0"
 
     # Override with my owed share
     for u in e.get("users", []):
         if u.get("user_id") == my_user_id:
-            amount = float(u.get("owed_share", 0.0))
+            amount = u.get("owed_share") or "0"
             break
 
-    # Convert to USD if needed
-    if currency_code != "USD":
-        conversion_rate = CURRENCY_TO_USD.get(currency_code, 1.0)
-        amount = amount * conversion_rate
-        desc = f"{desc} ({currency_code} {amount/conversion_rate:.2f})"  # Show original amount
+    # Splitwise sends amounts as decimal strings; keep them exact
+    original_amount = to_minor(amount, currency_code)
+    amount_cents = original_amount if currency_code == "USD" else None
 
     # Add group name if provided
     if group_name:
         desc = f"[{group_name}] {desc}"
 
-    return (sw_id, desc, amount, category, date)
\ No newline at end of file
+    return (sw_id, desc, amount_cents, category, date, currency_code, original_amount)
@@ -0,0 +1,36 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Amounts are stored as integers in the currency's minor unit: USD amounts in
+# cents, a JPY amount in yen. Currencies whose minor unit isn't 1/100 are
+# listed here; everything else has two decimals.
+MINOR_UNIT_DIGITS = {
+    "BIF": 0, "CLP": 0, "ISK": 0, "JPY": 0, "KRW": 0, "PYG": 0, "UGX": 0, "VND": 0, "XAF": 0, "XOF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+}
+BASE_CURRENCY = "USD"
+
+def minor_digits(currency: str) -> int:
+    return MINOR_UNIT_DIGITS.get((currency or BASE_CURRENCY).upper(), 2)
+
+def to_minor(amount, currency: str = BASE_CURRENCY) -> int:
+    """Round a decimal amount (str, float, int or Decimal) to whole minor units, half away from zero.
+
+    Floats go through their shortest repr, so 19.99 becomes 1999 rather than
+    1998.9999... truncated.
+    """
+    value = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+    return int(value.scaleb(minor_digits(currency)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_minor(units: int, currency: str = BASE_CURRENCY) -> float:
+    """Minor units back to a decimal amount for display or JSON."""
+    return units / 10 ** minor_digits(currency)
+
+def to_cents(dollars) -> int:
+    return to_minor(dollars, BASE_CURRENCY)
+
+def to_dollars(cents: int) -> float:
+    return from_minor(cents, BASE_CURRENCY)
+
+def sum_dollars(values) -> float:
+    """Add dollar amounts exactly by summing them as cents."""
+    return to_dollars(sum(to_cents(v) for v in values))
@@ -0,0 +1,195 @@
+import functools
+import re
+import statistics
+from datetime import date, timedelta
+from itertools import groupby, islice
+
+from db import get_conn, write_conn
+from money import to_dollars
+
+# Recurring charges (subscriptions, rent, bills) found from the expense
+# history. Each expense gets a merchant key: its description with the
+# decorations and noise that differ between charges of the same merchant
+# stripped. A merchant's charges, read in date order, are recurring when the
+# gaps between them settle on one of the CADENCES.
+
+# (name, days, tolerance in days)
+CADENCES = (
+    ("weekly", 7, 1),
+    ("biweekly", 14, 2),
+    ("monthly", 30.44, 4),
+    ("quarterly", 91.3, 8),
+    ("yearly", 365.25, 15),
+)
+MIN_CHARGES = 3
+MIN_YEARLY_CHARGES = 2
+# Only the latest charges decide the cadence, so a plan change doesn't hide a subscription
+RECENT_CHARGES = 12
+# Share of recent gaps that must fall within the cadence's tolerance
+MIN_REGULAR_SHARE = 0.75
+# A charge counts as the usual amount within this fraction of the median
+AMOUNT_TOLERANCE = 0.05
+MERCHANT_KEY_WORDS = 3
+KEY_CHUNK_SIZE = 500
+
+# '[Group] ' prefix added by mappers.map_expense_to_row, and the ' (INR 500.00)'
+# suffix synced descriptions carried before amounts were stored per currency
+_GROUP_PREFIX = re.compile(r"^\[[^\]]*\]\s*")
+_CURRENCY_SUFFIX = re.compile(r"\s*\([A-Z]{3} -?\d+(?:\.\d+)?\)$")
+# Reference numbers and domains in statement descriptors: 'NETFLIX.COM*AB12', 'SQ *COFFEE #123'
+_REFERENCE = re.compile(r"(?<=\S)\*\S*|#\S*|\.(?:com|net|org|io|co)\b")
+_WORD = re.compile(r"[a-z][a-z&']+")
+NOISE_WORDS = frozenset({
+    "pos", "debit", "credit", "card", "purchase", "payment", "pmt", "recurring", "autopay", "ach",
+    "online", "www", "inc", "llc", "ltd", "corp", "co", "the", "sq", "tst", "paypal", "bill",
+})
+
+def clean_description(description: str) -> str:
+    """Description without the group prefix or currency suffix Splitwise rows carry"""
+    return _CURRENCY_SUFFIX.sub("", _GROUP_PREFIX.sub("", description or "")).strip()
+
+@functools.lru_cache(maxsize=8192)
+def merchant_key(description: str) -> str:
+    """First few significant words of a description, lowercased; '' if none"""
+    text = _REFERENCE.sub(" ", clean_description(description).lower())
+    words = [w for w in _WORD.findall(text) if w not in NOISE_WORDS]
+    return " ".join(words[:MERCHANT_KEY_WORDS])
+
+def _cadence(gaps):
+    """(name, days, tolerance) that the gaps between charges settle on, or None"""
+    typical = statistics.median(gaps)
+    for cadence in CADENCES:
+        name, days, tolerance = cadence
+        if abs(typical - days) <= tolerance:
+            regular = sum(abs(gap - days) <= tolerance for gap in gaps)
+            return cadence if regular >= MIN_REGULAR_SHARE * len(gaps) else None
+    return None
+
+def detect(charges):
+    """Cadence and amount of one merchant's charges [(day, amount_cents, id)] in
+    date order, or None if they aren't periodic"""
+    # Several charges on one day are one payment
+    days = []
+    for day, same_day in groupby(charges, key=lambda c: c[0]):
+        same_day = list(same_day)
+        days.append((day, sum(c[1] for c in same_day), same_day[-1][2]))
+    recent = days[-RECENT_CHARGES:]
+    if len(recent) < MIN_YEARLY_CHARGES:
+        return None
+    ordinals = [date.fromisoformat(d[0]).toordinal() for d in recent]
+    gaps = [b - a for a, b in zip(ordinals, ordinals[1:])]
+    cadence = _cadence(gaps)
+    if cadence is None or (len(recent) < MIN_CHARGES and cadence[0] != "yearly"):
+        return None
+    name, _, tolerance = cadence
+    amounts = [d[1] for d in recent]
+    typical = int(statistics.median(amounts))
+    interval = statistics.median(gaps)
+    next_date = date.fromordinal(ordinals[-1]) + timedelta(days=round(interval))
+    return {
+        "cadence": name,
+        "interval_days": interval,
+        "amount_cents": typical,
+        "amount_stable": int(all(abs(a - typical) <= abs(typical) * AMOUNT_TOLERANCE for a in amounts)),
+        "charges": len(days),
+        "first_date": days[0][0],
+        "last_date": recent[-1][0],
+        "next_date": next_date.isoformat(),
+        "due_by": (next_date + timedelta(days=tolerance)).isoformat(),
+        "last_id": recent[-1][2],
+    }
+
+def _key_new_rows(conn):
+    """Set merchant_key on rows that don't have one yet; returns the keys they got"""
+    rows = conn.execute("SELECT id, description FROM expenses WHERE merchant_key IS NULL").fetchall()
+    keyed = [(merchant_key(description), expense_id) for expense_id, description in rows]
+    conn.executemany("UPDATE expenses SET merchant_key = ? WHERE id = ?", keyed)
+    return {key for key, _ in keyed}
+
+def refresh():
+    """Re-detect recurring charges for the merchants whose expenses changed.
+
+    New rows are keyed first; deleted and edited ones were queued by the
+    triggers in db.RECURRING_SCHEMA. The changed merchants' charges are summed
+    per day in (merchant_key, date) order straight off the covering index and
+    checked in one pass; only a recurring merchant's latest charge is looked
+    up for its name and category. Returns (merchants checked, recurring among them).
+    """
+    conn = get_conn()
+    pending = conn.execute(
+        "SELECT EXISTS (SELECT 1 FROM expenses WHERE merchant_key IS NULL) "
+        "OR EXISTS (SELECT 1 FROM recurring_dirty)"
+    ).fetchone()[0]
+    if not pending:
+        return 0, 0
+    checked = found = 0
+    with write_conn() as conn:
+        dirty = _key_new_rows(conn)
+        dirty.update(key for (key,) in conn.execute("SELECT merchant_key FROM recurring_dirty"))
+        conn.execute("DELETE FROM recurring_dirty")
+        dirty.discard("")
+        keys = iter(sorted(dirty))
+        while chunk := list(islice(keys, KEY_CHUNK_SIZE)):
+            placeholders = ",".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM recurring WHERE merchant_key IN ({placeholders})", chunk)
+            rows = conn.execute(
+                f"""
+                SELECT merchant_key, substr(date, 1, 10), SUM(amount_cents), MAX(id)
+                FROM expenses
+                WHERE merchant_key IN ({placeholders}) AND date IS NOT NULL
+                GROUP BY merchant_key, date
+                ORDER BY merchant_key, date
+                """,
+                chunk,
+            )
+            detected = []
+            for key, charges in groupby(rows, key=lambda r: r[0]):
+                found_row = detect(c[1:] for c in charges)
+                if found_row:
+                    detected.append({"merchant_key": key, **found_row})
+            for row in detected:
+                description, row["category"] = conn.execute(
+                    "SELECT description, category FROM expenses WHERE id = ?", (row.pop("last_id"),)
+                ).fetchone()
+                row["name"] = clean_description(description)
+            conn.executemany(
+                """
+                INSERT INTO recurring (merchant_key, name, category, cadence, interval_days, amount_cents,
+                                       amount_stable, charges, first_date, last_date, next_date, due_by)
+                VALUES (:merchant_key, :name, :category, :cadence, :interval_days, :amount_cents,
+                        :amount_stable, :charges, :first_date, :last_date, :next_date, :due_by)
+                """,
+                detected,
+            )
+            checked += len(chunk)
+            found += len(detected)
+    return checked, found
+
+def get_recurring(include_lapsed: bool = False, today: date = None):
+    """Recurring charges, largest monthly cost first.
+
+    Lapsed ones (no charge by their due_by date) are left out unless
+    include_lapsed. monthly_cost spreads each charge over a 30.44-day month.
+    """
+    today = (today or date.today()).isoformat()
+    sql = "SELECT * FROM recurring" + ("" if include_lapsed else " WHERE due_by >= ?")
+    rows = get_conn().execute(sql, () if include_lapsed else (today,))
+    columns = [c[0] for c in rows.description]
+    items = []
+    for row in rows:
+        item = dict(zip(columns, row))
+        cents = item.pop("amount_cents")
+        item["amount"] = to_dollars(cents)
+        item["amount_stable"] = bool(item["amount_stable"])
+        item["monthly_cost"] = round(to_dollars(cents) * 30.44 / item["interval_days"], 2)
+        item["active"] = item["due_by"] >= today
+        items.append(item)
+    return sorted(items, key=lambda item: -item["monthly_cost"])
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    checked, found = refresh()
+    print(f"🔁 Checked {checked} merchants, {found} recurring")
+    for item in get_recurring():
+        print(f"  {item['name']}: ${item['amount']:.2f} {item['cadence']}, next {item['next_date']}")
@@ -0,0 +1,140 @@
+import re
+import threading
+from collections import Counter
+
+# Deterministic fast path for the most common chat questions. A message is
+# answered without the LLM only when the whole of it matches one of the
+# templates below; anything else (extra filters, other intents, unknown
+# periods) falls through to the agent.
+
+MONTHS = {
+    'january': 1, 'jan': 1, 'february': 2, 'feb': 2, 'march': 3, 'mar': 3,
+    'april': 4, 'apr': 4, 'may': 5, 'june': 6, 'jun': 6, 'july': 7, 'jul': 7,
+    'august': 8, 'aug': 8, 'september': 9, 'sep': 9, 'sept': 9,
+    'october': 10, 'oct': 10, 'november': 11, 'nov': 11, 'december': 12, 'dec': 12,
+}
+
+_LEAD = (
+    r"(?:(?:can|could|would) you )?"
+    r"(?:(?:show|give|get|tell|display)(?: me)? |what(?:'s| is| are| was| were) |i want |let me see )?"
+    r"(?:my |the |a )?"
+)
+_PERIOD = (
+    r"(?: (?:for|in|during|over|from|of))?"
+    r"(?: (?P<period>this month|last month|this week|this year|(?:last|past) (?:7 days|week|month|12 months|year)|week|month|year"
+    r"|all time|(?P<month>" + "|".join(MONTHS) + r")(?: (?P<year>\d{4}))?))?"
+)
+
+# Period phrase -> tool argument; a phrase missing from a tool's map falls back to the agent.
+# The tools' 'year' is the last 12 months, so calendar years ('this year', 'last year') go to the agent.
+_CATEGORY_PERIODS = {
+    None: "month", "month": "month", "this month": "month", "last month": "last_month",
+    "week": "week", "this week": "week", "last week": "week", "past week": "week", "last 7 days": "week", "past 7 days": "week",
+    "year": "year", "past year": "year",
+    "last 12 months": "year", "past 12 months": "year", "all time": "all",
+}
+# No period for trends: the agent asks which one the user wants
+_TREND_PERIODS = {
+    "month": "month", "this month": "month", "last month": "month", "past month": "month",
+    "week": "week", "this week": "week", "last week": "week", "past week": "week", "last 7 days": "week", "past 7 days": "week",
+    "year": "year", "past year": "year", "last 12 months": "year", "past 12 months": "year",
+}
+
+_TEMPLATES = [
+    ("get_spending_insights", re.compile(
+        _LEAD + r"(?:spending |monthly )?(?:insights?|summary|overview)"
+        r"|how much (?:did|have) i (?:spend|spent)(?: so far)? this month"
+        r"|(?:compare )?this month (?:vs|versus|to|with|compared to) last month"
+    )),
+    ("get_category_breakdown", re.compile(
+        r"(?:" + _LEAD + r"(?:spending |expenses? )?(?:category breakdown|breakdown by category|by category"
+        r"|categories|category split|category spending|spending categories)"
+        r"|how much (?:did|have) i (?:spend|spent) (?:by|per|in each) category)" + _PERIOD
+    )),
+    ("get_spending_trends", re.compile(
+        r"(?:" + _LEAD + r"(?:spending |expense )?trends?|" + _LEAD + r"spending over time"
+        r"|how (?:has|did|is) my spending (?:changed?|trended|trending))" + _PERIOD
+    )),
+]
+
+def normalize(text: str) -> str:
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[?!.,;:]", " ", text)
+    text = " ".join(text.split())
+    text = re.sub(r"^(?:please |hey |hi )+|(?: please)+$", "", text)
+    text = re.sub(r"\bthe ", "", text)
+    return text.replace("spendings", "spending")
+
+def _tool_args(tool_name: str, m):
+    """Map a template match to tool arguments, or None if the period isn't supported."""
+    if tool_name == "get_spending_insights":
+        return {}
+    period = m.group("period")
+    if m.group("month"):
+        if tool_name != "get_category_breakdown":
+            return None
+        args = {"period": "specific_month", "specific_month": m.group("month")}
+        if m.group("year"):
+            args["year"] = int(m.group("year"))
+        return args
+    periods = _CATEGORY_PERIODS if tool_name == "get_category_breakdown" else _TREND_PERIODS
+    if period not in periods:
+        return None
+    return {"period": periods[period]}
+
+def match(text: str):
+    """Return (tool_name, args) if `text` is unambiguously a common question, else None."""
+    text = normalize(text)
+    matches = []
+    for tool_name, template in _TEMPLATES:
+        m = template.fullmatch(text)
+        if m:
+            args = _tool_args(tool_name, m)
+            if args is not None:
+                matches.append((tool_name, args))
+    return matches[0] if len(matches) == 1 else None
+
+class RouterStats:
+    """Fast-path hit rate, plus agent turn timings to estimate the LLM time it saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.by_tool = Counter()
+        self.fast_seconds = 0.0
+        self.agent_turns = 0
+        self.agent_seconds = 0.0
+
+    def hit(self, tool_name: str, elapsed: float):
+        with self._lock:
+            self.hits += 1
+            self.by_tool[tool_name] += 1
+            self.fast_seconds += elapsed
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def agent_turn(self, elapsed: float):
+        with self._lock:
+            self.agent_turns += 1
+            self.agent_seconds += elapsed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_agent = self.agent_seconds / self.agent_turns if self.agent_turns else 0.0
+            avg_fast = self.fast_seconds / self.hits if self.hits else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "by_tool": dict(self.by_tool),
+                "avg_fast_path_ms": avg_fast * 1000,
+                "avg_agent_turn_s": avg_agent,
+                # Unknown until at least one agent turn has been timed
+                "est_llm_seconds_saved": max(0.0, avg_agent - avg_fast) * self.hits,
+            }
+
+router_stats = RouterStats()
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+MAX_ACTIVE_SESSIONS = int(os.getenv("MAX_ACTIVE_SESSIONS", "200"))
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+class _Session:
+    __slots__ = ("lock", "last_used", "active")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.active = 0
+
+class SessionStore:
+    """In-memory registry of active chat sessions, least recently used first.
+
+    Each session gets a lock so its turns run one at a time while different
+    sessions run concurrently. Conversation history itself lives in the agent's
+    SQLite checkpointer, so an evicted session is only dropped from memory and
+    picks up where it left off if its client comes back.
+    """
+
+    def __init__(self, max_sessions: int = MAX_ACTIVE_SESSIONS, idle_seconds: float = SESSION_IDLE_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @contextmanager
+    def turn(self, session_id: str):
+        """Hold `session_id` for one agent turn, registering it if needed."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or _Session()
+            session.active += 1
+            session.last_used = time.monotonic()
+            self._sessions[session_id] = session
+            self._evict()
+        try:
+            with session.lock:
+                yield
+        finally:
+            with self._lock:
+                session.active -= 1
+                session.last_used = time.monotonic()
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict(self):
+        """Drop idle sessions, and the least recently used ones beyond max_sessions."""
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            over_limit = len(self._sessions) > self.max_sessions
+            if not over_limit and now - session.last_used <= self.idle_seconds:
+                break
+            if session.active:
+                continue
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_seconds": self.idle_seconds,
+                "evictions": self.evictions,
+            }
+
+sessions = SessionStore()
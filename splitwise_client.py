@@ -1,21 +1,157 @@
 import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BASE_URL = "https://secure.splitwise.com/api/v3.0"
 TOKEN = os.getenv("SPLITWISE_ACCESS_TOKEN")
-HEADERS = {"Authorization": f"Bearer {TOKEN}"}
 
-def get_expenses(limit=5):
-    """Fetch recent Splitwise expenses"""
-    r = requests.get(f"{BASE_URL}/get_expenses?limit={limit}", headers=HEADERS)
-    r.raise_for_status()
-    return r.json()
+PAGE_SIZE = 100
+
+# HTTP tuning (see .env.example)
+TIMEOUT = float(os.getenv("SPLITWISE_TIMEOUT", "10"))  # seconds, connect and read
+MAX_RETRIES = int(os.getenv("SPLITWISE_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+BACKOFF_MAX = 60.0
+RATE_LIMIT = float(os.getenv("SPLITWISE_RATE_LIMIT", "5"))  # requests per second
+RATE_BURST = 10
+POOL_SIZE = 10  # keep-alive connections, enough for the concurrent group fetches
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Client-side rate limiter: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class SplitwiseClient:
+    """Shared Splitwise API client.
+
+    Keeps connections alive through one requests.Session, applies timeouts,
+    retries 429/5xx responses and connection errors with exponential backoff
+    (honouring Retry-After), rate-limits requests client-side and records
+    per-endpoint latency stats.
+    """
+
+    def __init__(self, token: str = TOKEN, timeout: float = TIMEOUT, max_retries: int = MAX_RETRIES,
+                 rate: float = RATE_LIMIT, burst: int = RATE_BURST):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get(self, path: str, params: dict = None):
+        """GET BASE_URL/path and return the decoded JSON body."""
+        endpoint = path.split("/")[0]
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                r = self.session.get(f"{BASE_URL}/{path}", params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(endpoint, start, error=True)
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                self._record(endpoint, start, error=r.status_code >= 400)
+                if r.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    r.raise_for_status()
+                    return r.json()
+                delay = self._retry_after(r)
+                if delay is None:
+                    delay = self._backoff(attempt)
+            self._record_retry(endpoint)
+            time.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)  # jitter so concurrent callers don't retry in lockstep
+
+    def _retry_after(self, r):
+        value = r.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(BACKOFF_MAX, max(0.0, delay))
+
+    def _record(self, endpoint: str, start: float, error: bool):
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            s = self._stats.setdefault(endpoint, {"calls": 0, "errors": 0, "retries": 0, "total_s": 0.0, "max_s": 0.0})
+            s["calls"] += 1
+            s["errors"] += error
+            s["total_s"] += elapsed
+            s["max_s"] = max(s["max_s"], elapsed)
+
+    def _record_retry(self, endpoint: str):
+        with self._stats_lock:
+            self._stats[endpoint]["retries"] += 1
+
+    def latency_stats(self):
+        """Return {endpoint: {calls, errors, retries, total_s, max_s, avg_s}}."""
+        with self._stats_lock:
+            return {
+                endpoint: {**s, "avg_s": s["total_s"] / s["calls"] if s["calls"] else 0.0}
+                for endpoint, s in self._stats.items()
+            }
+
+client = SplitwiseClient()
+
+def get_expenses(limit=5, offset=0, updated_after=None):
+    """Fetch one page of Splitwise expenses (optionally only those updated after a timestamp)"""
+    params = {"limit": limit, "offset": offset}
+    if updated_after:
+        params["updated_after"] = updated_after
+    return client.get("get_expenses", params=params)
+
+def iter_expenses(updated_after=None, page_size=PAGE_SIZE):
+    """Yield every expense updated after `updated_after`, paging with offsets"""
+    offset = 0
+    while True:
+        page = get_expenses(limit=page_size, offset=offset, updated_after=updated_after).get("expenses", [])
+        yield from page
+        if len(page) < page_size:
+            break
+        offset += page_size
+
+def get_groups():
+    """Fetch every group the current user belongs to"""
+    return client.get("get_groups")
 
 def get_group(group_id):
     """Fetch group details by ID"""
-    r = requests.get(f"{BASE_URL}/get_group/{group_id}", headers=HEADERS)
-    r.raise_for_status()
-    return r.json()
\ No newline at end of file
+    return client.get(f"get_group/{group_id}")
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import db
+from router import normalize
+
+# Next to the expense database unless configured
+SQL_CACHE_DB_PATH = os.getenv("SQL_CACHE_DB_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(db.DB_PATH)), "sql_cache.db"
+)
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "500"))
+
+# SQL with a date literal was written against "today" (e.g. this month's range)
+DATE_LITERAL = re.compile(r"\d{4}-\d{2}")
+# Questions that lean on earlier turns can't be answered from the question alone
+CONTEXT_WORDS = re.compile(
+    r"\b(?:it|its|that|those|these|them|they|same|again|instead|also|too|else|other|more|"
+    r"what about|how about|and what)\b"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sql_cache (
+    question TEXT PRIMARY KEY,
+    sql TEXT NOT NULL,
+    schema_hash TEXT NOT NULL,
+    valid_on TEXT,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+def is_self_contained(question: str) -> bool:
+    return not CONTEXT_WORDS.search(normalize(question))
+
+def schema_hash() -> str:
+    """Fingerprint of the expense database's table definitions."""
+    rows = db.fetch_rows(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND sql IS NOT NULL ORDER BY name"
+    )
+    return hashlib.blake2b("\n".join(r["sql"] for r in rows).encode(), digest_size=8).hexdigest()
+
+class SqlCache:
+    """Persistent, size-bounded map from normalized questions to SQL that ran successfully.
+
+    Lives in its own database file so cache bookkeeping doesn't count as an
+    expense write (which would invalidate the dashboard result cache). Entries
+    only match the schema they were written for, and SQL containing date
+    literals only the day it was written. Least recently used entries beyond
+    `maxsize` are dropped. The file is opened on first use, not on import.
+    """
+
+    def __init__(self, path: str = SQL_CACHE_DB_PATH, maxsize: int = SQL_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._db = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _conn(self):
+        # Only used with self._lock held
+        if self._db is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            self._db = conn
+        return self._db
+
+    def get(self, question: str):
+        """Return the cached SQL for `question`, or None."""
+        key = normalize(question)
+        current_schema = schema_hash()
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT sql FROM sql_cache
+                WHERE question = ? AND schema_hash = ? AND (valid_on IS NULL OR valid_on = ?)
+                """,
+                (key, current_schema, date.today().isoformat()),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE sql_cache SET hits = hits + 1, last_used = ? WHERE question = ?",
+                (time.time(), key),
+            )
+            return row[0]
+
+    def put(self, question: str, sql: str):
+        key = normalize(question)
+        current_schema = schema_hash()
+        today = date.today().isoformat()
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            # Drop entries a schema change or a new day has made unusable
+            self._conn.execute(
+                "DELETE FROM sql_cache WHERE schema_hash != ? OR valid_on != ?",
+                (current_schema, today),
+            )
+            self._conn.execute(
+                """
+                INSERT INTO sql_cache (question, sql, schema_hash, valid_on, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(question) DO UPDATE SET
+                    sql = excluded.sql, schema_hash = excluded.schema_hash, valid_on = excluded.valid_on,
+                    hits = 0, created_at = excluded.created_at, last_used = excluded.last_used
+                """,
+                (key, sql, current_schema, today if DATE_LITERAL.search(sql) else None, now, now),
+            )
+            self._conn.execute(
+                """
+                DELETE FROM sql_cache WHERE question IN (
+                    SELECT question FROM sql_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.maxsize,),
+            )
+
+    def discard(self, question: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_cache WHERE question = ?", (normalize(question),))
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+sql_cache = SqlCache()
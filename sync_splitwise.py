@@ -1,72 +1,190 @@
 import os
-from datetime import datetime, timedelta
-from db import init_db, add_splitwise_expense, list_expenses
-from splitwise_client import get_expenses, get_group
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from db import (
+    init_db, upsert_splitwise_expenses, delete_splitwise_expenses, list_expenses,
+    get_sync_state, set_sync_state, get_group_names, save_group_names,
+)
+from splitwise_client import iter_expenses, get_groups, get_group, client, PAGE_SIZE
 from mappers import map_expense_to_row
+from fx import convert_rows, refresh_from_feed
+from categorizer import categorizer
+from recurring import refresh as refresh_recurring
 from dotenv import load_dotenv
 
 load_dotenv()
 MY_USER_ID = int(os.getenv("MY_USER_ID"))  # put your ID in .env
 
-# Cache for group names to avoid repeated API calls
-group_cache = {}
-
-# Only sync expenses from last 3 months
-THREE_MONTHS_AGO = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
-
-def sync_expenses(limit=5):
-    data = get_expenses(limit=limit)
-    expenses = data.get("expenses", [])
-    synced_count = 0
-    
-    for e in expenses:
-        # Check if user is in this expense and get their owed share
-        user_in_expense = False
-        user_owed_share = 0.0
-        
-        for u in e.get("users", []):
-            if u.get("user_id") == MY_USER_ID:
-                user_in_expense = True
-                user_owed_share = float(u.get("owed_share", 0.0))
-                break
-        
-        # Skip if user is not part of this expense
-        if not user_in_expense:
-            continue
-        
-        # Skip if user's share is $0 (they don't owe anything)
-        if user_owed_share == 0.0:
-            continue
-        
-        # Get group name if not cached
-        group_id = e.get("group_id")
-        group_name = None
-        
-        if group_id:
-            if group_id not in group_cache:
-                try:
-                    group_data = get_group(group_id)
-                    group_cache[group_id] = group_data.get("group", {}).get("name", "Unknown")
-                except:
-                    group_cache[group_id] = "Unknown"
-            group_name = group_cache[group_id]
-        
-        sw_id, desc, amount, category, date = map_expense_to_row(e, MY_USER_ID, group_name)
-        
-        # Skip expenses older than 3 months
-        if date and date < THREE_MONTHS_AGO:
-            continue
-        
-        add_splitwise_expense(sw_id, desc, amount, category, date)
-        synced_count += 1
-    
-    print(f"✅ Synced {synced_count} expenses into DB.")
-    return synced_count  # Return count for the agent tool
+# Group names are stored in the `groups` table and re-fetched after this long
+GROUP_TTL_SECONDS = 7 * 24 * 3600
+# Max concurrent get_group requests for groups get_groups didn't return
+GROUP_FETCH_WORKERS = 8
+
+# sync_state key holding the latest Splitwise `updated_at` we have processed
+SYNC_CURSOR = "splitwise_updated_after"
+
+def my_owed_share(e):
+    """Return the user's owed share of an expense, or None if they aren't part of it."""
+    for u in e.get("users", []):
+        if u.get("user_id") == MY_USER_ID:
+            return float(u.get("owed_share", 0.0))
+    return None
+
+def _fetch_group_name(group_id):
+    return get_group(group_id).get("group", {}).get("name", "Unknown")
+
+def resolve_group_names(group_ids, known: dict):
+    """Fill `known` with {group_id: name} for every id in group_ids.
+
+    Uses stored names first, then one get_groups call for everything the user
+    belongs to, then concurrent get_group calls for whatever is still missing
+    (e.g. groups the user has left). Fetched names are persisted.
+    """
+    missing = set(group_ids) - known.keys()
+    if not missing:
+        return known
+    known.update(get_group_names(missing, max_age=GROUP_TTL_SECONDS))
+    missing -= known.keys()
+    if not missing:
+        return known
+
+    fetched = {}
+    try:
+        for g in get_groups().get("groups", []):
+            if g.get("id"):
+                fetched[g["id"]] = g.get("name", "Unknown")
+    except Exception as e:
+        print(f"⚠️ Could not list Splitwise groups: {e}")
+
+    remaining = list(missing - fetched.keys())
+    if remaining:
+        with ThreadPoolExecutor(max_workers=min(GROUP_FETCH_WORKERS, len(remaining))) as pool:
+            futures = {group_id: pool.submit(_fetch_group_name, group_id) for group_id in remaining}
+        for group_id, future in futures.items():
+            try:
+                fetched[group_id] = future.result()
+            except Exception as e:
+                # Shown as "Unknown" for this sync but not persisted, so it's retried next time
+                print(f"⚠️ Could not fetch Splitwise group {group_id}: {e}")
+                known[group_id] = "Unknown"
+
+    save_group_names(fetched)
+    known.update(fetched)
+    return known
+
+def sync_expenses(full: bool = False, page_size: int = PAGE_SIZE):
+    """Sync Splitwise expenses changed since the last run.
+
+    Pages through get_expenses with `updated_after` set to the high-water mark
+    stored in sync_state, so a routine sync costs a request or two regardless
+    of account history. Changed expenses are bulk-upserted and deleted ones (or
+    ones the user no longer owes on) are removed. `full=True` ignores the
+    cursor and re-reads the whole history.
+
+    Foreign-currency expenses are converted a page at a time against the FX
+    rate table, falling back to fx.FALLBACK_USD_PER_UNIT (and flagging the
+    row) for a currency the feed lacks. Ones in a currency with neither are
+    skipped, and the cursor only advances up to the first of them so they are
+    read again on the next sync.
+
+    Returns {"synced", "inserted", "updated", "unchanged", "removed",
+    "estimated", "skipped"} counts.
+    """
+    refresh_from_feed()
+    updated_after = None if full else get_sync_state(SYNC_CURSOR)
+    high_water = updated_after
+    removed_ids = []
+    seen_updates = []
+    skipped = {}  # currency -> expenses skipped
+    first_skipped = None  # earliest updated_at among skipped expenses
+    estimated = 0
+
+    def changed_rows():
+        nonlocal high_water, first_skipped, estimated
+        group_names = {}
+        expenses = iter_expenses(updated_after=updated_after, page_size=page_size)
+        # Work a page at a time so each page's group names are resolved in one go
+        while batch := list(islice(expenses, page_size)):
+            resolve_group_names({e.get("group_id") for e in batch if e.get("group_id")}, group_names)
+
+            rows = []
+            updated = {}
+            for e in batch:
+                updated_at = e.get("updated_at")
+                if updated_at:
+                    updated[e.get("id")] = updated_at
+                    seen_updates.append(updated_at)
+                    if high_water is None or updated_at > high_water:
+                        high_water = updated_at
+
+                # Deleted on Splitwise
+                if e.get("deleted_at"):
+                    removed_ids.append(e.get("id"))
+                    continue
+
+                # Skip if user is not part of this expense or their share is $0
+                # (and drop any copy synced before the expense changed)
+                user_owed_share = my_owed_share(e)
+                if not user_owed_share:
+                    removed_ids.append(e.get("id"))
+                    continue
+
+                group_name = group_names.get(e.get("group_id"))
+                rows.append(map_expense_to_row(e, MY_USER_ID, group_name))
+
+            converted, missing = convert_rows(categorizer.fill(rows, description_at=1, category_at=3))
+            for row in missing:
+                skipped[row[5]] = skipped.get(row[5], 0) + 1
+                updated_at = updated.get(row[0])
+                if updated_at and (first_skipped is None or updated_at < first_skipped):
+                    first_skipped = updated_at
+            estimated += sum(row[7] for row in converted)
+            yield from converted
+
+    counts = upsert_splitwise_expenses(changed_rows())
+    removed_count = delete_splitwise_expenses(removed_ids)
+    refresh_recurring()
+
+    # Only advance the cursor once every page has been processed, and not past
+    # an expense that couldn't be converted
+    cursor = high_water
+    if first_skipped is not None:
+        cursor = max((u for u in seen_updates if u < first_skipped), default=None)
+        if updated_after and (cursor is None or cursor < updated_after):
+            cursor = updated_after
+    if cursor and cursor != updated_after:
+        set_sync_state(SYNC_CURSOR, cursor)
+
+    if skipped:
+        print(f"⚠️ Skipped {sum(skipped.values())} expenses with no FX rate "
+              f"({', '.join(f'{c}: {n}' for c, n in sorted(skipped.items()))}). "
+              f"Add the currencies to the rate feed and sync again.")
+    if estimated:
+        print(f"⚠️ {estimated} expenses were converted at fallback FX rates; "
+              f"they are re-converted when the rate feed covers their currency.")
+
+    synced_count = counts["inserted"] + counts["updated"]
+    print(
+        f"✅ Synced {synced_count} expenses into DB "
+        f"({counts['inserted']} new, {counts['updated']} updated, {counts['skipped']} unchanged, {removed_count} removed)."
+    )
+    return {
+        "synced": synced_count,
+        "inserted": counts["inserted"],
+        "updated": counts["updated"],
+        "unchanged": counts["skipped"],
+        "removed": removed_count,
+        "estimated": estimated,
+        "skipped": sum(skipped.values()),
+    }
 
 if __name__ == "__main__":
+    import sys
     init_db()
-    sync_expenses(limit=5)
+    sync_expenses(full="--full" in sys.argv)
+    for endpoint, s in client.latency_stats().items():
+        print(f"⏱️ {endpoint}: {s['calls']} calls, avg {s['avg_s'] * 1000:.0f}ms, max {s['max_s'] * 1000:.0f}ms, {s['retries']} retries")
     print("🔎 Checking DB contents:")
     rows = list_expenses(5)
     for row in rows:
-        print(row)
\ No newline at end of file
+        print(row)